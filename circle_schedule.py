@@ -0,0 +1,84 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	circle_schedule.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Precomputes the velocity schedule that write_part_circle (in
+execute_commands.py) follows: the time of every tick, and the move_vel
+frames for the x- and y- stages at each, already packed the way they go
+on the wire. All of it is worked out at once with NumPy before the
+circle starts, so that a BinaryDispatcher (zaber/serial/
+binarydispatcher.py) only has to send each tick's frames on time.
+
+The velocities are the same as the ones the tick loop used to compute:
+at tick t (ms), the stages move along the chord of the circle between
+the angles at t - DELTA_T and t, at the write speed.
+"""
+
+
+from collections import namedtuple
+
+import numpy as np
+
+# device number, command number, data: one Binary frame
+FRAME_DTYPE = np.dtype([("device", "u1"), ("command", "u1"), ("data", "<i4")])
+
+MOVE_VEL = 22
+
+# times: seconds after the first tick at which to send each tick
+# x_data, y_data: move_vel data for each tick
+# frames: the frames, packed (2 per tick: x, then y)
+# end: seconds after the first tick at which the last velocity stops
+#   applying, i.e., when to stop the stages
+CircleSchedule = namedtuple("CircleSchedule", "times x_data y_data frames end")
+
+
+# CIRCLE SCHEDULE
+# Computes the ticks for writing an arc from start_deg to end_deg of a
+#   circle with the given radius (mm) at speed (mm/s), with a tick every
+#   delta_t (ms). Velocities are converted to data with data_per_speed
+#   (data per mm/s) and multiplied by invert_factor (cf.
+#   write_part_circle). x_device and y_device are the stages' device
+#   numbers; frames to those in message_id_devices are sent with
+#   message ID 0, whose replies nobody waits for.
+def circle_schedule(radius, start_deg, end_deg, speed, delta_t, data_per_speed,
+                    invert_factor, x_device, y_device, message_id_devices = ()):
+
+    # f = circle frequency (rad/ms); T = period (ms)
+    f = speed / (1000 * radius)
+    T = 1000 * 2*np.pi * radius / speed
+
+    first = int(start_deg * T / 360)
+    ticks = np.arange(first + delta_t, int(end_deg * T / 360), delta_t)
+
+    # chord between the angles at t - delta_t and t
+    dx = (np.cos(f * ticks) - np.cos(f * (ticks - delta_t))) * radius
+    dy = (np.sin(f * ticks) - np.sin(f * (ticks - delta_t))) * radius
+    length = np.hypot(dx, dy)
+    length[length == 0] = np.inf
+
+    # (int)(...) in linspeed2lindata truncates toward zero
+    x_data = invert_factor * np.trunc(dx / length * speed * data_per_speed).astype(np.int64)
+    y_data = invert_factor * np.trunc(dy / length * speed * data_per_speed).astype(np.int64)
+
+    frames = pack_frames(x_data, y_data, x_device, y_device, message_id_devices)
+
+    # each tick is sent delta_t before the time it's computed for
+    times = (ticks - delta_t - first) / 1000
+    end = (ticks[-1] - first) / 1000 if len(ticks) else 0.0
+
+    return CircleSchedule(times, x_data, y_data, frames, end)
+
+
+# PACK FRAMES
+# Returns the move_vel frames for x_data and y_data (one of each per
+#   tick, x first), packed (cf. circle_schedule for the arguments)
+def pack_frames(x_data, y_data, x_device, y_device, message_id_devices = ()):
+    frames = np.empty((len(x_data), 2), dtype = FRAME_DTYPE)
+    frames["command"] = MOVE_VEL
+    for column, device, data in ((0, x_device, x_data), (1, y_device, y_data)):
+        frames["device"][:, column] = device
+        # with message IDs, the ID (0) replaces the top byte of the data
+        frames["data"][:, column] = data & 0x00FFFFFF if device in message_id_devices else data
+    return frames.tobytes()
@@ -37,26 +37,79 @@ LINKS:
 #   the plane DUMMY_CONNECTIONS effectively overrides CONNECT_ROTARY and
 #   CONNECT_KEITHLEY e.g., D_C == True, these devices won't connect even
 #   if C_R or C_K == True.
+# SIMULATE_STAGES replaces the Zaber stages with a simulated chain of
+#   devices (cf. zaber/serial/binarysimulator.py), so that the move code
+#   below runs unmodified without the stages attached; set
+#   DUMMY_CONNECTIONS = False (and probably CONNECT_KEITHLEY = False) to
+#   use it. SIMULATION_SPEEDUP > 1 runs the stages faster than real time;
+#   arcs and contoured chains (cf. CONTOUR_POLYLINES) still take as long
+#   as on the stages, since this computer times the commands for them.
+# RECORD_SESSION saves every frame sent to and received from the stages,
+#   with timestamps, to SAMPLES_PATH + SAMPLE_NAME + "_session.zbrl".
+#   Setting REPLAY_SESSION to the path of such a file plays it back in
+#   place of the stages (cf. zaber/serial/binaryreplay.py), e.g., to
+#   re-run a session offline; REPLAY_SPEEDUP = None plays the replies
+#   back without waiting, otherwise this many times faster than they
+#   were recorded. As for SIMULATE_STAGES, set DUMMY_CONNECTIONS = False.
+# MESSAGE_IDS turns on Zaber message IDs for the stages, so that replies
+#   are matched to the command that caused them and queries/settings
+#   can be sent to a stage without waiting for its previous reply.
+# STREAM_STAGES drives the x- and y- stages through an ASCII (A-series)
+#   controller at STREAM_PORT (cf. define_operating_constants), which
+#   interpolates lines and arcs itself (cf. stream_handler.py), instead
+#   of through Binary commands; the rotary stage is still driven through
+#   STAGES_PORT. With SIMULATE_STAGES, the controller is simulated too
+#   (cf. zaber/serial/asciisimulator.py).
 # MAC_TESTING determines what modules are imported (OS limitations)
 
 DUMMY_CONNECTIONS = True
 CONNECT_ROTARY = True
 CONNECT_KEITHLEY = True
+SIMULATE_STAGES = False
+SIMULATION_SPEEDUP = 1
+RECORD_SESSION = False
+REPLAY_SESSION = None
+REPLAY_SPEEDUP = None
+MESSAGE_IDS = False
+STREAM_STAGES = False
 MAC_TESTING = True
 
 
-import sys, time, math, re
+import os, sys, time, math, re
+import numpy as np
 from mapping_handler import MappingHandler
 from coordinates import V2
-
-# these modules are not available on mac
-if not MAC_TESTING:
-    import winsound
-    import keyboard
-
-if not DUMMY_CONNECTIONS:
-    import keithley_handler as kc
-    from zaber.serial import BinarySerial, BinaryDevice, BinaryCommand #, CommandType
+from trajectory import TrajectoryBuilder, MOVE, ARC, Z
+from overscan import add_overscan, turns as overscan_turns
+from motion_time import MotionTimeModel
+from progress import ProgressReporter
+from journal import Journal
+from height_overlap import height_starts
+
+
+# IMPORT DEPENDENCIES
+# Imports the modules that the parameters above call for (and only
+#   those, so that, e.g., reading positions doesn't wait on modules only
+#   needed to write); called by main, once the parameters are settled
+#   (e.g., from the command line; cf. COMMAND LINE below).
+def import_dependencies():
+    global winsound, keyboard, kc, ShutterController, BinarySerial, BinaryDevice, BinaryCommand, BinaryDispatcher, \
+           CoordinatedMove, circle_schedule, polyline_schedule, StreamHandler
+
+    # these modules are not available on mac
+    if not MAC_TESTING:
+        import winsound
+        import keyboard
+
+    if not DUMMY_CONNECTIONS:
+        if CONNECT_KEITHLEY:
+            import keithley_handler as kc
+            from shutter_controller import ShutterController
+        from zaber.serial import BinarySerial, BinaryDevice, BinaryCommand, BinaryDispatcher, CoordinatedMove #, CommandType
+        from circle_schedule import circle_schedule
+        from polyline_schedule import polyline_schedule
+        if STREAM_STAGES:
+            from stream_handler import StreamHandler
 
 
 # POSITION_GETTER_MODE
@@ -94,10 +147,134 @@ SAMPLE_NAME = "_waveguide"
 #SAMPLE_NAME = "HW_1_19_2"
 
 
-def main():
+# BUS_METRICS
+# Prints a summary of the traffic to and from the stages (commands and
+#   replies, reply times, timeouts, busy errors, etc.; cf.
+#   zaber/serial/binarymetrics.py) when the run is cleaned up, and saves
+#   the full counts beside the sample's .txt data file (at SAMPLES_PATH
+#   + SAMPLE_NAME + "_bus_metrics.json").
+
+BUS_METRICS = True
+
+
+# MOTION_CALIBRATION
+# The path of a session recorded with RECORD_SESSION (e.g., SAMPLES_PATH
+#   + "HW_1_19_1_session.zbrl") to fit the time estimates to: the
+#   stages' accelerations and the time the bus takes (cf.
+#   motion_time.py). None to estimate from the constants in
+#   define_operating_constants as they are.
+
+MOTION_CALIBRATION = None
+
+
+# PROGRESS
+# Reports how far through the new commands of a sample's data file the
+#   stages are, as they write them (cf. progress.py): the command being
+#   written (its "# [n]" in the file), the share of the planned time
+#   done, the time taken so far and the time left, at most every
+#   PROGRESS_INTERVAL seconds. Printed, and saved beside the data file
+#   (at SAMPLES_PATH + sample name + "_status.json") for other programs
+#   to read; its "state" is "finished" or "stopped" once it's done.
+
+PROGRESS = True
+PROGRESS_INTERVAL = 5
+
+
+# JOURNAL, RESUME
+# JOURNAL keeps track of which segments of a sample's new commands have
+#   been written, in a file beside its data file (at SAMPLES_PATH +
+#   sample name + "_journal.txt"; cf. journal.py), so that if the run is
+#   interrupted (e.g., Ctrl-C, a serial timeout, an error from a stage),
+#   RESUME (or --resume) can carry on where it stopped: the segments
+#   already written are skipped, the shutter closed, the objective put
+#   back at the height and the stages where the next segment starts,
+#   and the writing carried on from there (the segment that was being
+#   written is written again from its start). The sample file mustn't
+#   be changed in between: the run isn't resumed if its new commands
+#   compile differently than they did (e.g., with OVERSCAN changed).
+
+JOURNAL = True
+RESUME = False
+
+
+# OPTIMIZE_TRAVEL
+# Reorders the new commands' writes (and writes lines backward where
+#   that's closer) to cut the time spent moving between them with the
+#   shutter closed (cf. travel_optimizer.py); the mapping shows the
+#   time before and after. Only applies with CONNECT_KEITHLEY, since
+#   otherwise the moves are written too, or on simulated stages, which
+#   have no laser (cf. moves_are_dark). Put "## ORDER" on a line of
+#   the sample file to keep the commands above it before those below.
+
+OPTIMIZE_TRAVEL = False
+
+
+# BATCH_HEIGHTS
+# Puts the new commands in order of height (going up or down), so that
+#   the objective goes to each height once, rather than back and forth
+#   (the rotary stage is slow), and leaves out changes of height to
+#   where it already is (cf. height_batching.py); the mapping shows the
+#   time spent changing height before and after. Commands that don't
+#   set a height go with the command before them, move_to's with the
+#   command after them, and "## ORDER" holds commands as for OPTIMIZE_
+#   TRAVEL. Only applies with CONNECT_KEITHLEY, as for OPTIMIZE_TRAVEL.
+
+BATCH_HEIGHTS = False
+
+
+# OVERLAP_HEIGHTS
+# Changes height while the stages move to where the next write starts,
+#   where that's safe, rather than once they get there (cf. height_
+#   overlap.py): going up, from the start of the moves; going down, only
+#   once every move left is inside the sample region (by OVERLAP_MARGIN,
+#   mm), so that the objective is still never lowered outside it (cf.
+#   EXTREMELY IMPORTANT NOTE #1 in README.md). Otherwise, and for
+#   manual commands, heights are changed after the moves, as before.
+
+OVERLAP_HEIGHTS = False
+OVERLAP_MARGIN = 0.5
+
+
+# CONTOUR_POLYLINES
+# Writes chains of lines (e.g., write_polyline, the continuous parallel
+#   lines, outline_region) and of moves (e.g., several move_to's in a
+#   row in a sample file) without stopping at each corner (cf.
+#   trace_polyline); False to stop at each, as move_to does. These are
+#   driven in velocity mode on a schedule timed by this computer, rather
+#   than moved to each corner, so try them out on simulated stages
+#   (SIMULATE_STAGES) first.
+
+CONTOUR_POLYLINES = False
+
+
+# OVERSCAN
+# Runs the stages on past either end of each line on its own (e.g., the
+#   lines of write_parallel_lines_gap, wipe_region) by as far as they
+#   take to speed up or slow down, with the shutter closed, so that
+#   the whole line is written at constant speed and its ends don't get
+#   a heavier dose (cf. overscan.py); the step between the lines of a
+#   raster is started as the stages slow down. The mapping shows how
+#   far the stages go, and how much longer it takes. Only applies with
+#   CONNECT_KEITHLEY (the shutter has to close for the extra distance),
+#   or on simulated stages, and not with STREAM_STAGES.
+
+OVERSCAN = False
+
+
+# samples: if given, the names of sample files whose new commands are
+#   written one after another, without mapping them first (cf. the run
+#   and simulate subcommands below)
+# watch_position: in POSITION_GETTER_MODE, False to print the position
+#   once (without homing the stages first, or after) rather than on
+#   each press of 'p'
+def main(samples = None, watch_position = True):
+
+    # (the stages are left where they are if only reading the position)
+    home = not POSITION_GETTER_MODE or (watch_position and not MAC_TESTING)
 
     try:
         define_operating_constants()
+        import_dependencies()
 
         # Doesn't do anything if !CONNECT_KEITHLEY or fake connections
         setup_keithley()
@@ -105,23 +282,36 @@ def main():
         # Be sure to call setup_stages() before moving/setting objective height
         # Note that there's some give in the rotation of the pin through
 	    # the microscope coarse control
-        setup_stages()
+        setup_stages(home)
 
         if POSITION_GETTER_MODE:
 
-            # Press 'p' to print current position to console
-            keyboard.add_hotkey('p', print_position)
-            # Press 'esc' once you're finished with position-getting
-            keyboard.wait('esc')
+            if not home:
+                # (keyboard isn't available on mac)
+                print_position()
+            else:
+                # Press 'p' to print current position to console
+                keyboard.add_hotkey('p', print_position)
+                # Press 'esc' once you're finished with position-getting
+                keyboard.wait('esc')
+
+
+        elif samples is not None:
+
+            for sample_name in samples:
+                write_sample(sample_name)
 
 
         elif MOVE_MAPPING:
 
-            mh = MappingHandler(SAMPLES_PATH, SAMPLE_NAME, (CONNECT_KEITHLEY if not DUMMY_CONNECTIONS else False), DEFAULT_HOME_SPEED)
+            mh = MappingHandler(SAMPLES_PATH, SAMPLE_NAME, (CONNECT_KEITHLEY if not DUMMY_CONNECTIONS else False), DEFAULT_HOME_SPEED,
+                                optimize_travel = OPTIMIZE_TRAVEL and moves_are_dark(), overscan_accel = overscan_accel(),
+                                motion_model = motion_model(), batch_heights = BATCH_HEIGHTS and moves_are_dark())
             mh.draw_map()
 
-            if mh.continue_to_run:
-                write_mapped_commands(mh)
+            # (as in write_sample, except that commands mapped with
+            #   DUMMY_CONNECTIONS are recorded as written, as before)
+            if mh.continue_to_run and write_mapped_commands(mh) and not (SIMULATE_STAGES or REPLAY_SESSION):
                 mh.update_sample_history()
 
         else:
@@ -173,6 +363,7 @@ def main():
             write_parallel_lines_horizontal_const_height(z, x_width, speeds, gap, inter_speed_gap_factor = 0.2):
             write_parallel_lines_delta_s(z, start, end, gap, speed, delta_speed, num_lines_per_speed, num_speeds):
             write_line(start, end, speed):
+            write_polyline(points, speed):
             write_circle(center, radius, speed):
             write_part_circle(center, radius, start_deg, end_deg, speed):
             outline_region(z, speed = None):
@@ -192,15 +383,18 @@ def main():
         print("--unexpected error--")
         raise
     finally:
-        clean_up()
+        clean_up(home)
 
 
 # Sends new commands in the sample's data file (after mapping by
 #   MappingHandler and user confirmation) to stages for writing.
 # NOTE: Definitions and re-definitions of LOCAL_O are already taken into
-#   account; the position arguments passed to these commands are already
-#   adjusted appropriately, so there is no need to adjust that value
-#   between writes in this method.
+#   account; MappingHandler compiles the new commands into a trajectory
+#   (cf. trajectory.py) whose positions are relative to the region,
+#   exactly as it rendered them, so there is no need to adjust that
+#   value between writes in this method.
+# Returns False if nothing was written, since RESUME was set but the
+#   journal was for other commands; True otherwise.
 def write_mapped_commands(mh):
 
     global GLOBAL_O, TR, REGION_SIZE, LOCAL_O
@@ -210,34 +404,252 @@ def write_mapped_commands(mh):
     TR = mh.TR
     REGION_SIZE = GLOBAL_O - TR
 
-    for cmd_args in mh.new_cmds_array:
-        if cmd_args[0] == "write_parallel_lines_vertical_continuous":
-            write_parallel_lines_vertical_continuous(*cmd_args[1:])
-        elif cmd_args[0] == "write_parallel_lines_horizontal_continuous":
-            write_parallel_lines_horizontal_continuous(*cmd_args[1:])
-        elif cmd_args[0] == "write_parallel_lines_vertical_region_tall":
-            write_parallel_lines_vertical_region_tall(*cmd_args[1:])
-        elif cmd_args[0] == "write_parallel_lines_horizontal_region_wide":
-            write_parallel_lines_horizontal_region_wide(*cmd_args[1:])
-        elif cmd_args[0] == "write_parallel_lines_horizontal_const_height":
-            write_parallel_lines_horizontal_const_height(*cmd_args[1:])
-        elif cmd_args[0] == "write_parallel_lines_gap":
-            write_parallel_lines_gap(*cmd_args[1:])
-        elif cmd_args[0] == "write_parallel_lines_delta_s":
-            write_parallel_lines_delta_s(*cmd_args[1:])
-        elif cmd_args[0] == "write_line":
-            write_line(*cmd_args[1:])
-        elif cmd_args[0] == "write_circle":
-            write_circle(*cmd_args[1:])
-        elif cmd_args[0] == "write_part_circle":
-            write_part_circle(*cmd_args[1:])
-        elif cmd_args[0] == "outline_region":
-            outline_region(*cmd_args[1:])
-        elif cmd_args[0] == "wipe_region":
-            wipe_region(*cmd_args[1:])
-        elif cmd_args[0] == "move_to":
-            move_to(*cmd_args[1:])
-        # changes to LOCAL_O should be reflected in absolute shifts in the start/end arguments, as recorded in mapping_handler.py
+    trajectory = mh.trajectory
+    if DUMMY_CONNECTIONS:
+        return True
+
+    # (each is told as segments are written; cf. run_trajectory)
+    trackers = []
+    start = 0
+    if JOURNAL:
+        journal = Journal(SAMPLES_PATH + mh.sample_name + "_journal.txt", trajectory, mh.sample_name)
+        if RESUME:
+            start = journal.resume_point()
+            if start is None:
+                print("{}_journal.txt IS FOR OTHER COMMANDS THAN {}'S NEW ONES; NOT RESUMING.".format(mh.sample_name,
+                                                                                                   mh.sample_name))
+                return False
+            if start == len(trajectory):
+                print("{}: already written".format(mh.sample_name))
+                return True
+            if start > 0:
+                print("{}: resuming at segment {} of {} ([{}])".format(mh.sample_name, start, len(trajectory),
+                                                                       trajectory.command[start]))
+                resume_at(trajectory, start)
+        trackers.append(journal)
+    if PROGRESS:
+        trackers.append(ProgressReporter(planned_times(mh, trajectory), trajectory.command,
+                                         SAMPLES_PATH + mh.sample_name + "_status.json", PROGRESS_INTERVAL,
+                                         mh.sample_name))
+
+    for tracker in trackers:
+        tracker.start(start)
+    state = "stopped"
+    try:
+        run_trajectory(trajectory, start, trackers)
+        state = "finished"
+    finally:
+        for tracker in trackers:
+            tracker.finish(state)
+    return True
+
+
+# PLANNED TIMES
+# Returns how long (s) each segment of trajectory should take to write
+#   (cf. MappingHandler.estimate_times), on simulated stages as much
+#   faster as SIMULATION_SPEEDUP makes them. Arcs and contoured chains
+#   (cf. CONTOUR_POLYLINES) are sent on a schedule timed by this
+#   computer (cf. zaber/serial/binarydispatcher.py), so they take as
+#   long as on the stages, whatever the speedup.
+def planned_times(mh, trajectory):
+    times = mh.estimate_times(trajectory)
+    if SIMULATE_STAGES and SIMULATION_SPEEDUP != 1:
+        timed_here = trajectory.kind == ARC
+        if CONTOUR_POLYLINES and not STREAM_STAGES:
+            for first, count in zip(*trajectory.chains()):
+                timed_here[first:first + count] = True
+        times = np.where(timed_here, times, times / SIMULATION_SPEEDUP)
+    return times
+
+
+# RESUME AT
+# Sets up to carry on writing trajectory at segment start, as RESUME
+#   does after an interrupted run (cf. JOURNAL, RESUME): closes the
+#   shutter, whatever state it was left in, moves the stages to where
+#   the segment starts (the start of its lead-in, if it's overscanned),
+#   and the objective to the height it's written at.
+def resume_at(trajectory, start):
+
+    if DUMMY_CONNECTIONS:
+        return
+
+    if CONNECT_KEITHLEY:
+        shutter.invalidate()
+        shutter.close()
+
+    point = trajectory.run_starts[start]
+    if np.all(np.isfinite(point)):
+        move_to(region2globalmm(V2(tuple(point.tolist()))), is_local = False)
+
+    # (every segment has the height it's written at, if it's known; a
+    #   change of height has the height it changes to, but is run again)
+    heights = trajectory.segments["z"][:start + 1]
+    heights = heights[np.isfinite(heights)]
+    if CONNECT_ROTARY and len(heights):
+        z_rotary.move_abs(mm2rotdata(float(heights[-1])), await_reply = True)
+
+
+# WRITE SAMPLE
+# Writes the new commands in a sample's data file, as MOVE_MAPPING does
+#   but without drawing them first (so without matplotlib), and then
+#   records them as written, unless the stages are only simulated,
+#   replayed or DUMMY_CONNECTIONS.
+def write_sample(sample_name):
+
+    mh = MappingHandler(SAMPLES_PATH, sample_name, (CONNECT_KEITHLEY if not DUMMY_CONNECTIONS else False), DEFAULT_HOME_SPEED,
+                        optimize_travel = OPTIMIZE_TRAVEL and moves_are_dark(), overscan_accel = overscan_accel(),
+                        motion_model = motion_model(), batch_heights = BATCH_HEIGHTS and moves_are_dark())
+    if not mh.compile():
+        return
+
+    print("{}: {}".format(sample_name, mh.time_summary().replace("\n", "; ")))
+
+    if write_mapped_commands(mh) and not (DUMMY_CONNECTIONS or SIMULATE_STAGES or REPLAY_SESSION):
+        mh.update_sample_history()
+
+
+# NEW TRAJECTORY
+# Returns a TrajectoryBuilder (cf. trajectory.py) for the region as it's
+#   currently defined (REGION_SIZE, LOCAL_O), into which the write
+#   commands below compile themselves before they are run.
+def new_trajectory():
+    return TrajectoryBuilder((REGION_SIZE.x, REGION_SIZE.y), (LOCAL_O.x, LOCAL_O.y), DEFAULT_HOME_SPEED)
+
+# BUILD TRAJECTORY
+# Returns the trajectory compiled into tb (from new_trajectory), with
+#   its lines overscanned if OVERSCAN applies
+def build_trajectory(tb):
+    trajectory = tb.build()
+    if overscan_accel() is not None:
+        trajectory = add_overscan(trajectory, overscan_accel())
+    return trajectory
+
+# MOTION MODEL
+# Returns the MotionTimeModel (cf. motion_time.py) for the stages as
+#   they're set up, to estimate how long writes take; fitted to
+#   MOTION_CALIBRATION, if given
+def motion_model():
+    model = MotionTimeModel(STREAM_ACCELERATION if STREAM_STAGES else LIN_ACCEL, DELTA_T, DEFAULT_ROT_SPEED, ROT_ACCEL,
+                            DEG_PER_MM, shutter_time = SHUTTER_OPEN_LATENCY if CONNECT_KEITHLEY else 0,
+                            contour = CONTOUR_POLYLINES, corner_deviation = CORNER_DEVIATION)
+    if MOTION_CALIBRATION:
+        try:
+            model.calibrate(MOTION_CALIBRATION, DATA_PER_MM, DATA_PER_MM_SPEED, DATA_PER_DEG, DATA_PER_DEG_SPEED,
+                            (1, 2, 3) if MESSAGE_IDS else ())
+        except (OSError, ValueError) as e:
+            print("COULDN'T CALIBRATE TIME ESTIMATES: {}".format(e))
+    return model
+
+# MOVES ARE DARK
+# Whether moves can be added to or reordered in the new commands (cf.
+#   OPTIMIZE_TRAVEL, BATCH_HEIGHTS, OVERSCAN) without being written:
+#   with CONNECT_KEITHLEY, since the shutter closes for them, or on
+#   simulated stages, since there's no laser (and simulate doesn't
+#   connect the Keithley)
+def moves_are_dark():
+    return CONNECT_KEITHLEY or SIMULATE_STAGES
+
+# OVERSCAN ACCEL
+# Returns the acceleration (mm/s^2) to overscan lines for, or None if
+#   OVERSCAN doesn't apply (cf. OVERSCAN)
+def overscan_accel():
+    if OVERSCAN and moves_are_dark() and not STREAM_STAGES:
+        return LIN_ACCEL
+    return None
+
+
+# RUN TRAJECTORY
+# Sends a compiled trajectory (cf. trajectory.py) to the stages, one
+#   segment after another: moves and lines with move_to (the shutter
+#   open for lines), arcs with trace_arc, and changes of height with the
+#   rotary stage. With CONTOUR_POLYLINES, chains of lines (or of moves)
+#   that follow on from one another are written with trace_polyline,
+#   without stopping at the corners. With OVERLAP_HEIGHTS, changes of
+#   height are started during the moves before them where that's safe,
+#   and finished before anything else is written. Every write command,
+#   whether called here or mapped from a sample file, is written this
+#   way. Starts at
+#   segment start (cf. RESUME); each of trackers (e.g., a Journal or a
+#   ProgressReporter; cf. journal.py, progress.py) is told as each
+#   segment is written.
+def run_trajectory(trajectory, start = 0, trackers = ()):
+
+    if DUMMY_CONNECTIONS:
+        return
+
+    segments = trajectory.segments
+    run_ends = trajectory.run_ends
+    turns = overscan_turns(trajectory)
+    chains = dict(zip(*trajectory.chains())) if CONTOUR_POLYLINES else {}
+
+    # changes of height to start during the moves before them, as (the
+    #   first of those moves, the change's index); those in progress,
+    #   by index; and those made so
+    overlaps = []
+    if OVERLAP_HEIGHTS and CONNECT_ROTARY:
+        starts = height_starts(trajectory, (REGION_SIZE.x, REGION_SIZE.y), OVERLAP_MARGIN)
+        overlaps = [(int(starts[k]), int(k)) for k in np.flatnonzero(starts < np.arange(len(segments)))]
+    in_progress = {}
+    overlapped = set()
+
+    i = start
+    while i < len(segments):
+        while overlaps and overlaps[0][0] <= i:
+            _, k = overlaps.pop(0)
+            if k > i:
+                in_progress[k] = CoordinatedMove(serial_conn, [(z_rotary, 20, mm2rotdata(float(segments[k]["z"])))])
+                in_progress[k].start()
+
+        segment = segments[i]
+        kind = segment["kind"]
+
+        # (only the moves before a change of height are made during it)
+        if in_progress and kind != MOVE:
+            for k, move in in_progress.items():
+                move.wait()
+                overlapped.add(k)
+            in_progress.clear()
+
+        chain = chains.get(i, 1)
+        if chain > 1:
+            lines = segments[i:i + chain]
+            points = np.column_stack((np.append(lines["x0"][:1], lines["x1"]), np.append(lines["y0"][:1], lines["y1"])))
+            trace_polyline(points, lines["speed"].tolist(), laser_on = bool(segment["laser"]))
+            i += chain
+            for tracker in trackers:
+                tracker.update(i)
+            continue
+        i += 1
+
+        # (V2 only takes Python floats)
+        if kind == Z:
+            if CONNECT_ROTARY and i - 1 not in overlapped:
+                z_rotary.move_abs(mm2rotdata(float(segment["z"])), await_reply = True)
+        elif kind == ARC:
+            if CONNECT_KEITHLEY:
+                # (open by the time the arc starts)
+                shutter.open()
+                time.sleep(shutter.open_latency)
+            trace_arc(V2((float(segment["center_x"]), float(segment["center_y"]))), float(segment["radius"]),
+                      float(segment["start_deg"]), float(segment["end_deg"]), float(segment["speed"]))
+            if CONNECT_KEITHLEY:
+                shutter.close()
+        elif segment["lead_out"] > 0 or segment["lead_in"] > 0:
+            # (an overscanned line: the stages are at the start of its
+            #   lead-in, and run on to the end of its lead-out)
+            end = region2globalmm(V2(tuple(run_ends[i - 1].tolist())))
+            turn = None
+            if i < len(segments) and turns[i]:
+                turn = (region2globalmm(V2((float(segments[i]["x1"]), float(segments[i]["y1"])))),
+                        float(segments[i]["speed"]))
+                i += 1
+            move_to(end, float(segment["speed"]), laser_on = True, is_local = False, turn = turn)
+        else:
+            end = region2globalmm(V2((float(segment["x1"]), float(segment["y1"]))))
+            move_to(end, float(segment["speed"]), laser_on = bool(segment["laser"]), is_local = False)
+
+        for tracker in trackers:
+            tracker.update(i)
 
 
 # WRITE PARALLEL LINES: VERTICAL, CONTINUOUS
@@ -255,27 +667,12 @@ def write_parallel_lines_vertical_continuous(z, start, end, gap, speed):
     if DUMMY_CONNECTIONS:
         return
 
-    shift = V2((gap, 0))
-    move_to(start)
-
-    z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_on()
+    tb = new_trajectory()
+    tb.write_parallel_lines_vertical_continuous(z, start, end, gap, speed)
+    run_trajectory(build_trajectory(tb))
 
     num_lines = int(abs((end - start).x)/float(gap))
 
-    for i in range(0, num_lines, 2):
-
-        if i > 0:
-            move_to(start + shift*i, speed)
-        move_to(V2((start.x, end.y)) + shift*i, speed)
-        move_to(V2((start.x, end.y)) + shift*(i + 1), speed)
-        move_to(start + shift*(i + 1), speed)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_off()
-
     # PRINT OUT WHERE TO MANUALLY SET LOCAL_O NEXT
     if not MOVE_MAPPING:
         print(LOCAL_O + V2((0, abs((end - start).y) + gap)))
@@ -294,27 +691,13 @@ def write_parallel_lines_horizontal_continuous(z, start, end, gap, speed):
 
     if DUMMY_CONNECTIONS:
         return
-    
-    shift = V2((0, gap))
-    move_to(start)
-
-    z_rotary.move_abs(mm2rotdata(z), await_reply = True)
 
-    if CONNECT_KEITHLEY:
-        kh.set_output_on()
+    tb = new_trajectory()
+    tb.write_parallel_lines_horizontal_continuous(z, start, end, gap, speed)
+    run_trajectory(build_trajectory(tb))
 
     num_lines = int(abs((end - start).y)/float(gap))
 
-    for i in range(0, num_lines, 2):
-        if i > 0:
-            move_to(start + shift*i, speed)
-        move_to(V2((end.x, start.y)) + shift*i, speed)
-        move_to(V2((end.x, start.y)) + shift*(i + 1), speed)
-        move_to(start + shift*(i + 1), speed)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_off()
-
     # PRINT OUT WHERE TO SET LOCAL_O NEXT
     if not MOVE_MAPPING:
         print(LOCAL_O + V2((0, (num_lines + 1)*gap)))
@@ -338,22 +721,9 @@ def write_parallel_lines_vertical_region_tall(z, speeds, gap, inter_speed_gap_fa
     if DUMMY_CONNECTIONS:
         return
 
-    z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-    for i in range(len(speeds)):
-
-        start = V2((i*(2 + inter_speed_gap_factor)*gap, -1))
-        end = V2((i*(2 + inter_speed_gap_factor)*gap, REGION_SIZE.y + 1))
-
-        speed = speeds[i]
-        print(speed)
-
-        if i == 0:
-            move_to(start)
-            z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-        write_line(start, end, speed)
-        write_line(end + V2((gap, 0)), start + V2((gap, 0)), speed)
+    tb = new_trajectory()
+    tb.write_parallel_lines_vertical_region_tall(z, speeds, gap, inter_speed_gap_factor)
+    run_trajectory(build_trajectory(tb))
 
     if not MOVE_MAPPING:
     	print(LOCAL_O + V2(((len(speeds)*(2 + inter_speed_gap_factor) + 1)*gap, 0)))
@@ -375,20 +745,9 @@ def write_parallel_lines_horizontal_region_wide(z, speeds, gap, inter_speed_gap_
     if DUMMY_CONNECTIONS:
         return
 
-    for i in range(len(speeds)):
-
-        start = V2((-1, i*(2 + inter_speed_gap_factor)*gap))
-        end = V2((REGION_SIZE.x + 1, i*(2 + inter_speed_gap_factor)*gap))
-
-        speed = speeds[i]
-        print(speed)
-
-        if i == 0:
-            move_to(start)
-            z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-        write_line(start, end, speed)
-        write_line(end + V2((0, gap)), start + V2((0, gap)), speed)
+    tb = new_trajectory()
+    tb.write_parallel_lines_horizontal_region_wide(z, speeds, gap, inter_speed_gap_factor)
+    run_trajectory(build_trajectory(tb))
 
     if not MOVE_MAPPING:
     	print(LOCAL_O + V2((0, (len(speeds)*(2 + inter_speed_gap_factor) + 1)*gap)))
@@ -410,20 +769,9 @@ def write_parallel_lines_horizontal_const_height(z, x_width, speeds, gap, inter_
     if DUMMY_CONNECTIONS:
         return
 
-    for i in range(len(speeds)):
-
-        start = V2((0, i*(2 + inter_speed_gap_factor)*gap))
-        end = V2((x_width, i*(2 + inter_speed_gap_factor)*gap))
-
-        speed = speeds[i]
-        print(speed)
-
-        if i == 0:
-            move_to(start)
-            z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-        write_line(start, end, speed)
-        write_line(end + V2((0, gap)), start + V2((0, gap)), speed)
+    tb = new_trajectory()
+    tb.write_parallel_lines_horizontal_const_height(z, x_width, speeds, gap, inter_speed_gap_factor)
+    run_trajectory(build_trajectory(tb))
 
     if not MOVE_MAPPING:
         print(LOCAL_O + V2((0, (len(speeds)*(2 + inter_speed_gap_factor) + 1)*gap)))
@@ -451,18 +799,9 @@ def write_parallel_lines_gap(z, start, end, gap, speed, num_lines):
     if DUMMY_CONNECTIONS:
         return
 
-    direction = end - start
-
-    # in order to write //-  as opposed to -// (perpendicular_cntclk)
-    shift = direction.unit.perpendicular_clk * gap
-
-    for i in range(num_lines):
-        
-        if i == 0:
-            move_to(start)
-            z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-        write_line(start + shift*i, end + shift*i, speed)
+    tb = new_trajectory()
+    tb.write_parallel_lines_gap(z, start, end, gap, speed, num_lines)
+    run_trajectory(build_trajectory(tb))
 
 
 # WRITE PARALLEL LINES WITH A SPEED INCREMENT
@@ -488,15 +827,10 @@ def write_parallel_lines_delta_s(z, start, end, gap_dist, speed, delta_speed, nu
 
     if DUMMY_CONNECTIONS:
         return
-    
-    direction = end - start
 
-    # in order to write //-  as opposed to -// (perpendicular_cntclk)
-    shift = direction.unit.perpendicular_clk * gap_dist
-
-    for i in range(num_speeds):
-        spacer = shift * (num_lines_per_speed + (0.7 if num_lines_per_speed > 1 else 0)) * i
-        write_parallel_lines_gap(z, start + spacer, end + spacer, gap_dist, speed + i*delta_speed, num_lines_per_speed)
+    tb = new_trajectory()
+    tb.write_parallel_lines_delta_s(z, start, end, gap_dist, speed, delta_speed, num_lines_per_speed, num_speeds)
+    run_trajectory(build_trajectory(tb))
 
 
 # WRITE LINE
@@ -506,8 +840,22 @@ def write_line(start, end, speed):
     if DUMMY_CONNECTIONS:
         return
 
-    move_to(start)
-    move_to(end, ground_speed = speed, laser_on = True)
+    tb = new_trajectory()
+    tb.write_line(start, end, speed)
+    run_trajectory(build_trajectory(tb))
+
+# WRITE POLYLINE
+# Writes lines through each of points (a list of V2's) in turn, at the
+#   given speed; with CONTOUR_POLYLINES, without stopping at each point
+#   (cf. trace_polyline)
+def write_polyline(points, speed):
+
+    if DUMMY_CONNECTIONS:
+        return
+
+    tb = new_trajectory()
+    tb.write_polyline(points, speed)
+    run_trajectory(build_trajectory(tb))
 
 # WRITE CIRCLE
 # Just calls write_part_circle for start = 0, end = 360
@@ -516,60 +864,150 @@ def write_circle(center, radius, speed):
     if DUMMY_CONNECTIONS:
         return
 
-    write_part_circle(center, radius, 0, 360, speed)
+    tb = new_trajectory()
+    tb.write_circle(center, radius, speed)
+    run_trajectory(build_trajectory(tb))
 
 
 # WRITE PART CIRCLE
-# Writes arcs by calling move_vel (i.e., move at constant speed) on the
-#   x- and y- stages at ~differential time increments (defined in
-#   milliseconds by DELTA_T). This is far and away the most complicated
-#   move function, not least because of the idiosyncrasies of how the
-#   Zaber stages handle commands, which makes it necessary to keep track
-#   of time programmatically (rather than waiting for the device to
-#   respond that it's finished). The key point is that circles can be
-#   finicky.
+# Moves to the point at start_deg on the circle, then writes the arc
+#   (counterclockwise) to end_deg; cf. trace_arc.
 """
 [start], [end] = deg
 """
 def write_part_circle(center, radius, start_deg, end_deg, speed):
 
+    if DUMMY_CONNECTIONS:
+        return
+
+    tb = new_trajectory()
+    tb.write_part_circle(center, radius, start_deg, end_deg, speed)
+    run_trajectory(build_trajectory(tb))
+
+
+# TRACE ARC
+# Writes the arc of a write_part_circle, starting from where the stages
+#   already are (center + V2(start_deg)*radius); center is relative to
+#   the sample region, as in trajectory.py. Arcs are written by calling
+#   move_vel (i.e., move at constant speed) on the x- and y- stages at
+#   ~differential time increments (defined in milliseconds by DELTA_T).
+#   This is far and away the most complicated move function, not least
+#   because of the idiosyncrasies of how the Zaber stages handle
+#   commands, which makes it necessary to keep track of time
+#   programmatically (rather than waiting for the device to respond
+#   that it's finished). The key point is that circles can be finicky.
+#   The velocity at every tick is worked out before the circle starts
+#   (cf. circle_schedule.py) and each tick is sent at its own deadline,
+#   measured from the start of the arc, so that lateness in one tick
+#   doesn't carry over into the others.
+def trace_arc(center, radius, start_deg, end_deg, speed):
+
     if DUMMY_CONNECTIONS:
         return
 
     invert_factor = 1 if INVERT_COORDINATES else -1
 
-    # f = circle frequency; (mm/s) / (1000 * mm) = 1 / ms
-    f = speed / (1000 * radius)
-    # T = period = time it takes to do a whole circle (ms)
-    T = 1000 * 2*math.pi * radius / speed
+    if STREAM_STAGES:
+        # the controller interpolates the arc itself; it's counterclockwise
+        #   in stage coordinates either way, since region2globalmm only
+        #   ever flips both axes together
+        if end_deg > start_deg:
+            center_data = mm2lindata(region2globalmm(center))
+            start_data = mm2lindata(region2globalmm(center + V2(start_deg)*radius))
+            sh.write_part_circle((center_data.x, center_data.y), (start_data.x, start_data.y),
+                                 end_deg - start_deg, linspeed2msteps(speed))
+        return
 
-    # no need for invert_factor--handled in move_to
-    start_pos = center + V2(start_deg)*radius
-    move_to(start_pos)
+    schedule = circle_schedule(radius, start_deg, end_deg, speed, DELTA_T, DATA_PER_MM_SPEED, invert_factor,
+                               x_linear.number, y_linear.number, serial_conn.message_id_devices)
+
+    with serial_conn.transaction():
+        x_linear.disable_auto_reply()
+        y_linear.disable_auto_reply()
+
+    # Every tick's move_vel frames for both axes (in one write, so that
+    #   both axes change speed at the same time), worked out before the
+    #   circle starts, and sent on time by a thread of their own (cf.
+    #   circle_schedule.py, zaber/serial/binarydispatcher.py). These
+    #   are fire-and-forget (like move_vel(..., await_reply = None))
+    #   because move_vel can't be interrupted by disable_auto_reply
+    #   (will get busy error response = [_, 255, 255]), so auto_reply
+    #   status is left alone
+    dispatcher = BinaryDispatcher(serial_conn, schedule.times, schedule.frames, 2, end = schedule.end)
+    dispatcher.start()
+    try:
+        dispatcher.join()
+    finally:
+        dispatcher.stop()
 
-    x_linear.disable_auto_reply()
-    y_linear.disable_auto_reply()
+    with serial_conn.transaction():
+        stops = [x_linear.submit(23), y_linear.submit(23)]
+    serial_conn.wait_for_replies(stops)
 
-    start_time = time.perf_counter()
 
-    for t in range(int(start_deg * T / 360) + DELTA_T, int(end_deg * T / 360), DELTA_T):
+# TRACE POLYLINE
+# Goes through each of points (N x 2, mm, relative to the sample region,
+#   as in trajectory.py; the stages must already be at the first) along
+#   straight lines, at speeds (mm/s, one per line), without coming to a
+#   stop at each point: the stages are driven in velocity mode, slowing
+#   at the corners only as much as keeps them within CORNER_DEVIATION
+#   (mm) of the path (cf. polyline_schedule.py). The shutter is open
+#   throughout if laser_on. Any error left at the end (velocity mode
+#   doesn't keep track of position) is made up with a short move_to.
+def trace_polyline(points, speeds, laser_on = False):
 
-        delta = (V2(180/math.pi * f*t) - V2(180/math.pi * f*(t - DELTA_T))) * radius
-        velocity = delta.unit * speed
+    if DUMMY_CONNECTIONS:
+        return
+
+    global_points = region2globalmm_array(points)
+
+    if STREAM_STAGES:
+        # the controller blends the lines itself (cf. stream_handler.py)
+        if CONNECT_KEITHLEY:
+            if laser_on:
+                shutter.open()
+            else:
+                shutter.close()
+        for point_data, speed in zip(mm2lindata_array(global_points[1:]).tolist(), speeds):
+            sh.write_path([("line", tuple(point_data))], linspeed2msteps(speed), wait = False)
+        sh.wait_until_idle()
+        if CONNECT_KEITHLEY:
+            shutter.close()
+        return
+
+    schedule = polyline_schedule(global_points, speeds, DELTA_T, DATA_PER_MM_SPEED,
+                                 LIN_ACCEL, CORNER_DEVIATION, x_linear.number, y_linear.number,
+                                 serial_conn.message_id_devices)
 
-        # await_reply set to None here because move_vel can't be
-        # interrupted by disable_auto_reply (will get busy error
-        # response = [_, 255, 255]);  None value just skips setting
-        # auto_reply status
+    # (cf. trace_arc)
+    with serial_conn.transaction():
+        x_linear.disable_auto_reply()
+        y_linear.disable_auto_reply()
 
-        x_linear.move_vel(invert_factor * linspeed2lindata(velocity.x), await_reply = None)
-        y_linear.move_vel(invert_factor * linspeed2lindata(velocity.y), await_reply = None)
+    if CONNECT_KEITHLEY:
+        if laser_on:
+            # (open by the time the stages start)
+            shutter.open()
+            time.sleep(shutter.open_latency)
+        else:
+            shutter.close()
+
+    dispatcher = BinaryDispatcher(serial_conn, schedule.times, schedule.frames, 2, end = schedule.end)
+    dispatcher.start()
+    try:
+        if CONNECT_KEITHLEY and laser_on:
+            shutter.close_at(time.perf_counter() + schedule.duration)
+        dispatcher.join()
+    finally:
+        dispatcher.stop()
+        if CONNECT_KEITHLEY:
+            shutter.cancel()
 
-        while time.perf_counter() - start_time < 0.001*t:
-            time.sleep(0.001)
+    with serial_conn.transaction():
+        stops = [x_linear.submit(23), y_linear.submit(23)]
+    serial_conn.wait_for_replies(stops)
 
-    x_linear.stop()
-    y_linear.stop()
+    move_to(V2(tuple(global_points[-1].tolist())), speeds[-1], laser_on = laser_on, is_local = False)
 
 
 # MOVE TO
@@ -582,75 +1020,144 @@ def write_part_circle(center, radius, start_deg, end_deg, speed):
 #   versions of this file and of coordinates module (__v3/
 #   execute_commands.py and /coordinates.py) for a head start on this.
 # NOTE: A key feature of move_to is that it is able to handle
-#   simultaneous moves by calculating the time that each stage is
-#   expected to take, and awaiting a reply only from the slower-moving
-#   stage. Though this design is not as useful for simultaneous moves
-#   only in the x-y plane (where ground_speed is separated into x- and
-#   y- components such that both linear stages should take the same
-#   amount of time to complete a given move), it is very useful if
-#   z-axis commands are handled together with x-y commands, since the
-#   rotary stage moves slowly (cf. EXTREMELY IMPORTANT NOTE #3 in
-#   README.md). As above, cf. older versions of this file in (__v3/)
-#   for a head start at achieving this.
-# NOTE: This makes use of the method time_to_move (below) to predict
-#   move times. Cf. the notes on that method.
+#   simultaneous moves: both stages' moves are sent together, and then
+#   the replies from both are awaited at once (the background reader
+#   routes each stage's reply to its own waiter; cf. binaryreplyrouter.py
+#   and binarycoordinated.py), so move_to returns once the slower-moving
+#   stage has finished, and returns the CoordinatedMove, whose
+#   completion_times say when each stage did (None if nothing was sent
+#   one command at a time, e.g., with STREAM_STAGES). This is
+#   especially useful if z-axis commands are handled
+#   together with x-y commands, since the rotary stage moves slowly
+#   (cf. EXTREMELY IMPORTANT NOTE #3 in README.md). As above, cf. older
+#   versions of this file in (__v3/) for a head start at achieving this.
+# turn: (point (V2, global mm), speed (mm/s)) of a move along the other
+#   axis to make next, when this move is along x or y only (e.g., the
+#   step between the lines of a raster; cf. OVERSCAN). It's started as
+#   soon as the stages start to slow down, so the two are blended into
+#   one turnaround rather than each starting and stopping in turn.
 """
 [point] = V2, in mm
 [ground_speed] = mm/s; if value == None, => DEFAULT_HOMING_SPEED
 """
-def move_to(point, ground_speed = None, laser_on = False, is_local = True):
+def move_to(point, ground_speed = None, laser_on = False, is_local = True, turn = None):
 
     if DUMMY_CONNECTIONS:
         return
 
     if CONNECT_KEITHLEY:
-        if not laser_on:
-            kh.set_output_off()
-        else:
-            kh.set_output_on()
+        # (nothing is sent if it's already closed; cf. shutter_controller.py)
+        shutter.close()
 
     ground_speed = DEFAULT_HOME_SPEED if ground_speed is None else ground_speed
+    move = None
 
 
     # point data as a position (i.e., given invert, FsOR)
     global_point = local2globalmm(point) if is_local else point
     global_point_data = mm2lindata(global_point)
 
-    dist = global_point - current_position()
-    dist_data = mm2lindata(dist)
-
-    veloc = abs(dist.unit) * ground_speed
-
-    x_time = time_to_move(dist.x, veloc.x, LIN_STAGE_ACCELERATION)
-    y_time = time_to_move(dist.y, veloc.y, LIN_STAGE_ACCELERATION)
-
-    times = [x_time, y_time]
-    last_to_move = times.index(max(times))
-
-    if abs(dist_data.x) > 0:
-        x_linear.set_target_speed(linspeed2lindata(veloc.x), await_reply = True)
-    if abs(dist_data.y) > 0:
-        y_linear.set_target_speed(linspeed2lindata(veloc.y), await_reply = True)
-
-    # this is super ugly but it has to go like this procedurally, such that the
-    #   command "await_reply"-ing (i.e., the slowest move) is the last one called
-    if last_to_move == 0:
-        if abs(dist_data.y) > 0:
-            # don't await reply if x-axis will be slowest (necessary for
-	    #   simultaneous moves)
-            y_linear.move_abs(global_point_data.y)
+    if STREAM_STAGES:
+        # one line segment, along which the controller keeps both axes
+        #   in step (cf. stream_handler.py)
+        if CONNECT_KEITHLEY and laser_on:
+            shutter.open()
+        sh.move_to((global_point_data.x, global_point_data.y), linspeed2msteps(ground_speed))
+        if turn is not None:
+            if CONNECT_KEITHLEY:
+                shutter.close()
+            turn_data = mm2lindata(turn[0])
+            sh.move_to((turn_data.x, turn_data.y), linspeed2msteps(turn[1]))
+    else:
+        dist = global_point - current_position()
+        dist_data = mm2lindata(dist)
+
+        veloc = abs(dist.unit) * ground_speed
+
+        # (the stage that this move leaves alone makes the turn)
+        turn_move = None
+        if turn is not None:
+            turn_point, turn_speed = turn
+            turn_axis, turn_data = (y_linear, mm2lindata(turn_point.y)) if dist_data.y == 0 else \
+                                   (x_linear, mm2lindata(turn_point.x))
+            turn_move = CoordinatedMove(serial_conn, [(turn_axis, 20, turn_data)])
+
+        # send both speeds (in one write) before waiting for either stage
+        #   to confirm
+        pending = []
+        with serial_conn.transaction():
+            if abs(dist_data.x) > 0:
+                pending.append(x_linear.submit(42, linspeed2lindata(veloc.x)))
+            if abs(dist_data.y) > 0:
+                pending.append(y_linear.submit(42, linspeed2lindata(veloc.y)))
+            if turn_move is not None:
+                pending.append(turn_axis.submit(42, linspeed2lindata(turn_speed)))
+        serial_conn.wait_for_replies(pending)
+
+        # both moves leave in the same write, so that they start
+        #   together, and both completions are awaited at once
+        axes = []
         if abs(dist_data.x) > 0:
-            x_linear.move_abs(global_point_data.x, await_reply = True)
-    elif last_to_move == 1:
-        if abs(dist_data.x) > 0:
-            # don't await reply if y-axis will be slowest
-            x_linear.move_abs(global_point_data.x)
+            axes.append((x_linear, 20, global_point_data.x))
         if abs(dist_data.y) > 0:
-            y_linear.move_abs(global_point_data.y, await_reply = True)
+            axes.append((y_linear, 20, global_point_data.y))
+        move = CoordinatedMove(serial_conn, axes)
+        then = turn_move.start if turn_move is not None else None
+        if CONNECT_KEITHLEY and laser_on:
+            expose(move, dist.magnitude, ground_speed, max(veloc.x, veloc.y), then = then)
+        else:
+            move.run()
+            if then is not None:
+                then()
+        if turn_move is not None:
+            turn_move.wait()
 
 
     if CONNECT_KEITHLEY and laser_on:
-        kh.set_output_off()
+        shutter.close()
+
+    return move
+
+
+# EXPOSE
+# Runs move (a CoordinatedMove, not yet started) with the shutter open
+#   only while the stages move at constant velocity, so that the ends of
+#   a line don't get a heavier dose while the stages speed up and slow
+#   down: the shutter is open from when the faster axis (at axis_speed,
+#   mm/s) has reached its speed until the stages start to slow down,
+#   length (mm) / ground_speed (mm/s) after starting. Each command is
+#   sent ahead of time by the shutter's latency (cf. shutter_controller.
+#   py). A move too short to reach its speed is exposed throughout.
+#   then, if given, is called (e.g., to start the next move) as the
+#   stages start to slow down, or once the move is done if it's too
+#   short.
+def expose(move, length, ground_speed, axis_speed, then = None):
+    accel_time = axis_speed / LIN_ACCEL
+    decel_start = length / ground_speed
+    if decel_start <= accel_time:
+        accel_time, decel_start = 0, None
+
+    # (if the shutter must be told to open before the move starts, hold
+    #   the move back until then)
+    lead = shutter.open_latency - accel_time
+    if lead > 0:
+        shutter.open()
+        time.sleep(lead)
+
+    move.start()
+    try:
+        shutter.open_at(move.sent_at + accel_time)
+        if decel_start is not None:
+            shutter.close_at(move.sent_at + decel_start)
+            if then is not None:
+                time.sleep(max(move.sent_at + decel_start - time.perf_counter(), 0))
+                then()
+                then = None
+        move.wait()
+    finally:
+        shutter.cancel()
+    if then is not None:
+        then()
 
 
 # OUTLINE THE GLOBAL REGION
@@ -666,19 +1173,9 @@ def outline_region(z, speed = None):
     if DUMMY_CONNECTIONS:
         return
 
-    move_to(V2((-0.1, -0.1)) + LOCAL_O * (-1 if INVERT_COORDINATES else 1))
-    z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_on()
-
-    move_to(V2((-0.1, REGION_SIZE.y + 0.1)) + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-    move_to(REGION_SIZE + V2((0.1, 0.1)) + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-    move_to(V2((REGION_SIZE.x + 0.1, -0.1)) + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-    move_to(V2((-0.1, -0.1)) + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_off()
+    tb = new_trajectory()
+    tb.outline_region(z, speed)
+    run_trajectory(build_trajectory(tb))
 
 
 # WIPE THE REGION
@@ -690,21 +1187,9 @@ def wipe_region(z, gap = 0.08, speed = None):
     if DUMMY_CONNECTIONS:
         return
 
-    move_to(V2((-1, 0)) + LOCAL_O * (-1 if INVERT_COORDINATES else 1))
-    z_rotary.move_abs(mm2rotdata(z), await_reply = True)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_on()
-
-    for i in range(int(REGION_SIZE.y / (2*gap)) + 1):
-        if i > 0:
-            move_to(V2((-1, gap * 2*i))                    + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-        move_to(V2((REGION_SIZE.x + 1, gap * 2*i))         + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-        move_to(V2((REGION_SIZE.x + 1, gap * (2*i + 1)))   + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-        move_to(V2((-1, gap * (2*i + 1)))                  + LOCAL_O * (-1 if INVERT_COORDINATES else 1), speed)
-
-    if CONNECT_KEITHLEY:
-        kh.set_output_off()
+    tb = new_trajectory()
+    tb.wipe_region(z, gap, speed)
+    run_trajectory(build_trajectory(tb))
 
 
 # HOME ALL
@@ -721,6 +1206,10 @@ def home_all():
     if CONNECT_ROTARY:
         z_rotary.home(await_reply = True)
 
+    if STREAM_STAGES:
+        sh.home()
+        return
+
     x_linear.home(await_reply = True)
     y_linear.home(await_reply = True)
 
@@ -741,15 +1230,27 @@ def mm2lindata(mm):
 #   global and local frames of reference
 # Returns V2 (mm)
 def local2globalmm(local_mm):
+    return region2globalmm(LOCAL_O + local_mm)
+
+# Converts position relative to the sample region (V2, in mm; i.e., with
+#   LOCAL_O already added, as in trajectory.py) to global position
+# Returns V2 (mm)
+def region2globalmm(region_mm):
     if (INVERT_COORDINATES):
-        return TR + LOCAL_O + local_mm
-    return GLOBAL_O - LOCAL_O - local_mm
+        return TR + region_mm
+    return GLOBAL_O - region_mm
 
 # Converts linear speed (mm/s) to linear stage speed data (mstep/s)
 # Returns an int
 def linspeed2lindata(speed):
     return (int)(speed * DATA_PER_MM_SPEED)
 
+# Converts linear speed (mm/s) to microsteps/s, the unit of speed used
+#   by StreamHandler (cf. stream_handler.py)
+# Returns a float
+def linspeed2msteps(speed):
+    return speed * DATA_PER_MM
+
 # Converts linear stage distance data (mstep, or V2 of msteps) to
 #   distance in mm, or V2 of mm
 def lindata2mm(data):
@@ -788,50 +1289,91 @@ def linspeed2rotdata(speed):
 def degspeed2rotdata(speed):
     return (int)(speed * DATA_PER_DEG_SPEED)
 
+# ARRAY CONVERSIONS
+# The same conversions for whole arrays of points (N x 2, mm; x and y
+#   in columns, as in trajectory.py) or of distances or speeds, in one
+#   call each rather than one per point. Each works out exactly what the
+#   conversion above does, one value at a time (the same operations,
+#   in the same order, truncated toward zero), so data from either
+#   always agrees.
+
+# Converts local positions (N x 2, mm) to global positions
+# Returns an N x 2 array of floats (mm)
+def local2globalmm_array(local_mm):
+    local_mm = np.asarray(local_mm, dtype = float)
+    return region2globalmm_array(np.array((LOCAL_O.x, LOCAL_O.y)) + local_mm)
+
+# Converts positions relative to the sample region (N x 2, mm) to global
+#   positions
+# Returns an N x 2 array of floats (mm)
+def region2globalmm_array(region_mm):
+    region_mm = np.asarray(region_mm, dtype = float)
+    if (INVERT_COORDINATES):
+        return np.array((TR.x, TR.y)) + region_mm
+    return np.array((GLOBAL_O.x, GLOBAL_O.y)) - region_mm
 
-# TIME TO MOVE
-#   Calculates the expected time it should take to make a given move,
-#   based on distance, speed, and acceleration. This works well with x-
-#   and y- stages, and although it could be made to work with the rotary
-#   stage, you'd need to work in some additional conversion factors. Cf.
-#   notes on units in README.md.
-"""
-[dist] = mm
-[speed] = mm/s
-[accel] = mm/s^2
-"""
-def time_to_move(dist, speed, accel):
-    if mm2lindata(dist) == 0 or linspeed2lindata(speed) == 0:
-        return 0
+# Converts distances (or positions, N x 2) in mm to linear stage data
+# Returns an array of ints, of the same shape
+def mm2lindata_array(mm):
+    return np.trunc(np.asarray(mm, dtype = float) * DATA_PER_MM).astype(np.int64)
+
+# Converts positions relative to the sample region (N x 2, mm) straight
+#   to linear stage data, as mm2lindata(region2globalmm(...)) does
+# Returns an N x 2 array of ints
+def region2lindata_array(region_mm):
+    return mm2lindata_array(region2globalmm_array(region_mm))
 
-    dist = abs(dist)
+# Converts local positions (N x 2, mm) straight to linear stage data, as
+#   mm2lindata(local2globalmm(...)) does
+# Returns an N x 2 array of ints
+def local2lindata_array(local_mm):
+    return mm2lindata_array(local2globalmm_array(local_mm))
 
-    dist_always_accel = speed**2 / (2 * accel)
-    time_always_accel = (2 * dist_always_accel / accel)**0.5
+# Converts linear speeds (mm/s) to linear stage speed data
+# Returns an array of ints
+def linspeed2lindata_array(speed):
+    return np.trunc(np.asarray(speed, dtype = float) * DATA_PER_MM_SPEED).astype(np.int64)
 
-    if dist < dist_always_accel:
-        return time_always_accel
-    return time_always_accel + (dist - dist_always_accel) / speed
+# Converts focal distances (mm; cf. mm2rotdata) to rotary stage data
+# Returns an array of ints
+def mm2rotdata_array(mm):
+    return np.trunc((B_EMPIR - DEG_PER_MM * np.asarray(mm, dtype = float)) * DATA_PER_DEG).astype(np.int64)
 
 
 # CURRENT POSITION
-# Polls x- and y- stages for their positions and returns a V2 object OUT
-#   OF the context of the defined coordinate system (i.e., not
-#   considering GLOBAL_O, autc.). It's used by print_position (for
-#   POSITION_GETTER_MODE) and also by time_to_move (to calculate the
-#   distance to a target position).
-def current_position():
+# Returns the positions of the x- and y- stages as a V2 object OUT OF the
+#   context of the defined coordinate system (i.e., not considering
+#   GLOBAL_O, autc.). It's used by print_position (for
+#   POSITION_GETTER_MODE) and also by move_to (to calculate the
+#   distance to a target position). A stage is only polled if its
+#   position isn't already known from the replies to earlier moves (cf.
+#   zaber/serial/binarypositions.py), or if fresh (e.g., after it has
+#   been moved by hand, which the stages don't report).
+def current_position(fresh = False):
     if DUMMY_CONNECTIONS:
         return V2((0,0))
-    return V2((lindata2mm(x_linear.get_position()), lindata2mm(y_linear.get_position())))
+    if STREAM_STAGES:
+        return V2(tuple(map(lindata2mm, sh.position())))
+    positions = serial_conn.positions
+    if fresh:
+        positions.invalidate(x_linear.number)
+        positions.invalidate(y_linear.number)
+    x, y = positions.known(x_linear.number), positions.known(y_linear.number)
+    # poll both stages at once rather than one after the other
+    x_reply = x_linear.submit(60) if x is None else None
+    y_reply = y_linear.submit(60) if y is None else None
+    if x_reply is not None:
+        x = serial_conn.wait_for_reply(x_reply).data
+    if y_reply is not None:
+        y = serial_conn.wait_for_reply(y_reply).data
+    return V2((lindata2mm(x), lindata2mm(y)))
 
 def print_position():
-    # For some reason you have to poll position several times before
-    #   it's properly updated, but this may be a TIME delay rather than
-    #   a frequency delay...  more testing will tell.
-    for i in range(15):
-        current_position()
-    print(current_position())
+    # Moves made with the knobs aren't reported (manual move tracking is
+    #   disabled), so ask the stages themselves, once (this used to poll
+    #   15 times, from before replies were routed to whoever is waiting
+    #   for each stage; cf. zaber/serial/binaryreplyrouter.py)
+    print(current_position(fresh = True))
 
 
 """ CONNECTIONS AND SETUP """
@@ -842,32 +1384,43 @@ def print_position():
 #   operating values that enable control of the connected Thorlabs SH05
 #   beam shutter
 def setup_keithley():
-    global kh
+    global kh, shutter
 
     if DUMMY_CONNECTIONS or not CONNECT_KEITHLEY:
         return
 
     kh = kc.KeithleyHandler()
+    shutter = ShutterController(kh, SHUTTER_OPEN_LATENCY, SHUTTER_CLOSE_LATENCY)
 
     kh.set_source_current(0.4)
     kh.set_voltage_compliance(21.0)
-    kh.set_output_on()
+    shutter.open()
 
 # SETUP STAGES
 # (Unless DUMMY_CONNECTIONS):
 # Opens serial connections to Zaber stages and sets default operating
 #   parameters, like target speed, acceleration, and max position, all
-#   defined in define_operating_constants (below)
-def setup_stages():
-    global serial_conn, x_linear, y_linear, z_rotary
+#   defined in define_operating_constants (below), then homes the
+#   stages (unless !home)
+def setup_stages(home = True):
+    global serial_conn, x_linear, y_linear, z_rotary, sh
 
     if DUMMY_CONNECTIONS:
         return
 
     serial_conn = BinarySerial(STAGES_PORT, timeout = None)
 
+    if RECORD_SESSION:
+        serial_conn.start_recording(SAMPLES_PATH + SAMPLE_NAME + "_session.zbrl")
+
+    # Read replies on a background thread, so that waiting on one stage
+    #   doesn't hold up commands to the others
+    serial_conn.start_reader()
+
     if CONNECT_ROTARY:
         z_rotary = BinaryDevice(serial_conn, 1)
+        if MESSAGE_IDS:
+            z_rotary.enable_message_ids()
         z_rotary.set_home_speed(degspeed2rotdata(DEFAULT_ROT_SPEED))
         z_rotary.set_target_speed(degspeed2rotdata(DEFAULT_ROT_SPEED))
         z_rotary.set_acceleration(ROT_STAGE_ACCELERATION)
@@ -876,34 +1429,45 @@ def setup_stages():
         z_rotary.set_max_position(deg2rotdata(ROTARY_MAX_ANGLE))
 
 
-    x_linear = BinaryDevice(serial_conn, 2)
-    y_linear = BinaryDevice(serial_conn, 3)
+    if STREAM_STAGES:
+        sh = StreamHandler(STREAM_PORT)
+        sh.set_home_speed(linspeed2msteps(DEFAULT_HOME_SPEED))
+        sh.set_acceleration(STREAM_ACCELERATION * DATA_PER_MM)
+    else:
+        x_linear = BinaryDevice(serial_conn, 2)
+        y_linear = BinaryDevice(serial_conn, 3)
 
-    x_linear.set_home_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
-    y_linear.set_home_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
+        if MESSAGE_IDS:
+            x_linear.enable_message_ids()
+            y_linear.enable_message_ids()
 
-    x_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
-    y_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
+        # none of these wait for a reply, so send them all in one write
+        with serial_conn.transaction():
+            x_linear.set_home_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
+            y_linear.set_home_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
 
-    x_linear.set_acceleration(LIN_STAGE_ACCELERATION)
-    y_linear.set_acceleration(LIN_STAGE_ACCELERATION)
+            x_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
+            y_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
 
-    x_linear.disable_manual_move_tracking()
-    y_linear.disable_manual_move_tracking()
+            x_linear.set_acceleration(LIN_STAGE_ACCELERATION)
+            y_linear.set_acceleration(LIN_STAGE_ACCELERATION)
 
-    move_to(V2((0.1, 0.1)), is_local = False)
+            x_linear.disable_manual_move_tracking()
+            y_linear.disable_manual_move_tracking()
 
-    home_all()
+    if home:
+        move_to(V2((0.1, 0.1)), is_local = False)
+        home_all()
 
 
 # CLEAN UP
 # (Unless !CONNECT_KEITHLEY):
 # Turns off output of Keithley 2400 SourceMeter.
 # (Unless DUMMY_CONNECTIONS):
-# Homes stages and resets target speeds to default (in order to speed up
-#   manual moves after programmed slower ones), then closes the serial
-#   connection to the Zaber stages.
-def clean_up():
+# Homes stages (unless !home) and resets target speeds to default (in
+#   order to speed up manual moves after programmed slower ones), then
+#   closes the serial connection to the Zaber stages.
+def clean_up(home = True):
     print("cleaning up")
 
     if DUMMY_CONNECTIONS:
@@ -911,15 +1475,26 @@ def clean_up():
     	return
 
     if CONNECT_KEITHLEY:
-        kh.set_output_off()
+        shutter.close()
 
-    home_all()
+    if home:
+        home_all()
 
-    x_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
-    y_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
+    if STREAM_STAGES:
+        sh.close()
+    else:
+        x_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
+        y_linear.set_target_speed(linspeed2lindata(DEFAULT_HOME_SPEED))
 
-    x_linear.enable_auto_reply()
-    y_linear.enable_auto_reply()
+        x_linear.enable_auto_reply()
+        y_linear.enable_auto_reply()
+
+    if BUS_METRICS:
+        print(serial_conn.metrics.format_text())
+        try:
+            serial_conn.metrics.write_json(SAMPLES_PATH + SAMPLE_NAME + "_bus_metrics.json")
+        except OSError as e:
+            print("COULDN'T SAVE BUS METRICS: {}".format(e))
 
     serial_conn.close()
 
@@ -933,8 +1508,9 @@ def define_operating_constants():
 
     """         ZABER CONTROL         """
     global GLOBAL_O, TR, LOCAL_O, REGION_SIZE, \
-           STAGES_PORT, MM_PER_MSTEP, DATA_PER_MM, DATA_PER_MM_SPEED, DATA_PER_DEG, DATA_PER_DEG_SPEED, DEG_PER_MM, \
-           DELTA_T, DEFAULT_HOME_SPEED, DEFAULT_ROT_SPEED, LIN_STAGE_ACCELERATION, ROT_STAGE_ACCELERATION, \
+           STAGES_PORT, STREAM_PORT, MM_PER_MSTEP, DATA_PER_MM, DATA_PER_MM_SPEED, DATA_PER_DEG, DATA_PER_DEG_SPEED, DEG_PER_MM, \
+           DELTA_T, CORNER_DEVIATION, DEFAULT_HOME_SPEED, DEFAULT_ROT_SPEED, LIN_STAGE_ACCELERATION, LIN_ACCEL_UNIT, LIN_ACCEL, STREAM_ACCELERATION, \
+           ROT_STAGE_ACCELERATION, ROT_ACCEL_UNIT, ROT_ACCEL, SHUTTER_OPEN_LATENCY, SHUTTER_CLOSE_LATENCY, \
            ROTARY_MIN_ANGLE, ROTARY_MAX_ANGLE, B_EMPIR, INVERT_COORDINATES
 
 
@@ -944,29 +1520,252 @@ def define_operating_constants():
     REGION_SIZE = GLOBAL_O - TR
 
     STAGES_PORT = "COM3"                # serial port to Zaber stages
+    if SIMULATE_STAGES:
+        STAGES_PORT = "zabersim://?speedup={}".format(SIMULATION_SPEEDUP)
+    if REPLAY_SESSION:
+        STAGES_PORT = "zaberreplay://" + REPLAY_SESSION + \
+                      ("?fast" if REPLAY_SPEEDUP is None else "?speedup={}".format(REPLAY_SPEEDUP))
+    STREAM_PORT = "COM4"                # serial port to the x-y stages' ASCII controller (STREAM_STAGES)
+    if SIMULATE_STAGES:
+        STREAM_PORT = "zaberasciisim://?speedup={}".format(SIMULATION_SPEEDUP)
     DATA_PER_MM = 1000 / 0.047625       # conversion from mm to data
     DATA_PER_MM_SPEED = 2240            # conversion from mm/s to data (speed)
     DATA_PER_DEG = 12800 / 3            # conversion from degrees to data
     DATA_PER_DEG_SPEED = 6990           # conversion from deg/s to data (speed)
     DEG_PER_MM = 9.2597                 # (deg/mm) empirical conversion, mm to degrees
     DELTA_T = 24                        # (ms) SET LOWER WHEN WRITING FASTER
+    CORNER_DEVIATION = 0.005            # (mm) furthest trace_polyline may cut a corner
 
     DEFAULT_HOME_SPEED = 5              # (mm/s)
     DEFAULT_ROT_SPEED = 15              # (deg/s)
     LIN_STAGE_ACCELERATION = 2000       # (data/s^2) ?
+    LIN_ACCEL_UNIT = 11250              # (microsteps/s^2 per data) acceleration, T-series
+    LIN_ACCEL = LIN_STAGE_ACCELERATION * LIN_ACCEL_UNIT / DATA_PER_MM  # (mm/s^2)
+    STREAM_ACCELERATION = 100           # (mm/s^2) along and across streamed paths (STREAM_STAGES)
 
     # BE CAREFUL ABOUT INCREASING THIS VALUE! Cf. EXTREMELY IMPORTANT
     #   NOTES #3 in README.rm.
     ROT_STAGE_ACCELERATION = 40         # (data/s^2) ?
+    ROT_ACCEL_UNIT = 10000 / 1.6384     # (microsteps/s^2 per data) acceleration, X-series (cf. binarysimulator.py)
+    ROT_ACCEL = ROT_STAGE_ACCELERATION * ROT_ACCEL_UNIT / DATA_PER_DEG  # (deg/s^2)
 
     ROTARY_MIN_ANGLE = 0.0	        # (deg) min position of rotary stage = upper bound on laser height
     ROTARY_MAX_ANGLE = 113.5	        # (deg) max postition of rotary stage = min. allowable laser height
     B_EMPIR = 1414.9692                 # (deg) position of rotary stage at 0 mm
 
+    """         BEAM SHUTTER         """
+    # (s) from telling the Keithley to open/close the shutter to the
+    #   shutter being open/closed; CALIBRATE THESE ON THE SETUP (cf.
+    #   shutter_controller.py). 0 = no compensation.
+    SHUTTER_OPEN_LATENCY = 0
+    SHUTTER_CLOSE_LATENCY = 0
+
     # True if writing to a sample to be viewed in microscope (since microscope inverts image)
     INVERT_COORDINATES = True;
 
+    # (e.g., STAGES_PORT from a config file; cf. COMMAND LINE)
+    globals().update(CONSTANT_OVERRIDES)
+
+
+""" COMMAND LINE """
+
+# COMMAND LINE
+# Instead of editing the parameters at the top of this file, they can be
+#   given on the command line, e.g.,
+#
+#       python execute_commands.py map _waveguide
+#       python execute_commands.py run "HW 1_19_1" "HW 1_19_2" --no-keithley
+#       python execute_commands.py position
+#       python execute_commands.py simulate _waveguide --speedup 20
+#       python execute_commands.py check
+#
+#   map draws the sample's new commands and writes them if you press
+#   Run (as MOVE_MAPPING does); run writes the new commands of each
+#   sample given, one after another, without drawing them (so without
+#   importing matplotlib); position prints where the stages are (or,
+#   with --watch, does what POSITION_GETTER_MODE does); simulate does
+#   what run does, on simulated stages (SIMULATE_STAGES); check does
+#   what simulate does for samples/_check.txt, with and without message
+#   IDs and CONTOUR_POLYLINES (cf. CHECK). Without a
+#   subcommand, the parameters at the top of this file apply as before;
+#   with one, the stages (and Keithley) are connected unless --dummy is
+#   given (or DUMMY_CONNECTIONS = True in the config file). SAMPLE_NAME
+#   is the sample given (for run and simulate, the first of them), so
+#   that RECORD_SESSION and BUS_METRICS save beside it.
+#
+#   --config reads parameters from an .ini file, e.g.,
+#
+#       [execute_commands]
+#       SAMPLES_PATH = "C:/Users/lab/samples/"
+#       STAGES_PORT = "COM5"
+#       MESSAGE_IDS = True
+#
+#   Names are those of the parameters in this file (including the ones
+#   in define_operating_constants, e.g., STAGES_PORT, DELTA_T), and
+#   values are Python literals (a value that isn't one is read as a
+#   string). Options on the command line win over the config file.
+
+CONFIG_SECTION = "execute_commands"
+
+# values given in a config file for the constants that
+#   define_operating_constants sets
+CONSTANT_OVERRIDES = {}
+
+
+def parse_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog = "execute_commands.py",
+                                     description = "Write to samples with the Zaber stages (cf. README.md).")
+    common = argparse.ArgumentParser(add_help = False)
+    common.add_argument("--config", help = "read parameters from this .ini file")
+    common.add_argument("--samples-path", help = "directory of the sample .txt files (SAMPLES_PATH)")
+    common.add_argument("--dummy", action = "store_true", help = "don't connect to anything (DUMMY_CONNECTIONS)")
+    common.add_argument("--no-keithley", action = "store_true", help = "don't connect to the Keithley (CONNECT_KEITHLEY = False)")
+    common.add_argument("--no-rotary", action = "store_true", help = "don't connect to the rotary stage (CONNECT_ROTARY = False)")
+    common.add_argument("--message-ids", action = "store_true", help = "turn on Zaber message IDs (MESSAGE_IDS)")
+    common.add_argument("--stream", action = "store_true", help = "drive x and y through the ASCII controller (STREAM_STAGES)")
+    common.add_argument("--record", action = "store_true", help = "record the session (RECORD_SESSION)")
+    common.add_argument("--optimize-travel", action = "store_true", help = "reorder writes to cut travel (OPTIMIZE_TRAVEL)")
+    common.add_argument("--contour-polylines", action = "store_true",
+                        help = "write chains of lines without stopping at each corner (CONTOUR_POLYLINES)")
+    common.add_argument("--overscan", action = "store_true", help = "write lines at constant speed end to end (OVERSCAN)")
+    common.add_argument("--batch-heights", action = "store_true", help = "write commands in order of height (BATCH_HEIGHTS)")
+    common.add_argument("--overlap-heights", action = "store_true",
+                        help = "change height during moves where it's safe (OVERLAP_HEIGHTS)")
+    common.add_argument("--resume", action = "store_true", help = "carry on an interrupted run where it stopped (RESUME)")
+
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+    map_parser = subparsers.add_parser("map", parents = [common], help = "draw a sample's new commands, then write them")
+    map_parser.add_argument("sample", help = "name of the sample's .txt file, without .txt")
+    run_parser = subparsers.add_parser("run", parents = [common], help = "write samples' new commands without drawing them")
+    run_parser.add_argument("samples", nargs = "+", help = "names of the samples' .txt files, without .txt")
+    position_parser = subparsers.add_parser("position", parents = [common], help = "print where the stages are")
+    position_parser.add_argument("--watch", action = "store_true", help = "home, then print the position on each press of 'p'")
+    simulate_parser = subparsers.add_parser("simulate", parents = [common], help = "run samples on simulated stages")
+    simulate_parser.add_argument("samples", nargs = "+", help = "names of the samples' .txt files, without .txt")
+    simulate_parser.add_argument("--speedup", type = float, default = 1, help = "times faster than real time (SIMULATION_SPEEDUP); "
+                                 "circles and contoured lines are timed by this computer, so run in real time")
+    subparsers.add_parser("check", help = "simulate samples/_check.txt with and without message IDs "
+                          "and contoured polylines")
+
+    return parser.parse_args(argv)
+
+
+# Sets the parameters in an .ini file (cf. COMMAND LINE)
+def read_config(path):
+    import ast, configparser
+
+    config = configparser.ConfigParser()
+    config.optionxform = str.upper
+    if not config.read(path):
+        raise SystemExit("config file {} not found.".format(path))
+    if not config.has_section(CONFIG_SECTION):
+        raise SystemExit("config file {} has no [{}] section.".format(path, CONFIG_SECTION))
+
+    for name, text in config.items(CONFIG_SECTION):
+        try:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            value = text
+        globals()[name] = value
+        CONSTANT_OVERRIDES[name] = value
+
+
+# CHECK
+# Simulates CHECK_SAMPLE (in samples/, beside this file; a line, arcs,
+#   a polyline, and moves) in the ways listed in CHECK_OPTIONS, each in
+#   a process of its own, and fails if any errors or takes longer than
+#   CHECK_TIMEOUT (s) (e.g., if a stage never replies, since the stages'
+#   port waits for replies for as long as they take). The sample is
+#   copied to a temporary directory first, so that the files saved
+#   beside it (e.g., JOURNAL's, BUS_METRICS') don't pile up in samples/.
+CHECK_SAMPLE = "_check"
+CHECK_OPTIONS = ([], ["--message-ids"], ["--contour-polylines"], ["--contour-polylines", "--message-ids"])
+CHECK_SPEEDUP = 20
+CHECK_TIMEOUT = 120
+
+def check():
+    import shutil, subprocess, tempfile
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    failed = []
+    for options in CHECK_OPTIONS:
+        label = " ".join(["simulate", CHECK_SAMPLE] + options)
+        with tempfile.TemporaryDirectory() as samples_path:
+            shutil.copy(os.path.join(here, "samples", CHECK_SAMPLE + ".txt"), samples_path)
+            argv = [sys.executable, os.path.join(here, "execute_commands.py"), "simulate", CHECK_SAMPLE,
+                    "--samples-path", samples_path, "--speedup", str(CHECK_SPEEDUP)] + options
+            try:
+                passed = subprocess.run(argv, stdout = subprocess.DEVNULL, timeout = CHECK_TIMEOUT).returncode == 0
+            except subprocess.TimeoutExpired:
+                passed = False
+        print("{}: {}".format(label, "ok" if passed else "FAILED"))
+        if not passed:
+            failed.append(label)
+
+    if failed:
+        raise SystemExit("check failed: " + ", ".join(failed))
+
+
+# Runs the subcommand in argv (e.g., sys.argv[1:]); cf. COMMAND LINE
+def cli(argv):
+    global DUMMY_CONNECTIONS, CONNECT_ROTARY, CONNECT_KEITHLEY, SIMULATE_STAGES, SIMULATION_SPEEDUP, RECORD_SESSION, \
+           MESSAGE_IDS, STREAM_STAGES, POSITION_GETTER_MODE, MOVE_MAPPING, SAMPLES_PATH, SAMPLE_NAME, OPTIMIZE_TRAVEL, \
+           CONTOUR_POLYLINES, OVERSCAN, RESUME, BATCH_HEIGHTS, OVERLAP_HEIGHTS
+
+    args = parse_args(argv)
+    if args.command == "check":
+        check()
+        return
+
+    if args.config:
+        read_config(args.config)
+    if args.samples_path:
+        # (file names are added straight on, e.g., SAMPLES_PATH + SAMPLE_NAME + ".txt")
+        SAMPLES_PATH = os.path.join(args.samples_path, "")
+        CONSTANT_OVERRIDES.pop("SAMPLES_PATH", None)
+    # (DUMMY_CONNECTIONS above is for editing this file; from the
+    #   command line, connect unless told not to)
+    DUMMY_CONNECTIONS = args.dummy or bool(CONSTANT_OVERRIDES.get("DUMMY_CONNECTIONS"))
+    CONNECT_KEITHLEY = CONNECT_KEITHLEY and not args.no_keithley
+    CONNECT_ROTARY = CONNECT_ROTARY and not args.no_rotary
+    MESSAGE_IDS = MESSAGE_IDS or args.message_ids
+    STREAM_STAGES = STREAM_STAGES or args.stream
+    RECORD_SESSION = RECORD_SESSION or args.record
+    OPTIMIZE_TRAVEL = OPTIMIZE_TRAVEL or args.optimize_travel
+    CONTOUR_POLYLINES = CONTOUR_POLYLINES or args.contour_polylines
+    OVERSCAN = OVERSCAN or args.overscan
+    RESUME = RESUME or args.resume
+    BATCH_HEIGHTS = BATCH_HEIGHTS or args.batch_heights
+    OVERLAP_HEIGHTS = OVERLAP_HEIGHTS or args.overlap_heights
+
+    POSITION_GETTER_MODE = args.command == "position"
+    MOVE_MAPPING = args.command == "map"
+
+    # (the session's recording and bus metrics are saved under the sample
+    #   written, or the first of them, rather than SAMPLE_NAME above)
+    if args.command in ("run", "simulate"):
+        SAMPLE_NAME = args.samples[0]
+
+    if args.command == "map":
+        SAMPLE_NAME = args.sample
+        main()
+    elif args.command == "run":
+        main(samples = args.samples)
+    elif args.command == "position":
+        main(watch_position = args.watch)
+    elif args.command == "simulate":
+        SIMULATE_STAGES = True
+        SIMULATION_SPEEDUP = args.speedup
+        DUMMY_CONNECTIONS = False
+        CONNECT_KEITHLEY = False
+        main(samples = args.samples)
+
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1:
+        cli(sys.argv[1:])
+    else:
+        main()
 
@@ -0,0 +1,197 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	height_batching.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Reorders the commands in a compiled trajectory (cf. trajectory.py) so
+that the objective changes height (z) as little as it can. The rotary
+stage is slow (DEFAULT_ROT_SPEED, at about 9.26 deg per mm), so a job
+that goes back and forth between a few heights (e.g., test patterns at
+several z's, one after another) spends much of its time waiting on it.
+
+The commands are put in order of height, going up or down (whichever
+is closer to the height the objective starts at), so that each height
+is moved to once; commands at the same height stay in the order they
+were in. Each command is written exactly as compiled, at the height it
+was compiled at; commands that don't set a height themselves (e.g.,
+write_line, write_circle) are written at the height of the command
+before them, and go with it. Moves between commands are worked out
+again once they're in their new order, and a change of height is made
+wherever the height changes (and nowhere else).
+
+What stays put:
+- fences: the commands numbered from a fence on are written after
+  every command numbered below it (cf. "## ORDER" in the sample files,
+  read by mapping_handler.py);
+- move_to commands: these stay with the command after them, and one
+  with no command after it stays where it is, after the commands
+  before it;
+- commands from before the height is known (i.e., before the first
+  change of height) stay first;
+- a command that's written at more than one height keeps the commands
+  between its fences in their original order.
+
+Like travel_optimizer.py, this only makes sense if the shutter closes
+for moves (i.e., CONNECT_KEITHLEY); otherwise the moves are written too.
+"""
+
+
+import numpy as np
+
+from trajectory import Trajectory, SEGMENT_DTYPE, MOVE, Z, move_segment
+
+
+class _Unit(object):
+
+    def __init__(self, approach, indices, height):
+        self.approach = approach        # indices of move_to's before it
+        self.indices = indices          # indices of the command's segments
+        self.height = height            # NaN if not known
+
+
+# BATCH HEIGHTS
+# Returns trajectory with its commands in order of height (cf. above),
+#   with moves between them made at speed (mm/s). fences are command
+#   numbers (cf. above).
+def batch_heights(trajectory, speed, fences = ()):
+    if len(trajectory) == 0:
+        return trajectory
+
+    segments = trajectory.segments
+    position = (float(segments["x0"][0]), float(segments["y0"][0]))
+    z = float(segments["z"][0]) if segments["kind"][0] != Z else np.nan
+    chunks = []
+    for units, fixed, keep_order in _blocks(segments, sorted(fences)):
+        if keep_order:
+            # (as compiled, only joined up to where the stages are)
+            indices = [i for unit in units for i in unit.approach + unit.indices] + fixed
+            position, z = _emit(chunks, segments[indices], position, z, speed)
+            continue
+        for unit in _order(units, z):
+            position, z = _emit(chunks, segments[unit.approach], position, z, speed)
+            position, z = _emit(chunks, segments[unit.indices], position, z, speed, unit.height)
+        position, z = _emit(chunks, segments[fixed], position, z, speed)
+    return Trajectory(np.concatenate(chunks) if chunks else np.zeros(0, dtype = SEGMENT_DTYPE))
+
+
+# Returns the number of changes of height in trajectory
+def height_changes(trajectory):
+    return int(np.count_nonzero(trajectory.kind == Z))
+
+
+# Yields (units, fixed, keep_order): the commands (with the move_to's
+#   before them) that may be reordered among themselves, the move_to's
+#   after the last of them, and whether they must keep their order
+def _blocks(segments, fences):
+    kind, command = segments["kind"], segments["command"]
+    groups = np.split(np.arange(len(segments)), np.flatnonzero(np.diff(command)) + 1)
+    fences = list(fences)
+
+    units = []
+    approach = []
+    keep_order = False
+    for indices in groups:
+        if fences and command[indices[0]] >= fences[0]:
+            while fences and command[indices[0]] >= fences[0]:
+                fences.pop(0)
+            yield units, approach, keep_order
+            units, approach, keep_order = [], [], False
+
+        if np.all(kind[indices] == MOVE):
+            approach.extend(indices.tolist())
+            continue
+
+        # (written at the height of its segments from its first change of
+        #   height on, other than the changes of height themselves, or, if
+        #   it only changes height, at the height it changes to; commands
+        #   go to where they start before changing height)
+        changes = indices[kind[indices] == Z]
+        after = indices[indices >= changes[0]] if len(changes) else indices
+        written = after[kind[after] != Z]
+        heights = segments["z"][written if len(written) else changes[-1:]]
+        if not (np.all(heights == heights[0]) or np.all(np.isnan(heights))):
+            keep_order = True
+        units.append(_Unit(approach, indices.tolist(), float(heights[0])))
+        approach = []
+    yield units, approach, keep_order
+
+
+# Returns units in order of height, up or down from z (the height
+#   before them), whichever is closer; units at an unknown height first
+def _order(units, z):
+    known = [unit for unit in units if np.isfinite(unit.height)]
+    if not known:
+        return units
+    unknown = [unit for unit in units if not np.isfinite(unit.height)]
+    heights = [unit.height for unit in known]
+    here = z if np.isfinite(z) else heights[0]
+    downward = abs(here - max(heights)) < abs(here - min(heights))
+    # (sorted keeps units at the same height in order, either way)
+    return unknown + sorted(known, key = lambda unit: unit.height, reverse = downward)
+
+
+# Adds block (segments that follow on from one another) to chunks,
+#   joined up to position by a move made at speed. If height is given
+#   (a command's; cf. _blocks), block changes to it where it first
+#   changed height (or first of all, if it didn't), unless the
+#   objective is already there, and nowhere else. Each segment is
+#   tagged with the height it's made at. Returns where the stages, and
+#   the objective, end up.
+def _emit(chunks, block, position, z, speed, height = None):
+    block = block.copy()
+    if height is not None:
+        changes = np.flatnonzero(block["kind"] == Z)
+        keep = np.ones(len(block), dtype = bool)
+        keep[changes[1:]] = False
+        if len(changes) and not (np.isfinite(height) and height != z):
+            keep[changes[0]] = False
+        elif len(changes):
+            block["z"][changes[0]] = height
+        elif np.isfinite(height) and height != z:
+            chunks.append(_height_segment(position, height, block[0]))
+            z = height
+        block = block[keep]
+    if len(block) == 0:
+        return position, z
+
+    # (up to its first change of height, block is made at z)
+    kind = block["kind"]
+    changes = np.flatnonzero(kind == Z)
+    block["z"][:changes[0] if len(changes) else len(block)] = z
+
+    # changes of height before the first segment that goes anywhere are
+    #   made where the stages are, and that segment is joined up to them
+    first = int(np.argmax(kind != Z)) if np.any(kind != Z) else len(block)
+    for field, value in (("x0", position[0]), ("x1", position[0]), ("y0", position[1]), ("y1", position[1])):
+        block[field][:first] = value
+    if first < len(block):
+        start = (float(block["x0"][first]), float(block["y0"][first]))
+        end = (float(block["x1"][first]), float(block["y1"][first]))
+        if kind[first] == MOVE and end == position:
+            block = np.delete(block, first)
+        elif start != position and kind[first] == MOVE:
+            block["x0"][first], block["y0"][first] = position
+        elif start != position:
+            chunks.append(block[:first])
+            chunks.append(move_segment(position, start, speed, block[first]))
+            block = block[first:]
+    if len(block) == 0:
+        return position, z
+
+    chunks.append(block)
+    if len(changes):
+        z = float(block["z"][-1])
+    return (float(block["x1"][-1]), float(block["y1"][-1])), z
+
+
+# A change of height to z at position, tagged (command) like segment
+def _height_segment(position, z, segment):
+    change = np.zeros(1, dtype = SEGMENT_DTYPE)
+    for field in ("center_x", "center_y", "radius", "start_deg", "end_deg"):
+        change[field] = np.nan
+    change["kind"] = Z
+    change["command"] = segment["command"]
+    change["z"] = z
+    change["x0"], change["y0"] = change["x1"], change["y1"] = position
+    return change
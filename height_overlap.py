@@ -0,0 +1,71 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	height_overlap.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Works out which changes of height in a compiled trajectory (cf.
+trajectory.py) can be made while the stages move to where the next
+write starts, rather than after they get there. The rotary stage is
+slow, so a change of height can take as long as the move before it.
+
+The objective mustn't be lowered until it's over the sample region,
+since it would hit the sample holder screws (cf. EXTREMELY IMPORTANT
+NOTE #1 in README.md). So a change of height is only started during
+the moves before it (the moves since the last write, or change of
+height) if it's safe for the rest of them:
+- going up (z gets bigger as the objective goes up; cf. mm2rotdata in
+  execute_commands.py), the objective is never lower than it would have
+  been, so it's started as the first of the moves starts;
+- going down, it's started as the first move starts from which every
+  move left (where each starts and ends) is inside the sample region,
+  by margin (mm); since the region is a rectangle, the moves between
+  are too. If the last move doesn't end inside it (e.g., it isn't
+  known where it starts, or the move runs on past the region to
+  overscan a line), it's started after the moves, as it would be
+  otherwise.
+A change of height from an unknown height is always made after the
+moves. Writes (lines and arcs) and the next change of height always
+wait for it to finish.
+"""
+
+
+import numpy as np
+
+from trajectory import MOVE, Z
+
+
+# HEIGHT STARTS
+# Returns, for each segment of trajectory, the index of the segment it
+#   is started with: for a change of height that can be made during
+#   the moves before it (cf. above), the first of those moves it's made
+#   during; for every other segment, its own index. region_size (mm) is
+#   the size of the sample region (REGION_SIZE), in whose frame the
+#   trajectory's positions are.
+def height_starts(trajectory, region_size, margin = 0.0):
+    s = trajectory.segments
+    kind = s["kind"]
+    starts = np.arange(len(s))
+
+    # whether each move is inside the region (NaN is never inside)
+    width, height = region_size
+    points = np.column_stack((s["x0"], s["y0"], s["x1"], s["y1"]))
+    inside = np.all((points >= margin) & (points <= np.array([width, height, width, height]) - margin), axis = 1)
+    inside &= kind == MOVE
+
+    for i in np.flatnonzero(kind == Z):
+        first = i
+        while first > 0 and kind[first - 1] == MOVE:
+            first -= 1
+        if first == i or not (np.isfinite(s["z"][i - 1]) and np.isfinite(s["z"][i])):
+            continue
+
+        if s["z"][i] > s["z"][i - 1]:
+            starts[i] = first
+        else:
+            # (the first move from which every move left is inside)
+            start = i
+            while start > first and inside[start - 1]:
+                start -= 1
+            starts[i] = start
+    return starts
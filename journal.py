@@ -0,0 +1,90 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	journal.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Keeps track, in a small file beside the sample's data file, of how many
+segments of a trajectory (cf. trajectory.py) have been written, so that
+if the writing is interrupted (e.g., Ctrl-C, a serial timeout, or an
+error from a stage), it can be carried on from the segment it stopped
+at, rather than from the start (cf. RESUME in execute_commands.py).
+
+The file is a line of JSON per record: first, the trajectory's
+fingerprint (a hash of its segments), then a record as each segment (or
+chain of segments written together; cf. CONTOUR_POLYLINES) is done, and
+last, how the writing ended ("finished" or "stopped"). Each record is
+flushed to disk before the next segment is written, so the file is up
+to date however the program ends. A segment that was being written when
+it stopped is written again from its start.
+
+The fingerprint ties the file to the trajectory it was written for, so
+that a run isn't resumed from a file for different commands (e.g., if
+the sample file or OVERSCAN has changed since).
+"""
+
+
+import hashlib
+import json
+import os
+
+
+class Journal(object):
+
+    def __init__(self, path, trajectory, name = ""):
+        # path: where to keep the file
+        # trajectory: what's being written
+        # name: e.g., the sample's name, for the file
+        self.path = path
+        self.name = name
+        self.segments = len(trajectory)
+        self.commands = trajectory.command
+        self.fingerprint = hashlib.sha1(trajectory.segments.tobytes()).hexdigest()
+        self._file = None
+
+    # Returns how many segments were written by the run in the file, 0 if
+    #   there isn't one, or None if it was for a different trajectory
+    def resume_point(self):
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return 0
+
+        done = 0
+        for number, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # (the last line, if it was cut off as it was written)
+                continue
+            if number == 0:
+                if record.get("fingerprint") != self.fingerprint or record.get("segments") != self.segments:
+                    return None
+            elif "done" in record:
+                done = max(done, record["done"])
+        return min(done, self.segments)
+
+    # Starts the file, for a run that starts at segment done: a new one if
+    #   done is 0, otherwise the one being resumed, added to
+    def start(self, done = 0):
+        self._file = open(self.path, "a" if done else "w")
+        if not done:
+            self._write({"name": self.name, "fingerprint": self.fingerprint, "segments": self.segments})
+
+    # Records that the first done segments are written
+    def update(self, done):
+        if self._file is not None:
+            command = int(self.commands[done - 1]) if done else None
+            self._write({"done": int(done), "command": command})
+
+    def finish(self, state = "finished"):
+        if self._file is not None:
+            self._write({"state": state})
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
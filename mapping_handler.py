@@ -19,31 +19,33 @@ means that paths predicted here may vary from those that are actually
 followed; in particular, I am uncertain about the angular direction the
 stages move when tracing a circle. Thankfully, verifying these predicted
 paths should only entail writing a series of commands to an actual
-sample and comparing the written pattern to the predicted one; if there
-are discrepancies, I'd recommend updating the code (below) that renders
-the prediction, rather than the code that actually writes to the samples.
+sample and comparing the written pattern to the predicted one.
+
+The paths drawn here are compiled by trajectory.py, from which
+execute_commands.py writes them too, so any discrepancy has to be fixed
+there (once), and applies to both.
 """
 
 
 import numpy as np
 import math
 import re
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import matplotlib.lines as mlines
-from matplotlib.widgets import Button
 
-from matplotlib.patches import Rectangle, Circle, Arc
 from coordinates import V2
+from trajectory import Trajectory, TrajectoryBuilder, MOVE, LINE, ARC, Z
+from travel_optimizer import optimize_travel, travel_time
+from overscan import add_overscan
+from height_batching import batch_heights, height_changes
 
-from datetime import datetime
-from pytz import timezone
+# matplotlib (and pytz) are only imported once they're needed, so that
+#   sample files can be compiled and run without them (cf. compile)
 
 
 
 class MappingHandler(object):
     
-    def __init__(self, path_prefix, sample_name, connect_keithley, default_speed):
+    def __init__(self, path_prefix, sample_name, connect_keithley, default_speed, optimize_travel = False,
+                 overscan_accel = None, motion_model = None, batch_heights = False):
 
         self.path_prefix = path_prefix
         self.sample_name = sample_name
@@ -56,6 +58,28 @@ class MappingHandler(object):
         self.connect_keithley = connect_keithley
 
         self.default_speed = default_speed
+
+        # If True, the new commands' writes are reordered to shorten the
+        #   moves between them (cf. travel_optimizer.py); "## ORDER" in
+        #   the sample file keeps the commands above it before those
+        #   below it
+        self.optimize_travel = optimize_travel
+
+        # If True, the new commands are put in order of height, so that
+        #   the objective changes height as few times as it can (cf.
+        #   height_batching.py); "## ORDER" in the sample file holds
+        #   them as for optimize_travel
+        self.batch_heights = batch_heights
+
+        # If given, the new commands' lines are overscanned for stages
+        #   that speed up and slow down at overscan_accel (mm/s^2; cf.
+        #   overscan.py)
+        self.overscan_accel = overscan_accel
+
+        # If given, a MotionTimeModel (cf. motion_time.py), from which
+        #   the time the new commands take is estimated; otherwise, it's
+        #   just their lengths over their speeds
+        self.motion_model = motion_model
         
         self.TR = V2((0, 0))
         self.GLOBAL_O = V2((0, 0))
@@ -63,387 +87,308 @@ class MappingHandler(object):
         self.local_o = V2((0, 0))
         self.curr_pos = V2((0, 0))
         self.new_file_text = ""
-        self.new_cmds_array = []
+        self.trajectory = None
+        self.full_trajectory = None
+        self.is_new = None
+        self.summary = ""
         self.continue_to_run = False
 
-    def draw_map(self):
-        fix, ax = plt.subplots(nrows=1, ncols=1, figsize=(5.5,6))
-        plt.subplots_adjust(bottom=0.2)
-
-        axbcancel = plt.axes([0.7, 0.05, 0.1, 0.075])
-        bcancel = Button(axbcancel, 'Cancel')
-        bcancel.on_clicked(self.cancel)
-        
-        axbrun = plt.axes([0.81, 0.05, 0.1, 0.075])
-        brun = Button(axbrun, 'Run')
-        brun.on_clicked(self.run)
-
+    # Reads the sample file and compiles its commands (cf. trajectory.py)
+    #   into self.full_trajectory, of which the new commands' segments
+    #   (self.is_new) are self.trajectory, what execute_commands.py
+    #   will run. Doesn't need matplotlib, so that commands can be run
+    #   without drawing them (cf. the run subcommand of execute_
+    #   commands.py). Returns False if the file isn't there.
+    def compile(self):
         try:
-            total_time = 0
-            curr_command = 0
-            in_new_cmds = False
-            
             log_file = open(self.path_prefix + self.sample_name + ".txt", "r") #, encoding = "UTF8")
-            
-            for line in log_file.readlines():
-
-                if len(line.rstrip()) > 0 and line[0] != "#":
-
-                    step_time = 0
-                    stripped_line = line.split("#")[0].rstrip()
-
-                    # setting GLOBAL_O, TR, or LOCAL_O
-                    if stripped_line.find("=") != -1 and stripped_line.find("=") < stripped_line.find("("):
-                        
-                        val = stripped_line.split("=",1)[0].rstrip()                        
-                        args = list(map(float, re.sub("[^0-9.,]","", stripped_line.split("=",1)[1].replace("V2","").replace("V3","")).split(",")))
-
-                        if val == "GLOBAL_O":
-                            self.GLOBAL_O = V2((args[0], args[1]))
-                        elif val == "TR":
-                            self.TR = V2((args[0], args[1]))
-                            self.REGION_SIZE = self.GLOBAL_O - self.TR
-                            ax.add_patch(Rectangle((0, 0), self.REGION_SIZE.x, self.REGION_SIZE.y, fill=None, alpha=1))
-                            plt.xlim(-0.05 * self.REGION_SIZE.x, 1.05 * self.REGION_SIZE.x)
-                            plt.ylim(-0.05 * self.REGION_SIZE.y, 1.05 * self.REGION_SIZE.y)
-                            ax.xaxis.set_ticks(np.arange(0,self.REGION_SIZE.x,2))
-                            ax.yaxis.set_ticks(np.arange(0,self.REGION_SIZE.y,2))
-                            ax.set_aspect('equal', adjustable='box')
-                        elif val == "LOCAL_O":
-                            self.local_o = V2((args[0], args[1]))
+        except FileNotFoundError:
+            print("{}{} not found.".format(self.path_prefix, self.sample_name))
+            return False
 
-                        self.new_file_text += line
+        curr_command = 0
+        in_new_cmds = False
 
-                    # calling command
-                    else:
-                        
-                        curr_command += 1
-                        
-                        cmd = stripped_line.split("(",1)[0]
-                        
-                        # separates out arguments, omitting lists (e.g., "speeds" array in write_parallel_lines_vertical_region_tall)
-
-                        args_str = stripped_line.split("(",1)[1].replace("V2","").replace("V3","")
-                        array_arg = re.search("\[.*?\]", args_str)
-                        
-                        if array_arg:
-                            speeds = list(map(float, re.sub("\[|\]", "", array_arg.group(0)).split(",")))
-                            args_str = re.sub("\[.*?\]", "{}".format(len(speeds)), args_str)
-                        args = list(map(float, re.sub("[^0-9.,-]", "", args_str).split(",")))
-
-
-                        
-                        # write_parallel_lines_vertical_continuous(z, start, end, gap, speed)
-                        if cmd == "write_parallel_lines_vertical_continuous":
-                            start = self.local_o + V2((args[1], args[2]))
-                            end = self.local_o + V2((args[3], args[4]))
-                            gap = args[5]
-                            shift = V2((gap, 0))
-                            speed = args[6]
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-
-                            num_lines = int(abs((end - start).x)/float(shift.x))
-                            for i in range(0, num_lines, 2):
-                                step_time += self.render_write_line(ax, start + shift*i, V2((start.x, end.y)) + shift*i, speed, in_new_cmds)
-                                step_time += self.render_write_line(ax, V2((start.x, end.y)) + shift*(i + 1), start + shift*(i + 1), speed, in_new_cmds)
-
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], start, end, gap, speed))
+        # every command, old and new, is compiled into one trajectory;
+        #   the new ones are what execute_commands.py will run
+        builder = TrajectoryBuilder(default_speed = self.default_speed, position = self.curr_pos)
+        new_commands = []
+        fences = []
 
-    
-                        # write_parallel_lines_horizontal_continuous(z, start, end, gap, speed)
-                        elif cmd == "write_parallel_lines_horizontal_continuous":
-                            start = self.local_o + V2((args[1], args[2]))
-                            end = self.local_o + V2((args[3], args[4]))
-                            gap = args[5]
-                            speed = args[6]
-                            shift = V2((0, gap))
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-
-                            num_lines = int(abs((end - start).y)/float(shift.y))
-                            for i in range(0, num_lines, 2):
-                                step_time += self.render_write_line(ax, start + shift*i, V2((end.x, start.y)) + shift*i, speed, in_new_cmds)
-                                step_time += self.render_write_line(ax, V2((end.x, start.y)) + shift*(i + 1), start + shift*(i + 1), speed, in_new_cmds)
-
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], start, end, gap, speed))
+        for line in log_file.readlines():
 
-    
-                        # write_parallel_lines_vertical_region_tall(z, speeds, gap, inter_speed_gap_factor = 0.2)
-                        elif cmd == "write_parallel_lines_vertical_region_tall":
+            if len(line.rstrip()) > 0 and line[0] != "#":
 
-                            start = self.local_o + V2((0, -1))
-                            end = self.local_o + V2((0, self.REGION_SIZE.y + 1))
-                            gap = args[2]
-                            inter_speed_gap_factor = 0.2 if len(args) < 4 else args[3]
-                            shift = V2(((2 + inter_speed_gap_factor)*gap, 0))
+                stripped_line = line.split("#")[0].rstrip()
 
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-                            for i in range(len(speeds)):
-                                speed = speeds[i]
+                # setting GLOBAL_O, TR, or LOCAL_O
+                if stripped_line.find("=") != -1 and stripped_line.find("=") < stripped_line.find("("):
+                    
+                    val = stripped_line.split("=",1)[0].rstrip()                        
+                    args = list(map(float, re.sub("[^0-9.,]","", stripped_line.split("=",1)[1].replace("V2","").replace("V3","")).split(",")))
+
+                    if val == "GLOBAL_O":
+                        self.GLOBAL_O = V2((args[0], args[1]))
+                    elif val == "TR":
+                        self.TR = V2((args[0], args[1]))
+                        self.REGION_SIZE = self.GLOBAL_O - self.TR
+                        builder.region_size = (self.REGION_SIZE.x, self.REGION_SIZE.y)
+                    elif val == "LOCAL_O":
+                        self.local_o = V2((args[0], args[1]))
+                        builder.local_o = (self.local_o.x, self.local_o.y)
 
-                                step_time += self.render_write_line(ax, start + shift*i, end + shift*i, speed, in_new_cmds)
-                                step_time += self.render_write_line(ax, end + shift*i + V2((gap, 0)), start + shift*i + V2((gap, 0)), speed, in_new_cmds)
+                    self.new_file_text += line
 
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], speeds, gap, inter_speed_gap_factor))
+                # calling command
+                else:
+                    
+                    curr_command += 1
+                    
+                    cmd = stripped_line.split("(",1)[0]
+                    
+                    # separates out arguments, omitting lists (e.g., "speeds" array in write_parallel_lines_vertical_region_tall)
 
-    
-                        # write_parallel_lines_horizontal_region_wide(z, speeds, gap, inter_speed_gap_factor = 0.2)
-                        elif cmd == "write_parallel_lines_horizontal_region_wide":
+                    args_str = stripped_line.split("(",1)[1].replace("V2","").replace("V3","")
+                    array_arg = re.search("\[.*?\]", args_str)
+                    
+                    if array_arg:
+                        # (a list of V2's, e.g., write_polyline's points, comes out as x, y, x, y, ...)
+                        speeds = list(map(float, re.sub("[^0-9.,-]", "", array_arg.group(0)).split(",")))
+                        args_str = re.sub("\[.*?\]", "{}".format(len(speeds)), args_str)
+                    args = list(map(float, re.sub("[^0-9.,-]", "", args_str).split(",")))
+
+                    # compiled by the same code that execute_commands.py
+                    #   runs (cf. trajectory.py); unknown commands are skipped
+                    call_args = self.command_args(cmd, args, speeds if array_arg else None)
+                    if call_args is not None:
+                        builder.command = curr_command
+                        getattr(builder, cmd)(*call_args)
+                        if in_new_cmds:
+                            new_commands.append(curr_command)
 
-                            start = self.local_o + V2((-1, 0))
-                            end = self.local_o + V2((self.REGION_SIZE.x + 1, 0))
-                            gap = args[2]
-                            inter_speed_gap_factor = 0.2 if len(args) < 4 else args[3]
-                            shift = V2((0, (2 + inter_speed_gap_factor)*gap))
+                    if in_new_cmds:
+                        self.new_file_text += line.rstrip() + "\t\t# [{}]\n".format(curr_command)
+                    else:
+                        self.new_file_text += line
 
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-                            for i in range(len(speeds)):
-                                speed = speeds[i]
+            # reset local origin for new commands
+            # NOTE: don't change the ## NEW header in the template sample file
+            elif line[0:6] == "## NEW":
+                
+                # (only needed to date the new commands)
+                from datetime import datetime
+                from pytz import timezone
 
-                                step_time += self.render_write_line(ax, start + shift*i, end + shift*i, speed, in_new_cmds)
-                                step_time += self.render_write_line(ax, end + shift*i + V2((0, gap)), start + shift*i + V2((0, gap)), speed, in_new_cmds)
+                in_new_cmds = True
 
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], speeds, gap, inter_speed_gap_factor))
+                self.new_file_text = self.new_file_text.rstrip() + "\n\n# " + datetime.now(timezone("US/Eastern")).strftime("%Y-%m-%d %H:%M:%S") + "\n"
+                self.new_file_text += "LOCAL_O = V2((0, 0))\n"
+                self.local_o = V2((0, 0))
+                self.curr_pos = self.TR*(-1)
+                builder.local_o = (0, 0)
+                builder.position = (self.curr_pos.x, self.curr_pos.y)
+                builder.z = None
+                
+                #curr_power = 0
 
-    
-                        # write_parallel_lines_horizontal_const_height(z, x_width, speeds, gap, inter_speed_gap_factor = 0.2)
-                        elif cmd == "write_parallel_lines_horizontal_const_height":
-
-                            x_width = args[1]
-                            start = self.local_o
-                            end = self.local_o + V2((x_width, 0))
-                            gap = args[3]
-                            inter_speed_gap_factor = 0.2 if len(args) < 5 else args[4]
-                            shift = V2((0, (2 + inter_speed_gap_factor)*gap))
-
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-                            for i in range(len(speeds)):
-                                speed = speeds[i]
-
-                                step_time += self.render_write_line(ax, start + shift*i, end + shift*i, speed, in_new_cmds)
-                                step_time += self.render_write_line(ax, end + shift*i + V2((0, gap)), start + shift*i + V2((0, gap)), speed, in_new_cmds)
-
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], x_width, speeds, gap, inter_speed_gap_factor))
-
-
-                        # write_parallel_lines_gap(z, start, end, gap, speed, num_lines)
-                        elif cmd == "write_parallel_lines_gap":
-                            
-                            start = self.local_o + V2((args[1], args[2]))
-                            end = self.local_o + V2((args[3], args[4]))
-                            gap = args[5]
-                            speed = args[6]
-                            num_lines = int(args[7])
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-                            
-                            direction = end - start
-                            shift = direction.unit.perpendicular_clk * gap
-                            for i in range(num_lines):
-                                step_time += self.render_write_line(ax, start + shift*i, end + shift*i, speed, in_new_cmds)
-
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], start, end, gap, speed, num_lines))
-
-                        # write_parallel_lines_delta_s(z, start, end, gap_dist, speed, delta_speed, num_lines_per_speed, num_speeds)
-                        elif cmd == "write_parallel_lines_delta_s":
-                            
-                            start = self.local_o + V2((args[1], args[2]))
-                            end = self.local_o + V2((args[3], args[4]))
-                            gap_dist = args[5]
-                            speed = args[6]
-                            delta_speed = args[7]
-                            num_lines_per_speed = int(args[8])
-                            num_speeds = int(args[9])
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-                            
-                            direction = end - start
-                            shift = direction.unit.perpendicular_clk * gap_dist
-                            inter_speed_spacer = shift * (num_lines_per_speed + (0.7 if num_lines_per_speed > 1 else 0))
-                            for i in range(num_speeds):
-
-                                for j in range(num_lines_per_speed):
-                                    step_time += self.render_write_line(ax, start + inter_speed_spacer*i + shift*j, end + inter_speed_spacer*i + shift*j, speed + i*delta_speed, in_new_cmds)
-
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], start, end, gap_dist, speed, delta_speed, num_lines_per_speed, num_speeds))
+            elif line[0:8] == "## ORDER":
 
-    
-                        # write_line(start, end, speed)
-                        elif cmd == "write_line":
-                            
-                            start = self.local_o + V2((args[0], args[1]))
-                            end = self.local_o + V2((args[2], args[3]))
-                            speed = args[4]
+                fences.append(curr_command + 1)
+                self.new_file_text += line
 
-                            ax.annotate(curr_command, xy=(start.x, start.y))
-                            step_time += self.render_write_line(ax, start, end, speed, in_new_cmds)
+            elif line[0:6] == "## REF":
+                
+                in_new_cmds = False
+                self.new_file_text += "\n\n\n\n## NEW COMMANDS\n\n\n\n\n\n" + line
 
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, start, end, speed))
+            # include newlines and comments
+            elif line[0] == "#" or not in_new_cmds:
+                self.new_file_text += line
 
-    
-                        # write_circle(center, radius, speed)
-                        elif cmd == "write_circle":
-                            
-                            center = self.local_o + V2((args[0], args[1]))
-                            radius = args[2]
-                            speed = args[3]
-                            color = '#DF8800' if in_new_cmds else '#149E27'
-                            
-                            start = V2((center.x + radius, center.y))
-                            ax.annotate(curr_command, xy=(start.x, start.y))     #args[-1][2:], xy=(start.x, start.y))
-                            ax.add_patch(Circle((center.x, center.y), radius = radius, fill=None, alpha=1, color=color, linewidth=1.5))
-
-                            if in_new_cmds:
-                                step_time += self.render_move_to_start(ax, start) + 2*np.pi*radius / speed
-                                self.new_cmds_array.append((cmd, center, radius, speed))
-
-                            self.curr_pos.setXY(start)
 
-    
-                        # write_part_circle(center, radius, start_deg, end_deg, speed)
-                        elif cmd == "write_part_circle":
-                            
-                            center = self.local_o + V2((args[0], args[1]))
-                            radius = args[2]
-                            start_deg = args[3]
-                            end_deg = args[4]
-                            speed = args[5]
-                            color = '#DF8800' if in_new_cmds else '#149E27'
-                            
-                            start = center + V2(start_deg)*radius
-                            ax.annotate(curr_command, xy=(start.x, start.y))     #args[-1][2:], xy=(start.x, start.y))
-                            ax.add_patch(Arc((center.x, center.y), 2*radius, 2*radius, 0, start_deg, end_deg, fill=None, alpha=1, color=color, linewidth=1.5))
-                           
-                            if in_new_cmds:
-                                step_time += self.render_move_to_start(ax, start) + 2*np.pi*(end_deg - start_deg)*radius / (360*speed)
-                                self.new_cmds_array.append((cmd, center, radius, start_deg, end_deg, speed))
-
-                            self.curr_pos.setXY(center + V2(end_deg)*radius)
-
-
-                        # outline_region(z, speed = None)
-                        # DON'T CORRECT FOR LOCAL_O
-                        elif cmd == "outline_region":
-                            
-                            speed = self.default_speed if len(args) < 2 else args[1]
-
-                            ax.annotate(curr_command, xy=(-0.1, -0.1))
-                            step_time += self.render_write_line(ax, V2((-0.1,-0.1)), V2((-0.1, self.REGION_SIZE.y + 0.1)), speed, in_new_cmds)
-                            step_time += self.render_write_line(ax, V2((-0.1, self.REGION_SIZE.y + 0.1)), self.REGION_SIZE + V2((0.1, 0.1)), speed, in_new_cmds)
-                            step_time += self.render_write_line(ax, self.REGION_SIZE + V2((0.1, 0.1)), V2((self.REGION_SIZE.x + 0.1, -0.1)), speed, in_new_cmds)
-                            step_time += self.render_write_line(ax, V2((self.REGION_SIZE.x + 0.1, -0.1)), V2((-0.1,-0.1)), speed, in_new_cmds)
-
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], speed))
-
-
-                        # wipe_region(z, gap = 0.08, speed = None)
-                        # DON'T CORRECT FOR LOCAL_O
-                        elif cmd == "wipe_region":
-                            
-                            gap = args[1]
-                            speed = self.default_speed if len(args) < 3 else args[2]
-
-                            for i in range(int(self.REGION_SIZE.y / (2*gap)) + 1):
-                                step_time += self.render_write_line(ax, V2((-1, gap * 2*i)), V2((self.REGION_SIZE.x + 1, gap * 2*i)), speed, in_new_cmds)
-                                step_time += self.render_write_line(ax, V2((self.REGION_SIZE.x + 1, gap * (2*i + 1))), V2((-1, gap * (2*i + 1))), speed, in_new_cmds)
-                        
-                            if in_new_cmds:
-                                self.new_cmds_array.append((cmd, args[0], gap, speed))
-
-                        
-                        # move_to(point, ground_speed = None, laser_on = False)
-                        elif cmd == "move_to":
-                                         
-                            if in_new_cmds:
-                                point = self.local_o + V2((args[0], args[1]))
-                                speed = self.default_speed if len(args) < 3 else args[2]
-
-                                ax.annotate(curr_command, xy=(self.curr_pos.x, self.curr_pos.y))
-                                step_time += self.render_move_to_start(ax, point, speed)
-                                self.new_cmds_array.append((cmd, point, speed))
-
-                        
-                        if in_new_cmds:
-                            total_time += step_time
-                            self.new_file_text += line.rstrip() + "\t\t# [{}]\n".format(curr_command)
-                        else:
-                            self.new_file_text += line
-
-                # reset local origin for new commands
-                # NOTE: don't change the ## NEW header in the template sample file
-                elif line[0:6] == "## NEW":
-                    
-                    in_new_cmds = True
+        log_file.close()
 
-                    self.new_file_text = self.new_file_text.rstrip() + "\n\n# " + datetime.now(timezone("US/Eastern")).strftime("%Y-%m-%d %H:%M:%S") + "\n"
-                    self.new_file_text += "LOCAL_O = V2((0, 0))\n"
-                    self.local_o = V2((0, 0))
-                    self.curr_pos = self.TR*(-1)
-                    
-                    #curr_power = 0
+        trajectory = builder.build()
+        is_new = np.isin(trajectory.command, new_commands)
+        self.trajectory = trajectory[is_new]
+        self.summary = ""
+        if self.batch_heights:
+            before, before_time = height_changes(self.trajectory), self.rotary_time(self.trajectory)
+            self.trajectory = batch_heights(self.trajectory, self.default_speed, fences)
+            after, after_time = height_changes(self.trajectory), self.rotary_time(self.trajectory)
+            trajectory = Trajectory(np.concatenate((trajectory[~is_new].segments, self.trajectory.segments)))
+            is_new = np.arange(len(trajectory)) >= np.count_nonzero(~is_new)
+            self.summary = "height changes: {} ({} s) -> {} ({} s)".format(before, int(10*before_time)/10.0,
+                                                                           after, int(10*after_time)/10.0)
+        if self.optimize_travel:
+            before = travel_time(self.trajectory)
+            self.trajectory = optimize_travel(self.trajectory, self.default_speed, fences)
+            after = travel_time(self.trajectory)
+            trajectory = Trajectory(np.concatenate((trajectory[~is_new].segments, self.trajectory.segments)))
+            is_new = np.arange(len(trajectory)) >= np.count_nonzero(~is_new)
+            self.summary += ("\n" if self.summary else "") + \
+                "shutter closed: {} s -> {} s".format(int(10*before)/10.0, int(10*after)/10.0)
+        if self.overscan_accel is not None:
+            before = self.estimate_time(self.trajectory)
+            self.trajectory = add_overscan(self.trajectory, self.overscan_accel)
+            after = self.estimate_time(self.trajectory)
+            trajectory = Trajectory(np.concatenate((trajectory[~is_new].segments, self.trajectory.segments)))
+            is_new = np.arange(len(trajectory)) >= np.count_nonzero(~is_new)
+            self.summary += ("\n" if self.summary else "") + "overscan: +{} s".format(int(10*(after - before))/10.0)
+        self.full_trajectory = trajectory
+        self.is_new = is_new
+        return True
+
+    # Returns how long (s) each segment of trajectory will take to write
+    def estimate_times(self, trajectory):
+        if self.motion_model is not None:
+            return self.motion_model.segment_times(trajectory)
+        return trajectory.durations()
+
+    # Returns how long (s) trajectory will take to write
+    def estimate_time(self, trajectory):
+        return float(self.estimate_times(trajectory).sum())
+
+    # Returns how long (s) the objective will spend changing height
+    #   along trajectory
+    def rotary_time(self, trajectory):
+        return float(self.estimate_times(trajectory)[trajectory.kind == Z].sum())
+
+    # Returns how long the new commands will take, e.g., "12.3 s = 0.2 min"
+    def time_summary(self):
+        total_time = self.estimate_time(self.trajectory)
+        summary = "{} s = {} min".format(int(10*total_time)/10.0, int(100*total_time/60.0)/100.0)
+        return summary + ("\n" + self.summary if self.summary else "")
 
-                elif line[0:6] == "## REF":
-                    
-                    in_new_cmds = False
-                    self.new_file_text += "\n\n\n\n## NEW COMMANDS\n\n\n\n\n\n" + line
+    def draw_map(self):
+        if not self.compile():
+            return
 
-                # include newlines and comments
-                elif line[0] == "#" or not in_new_cmds:
-                    self.new_file_text += line
+        import matplotlib.pyplot as plt
+        from matplotlib.widgets import Button
+        from matplotlib.patches import Rectangle
 
+        fix, ax = plt.subplots(nrows=1, ncols=1, figsize=(5.5,6))
+        plt.subplots_adjust(bottom=0.2)
 
-            log_file.close()
-            
-            plt.text(-110.0, 3.0, "{} s = {} min".format(int(10*total_time)/10.0, int(100*total_time/60.0)/100.0), fontsize=12)
-            plt.show()
-    
-        except FileNotFoundError:
-            print("{}{} not found.".format(self.path_prefix, self.sample_name))
+        axbcancel = plt.axes([0.7, 0.05, 0.1, 0.075])
+        bcancel = Button(axbcancel, 'Cancel')
+        bcancel.on_clicked(self.cancel)
+        
+        axbrun = plt.axes([0.81, 0.05, 0.1, 0.075])
+        brun = Button(axbrun, 'Run')
+        brun.on_clicked(self.run)
+
+        ax.add_patch(Rectangle((0, 0), self.REGION_SIZE.x, self.REGION_SIZE.y, fill=None, alpha=1))
+        plt.xlim(-0.05 * self.REGION_SIZE.x, 1.05 * self.REGION_SIZE.x)
+        plt.ylim(-0.05 * self.REGION_SIZE.y, 1.05 * self.REGION_SIZE.y)
+        ax.xaxis.set_ticks(np.arange(0,self.REGION_SIZE.x,2))
+        ax.yaxis.set_ticks(np.arange(0,self.REGION_SIZE.y,2))
+        ax.set_aspect('equal', adjustable='box')
+
+        self.render_trajectory(ax, self.full_trajectory, self.is_new)
+
+        plt.text(-110.0, 3.0, self.time_summary(), fontsize=12)
+        plt.show()
 
 
     def run(self, event):
-        plt.close()
+        import matplotlib.pyplot as plt
+
         self.continue_to_run = True
+        plt.close()
 
 
     def cancel(self, event):
-        plt.close()
-        self.continue_to_run = False
-
+        import matplotlib.pyplot as plt
 
-    # returns the duration of the write
-    def render_write_line(self, ax, start, end, speed, is_new):
+        self.continue_to_run = False
+        plt.close()
 
-        t = 0
-        color = '#DF8800' if is_new else '#149E27'        # i.e., orange if new;  else green
-        
-        if is_new:
-            t += self.render_move_to_start(ax, start)
-        
-        l = mlines.Line2D([start.x, end.x], [start.y, end.y], color=color)
-        ax.add_line(l)
-        self.curr_pos.setXY(end)
-        return t + (end - start.asV2()).magnitude / speed
 
-    def render_move_to_start(self, ax, start, speed = None):
-        
-        if speed == None:
-            speed = self.default_speed
-        
-        if start != self.curr_pos.asV2():       # then at least calculate the time to move to start
-            if (not self.connect_keithley):          # then map move to start
-                l = mlines.Line2D([self.curr_pos.x, start.x], [self.curr_pos.y, start.y], linestyle=':', color='lightgray')
-                ax.add_line(l)
-            dist = (start - self.curr_pos.asV2()).magnitude
-            self.curr_pos.setXY(start)
-            return dist / speed
-        return 0
+    # Returns the arguments of the TrajectoryBuilder method for cmd, as
+    #   parsed from a line of the sample file (speeds is the list
+    #   argument, if there is one), or None if cmd isn't a command
+    def command_args(self, cmd, args, speeds):
+        if cmd in ("write_parallel_lines_vertical_continuous", "write_parallel_lines_horizontal_continuous"):
+            # (z, start, end, gap, speed)
+            return (args[0], V2((args[1], args[2])), V2((args[3], args[4])), args[5], args[6])
+        elif cmd in ("write_parallel_lines_vertical_region_tall", "write_parallel_lines_horizontal_region_wide"):
+            # (z, speeds, gap, inter_speed_gap_factor = 0.2)
+            return (args[0], speeds, args[2], 0.2 if len(args) < 4 else args[3])
+        elif cmd == "write_parallel_lines_horizontal_const_height":
+            # (z, x_width, speeds, gap, inter_speed_gap_factor = 0.2)
+            return (args[0], args[1], speeds, args[3], 0.2 if len(args) < 5 else args[4])
+        elif cmd == "write_parallel_lines_gap":
+            # (z, start, end, gap, speed, num_lines)
+            return (args[0], V2((args[1], args[2])), V2((args[3], args[4])), args[5], args[6], int(args[7]))
+        elif cmd == "write_parallel_lines_delta_s":
+            # (z, start, end, gap_dist, speed, delta_speed, num_lines_per_speed, num_speeds)
+            return (args[0], V2((args[1], args[2])), V2((args[3], args[4])), args[5], args[6], args[7],
+                    int(args[8]), int(args[9]))
+        elif cmd == "write_line":
+            # (start, end, speed)
+            return (V2((args[0], args[1])), V2((args[2], args[3])), args[4])
+        elif cmd == "write_polyline":
+            # (points, speed)
+            return ([V2((x, y)) for x, y in zip(speeds[0::2], speeds[1::2])], args[1])
+        elif cmd == "write_circle":
+            # (center, radius, speed)
+            return (V2((args[0], args[1])), args[2], args[3])
+        elif cmd == "write_part_circle":
+            # (center, radius, start_deg, end_deg, speed)
+            return (V2((args[0], args[1])), args[2], args[3], args[4], args[5])
+        elif cmd == "outline_region":
+            # (z, speed = None)
+            return (args[0], None if len(args) < 2 else args[1])
+        elif cmd == "wipe_region":
+            # (z, gap = 0.08, speed = None)
+            return (args[0], 0.08 if len(args) < 2 else args[1], None if len(args) < 3 else args[2])
+        elif cmd == "move_to":
+            # (point, ground_speed = None); will always render with laser_on = False
+            return (V2((args[0], args[1])), None if len(args) < 3 else args[2])
+        return None
+
+    # Draws the trajectory: lines and arcs orange if is_new, else green;
+    #   moves between them (new commands only) as gray, dotted lines,
+    #   unless the shutter closes for them. Lead-ins and lead-outs of
+    #   overscanned lines (cf. overscan.py) are drawn in light gray
+    #   either way, since the stages go that far. Each command is
+    #   labelled with its number where it starts writing.
+    def render_trajectory(self, ax, trajectory, is_new):
+        from matplotlib.collections import LineCollection
+        from matplotlib.patches import Arc
+
+        kind = trajectory.kind
+        colors = np.where(is_new, '#DF8800', '#149E27')       # i.e., orange if new;  else green
+        segments = np.stack((trajectory.starts, trajectory.ends), axis = 1)
+
+        lines = kind == LINE
+        ax.add_collection(LineCollection(segments[lines], colors = colors[lines]), autolim = False)
+
+        leads = np.concatenate((np.stack((trajectory.run_starts, trajectory.starts), axis = 1)[trajectory.segments["lead_in"] > 0],
+                                np.stack((trajectory.ends, trajectory.run_ends), axis = 1)[trajectory.segments["lead_out"] > 0]))
+        ax.add_collection(LineCollection(leads, colors = "lightgray"), autolim = False)
+
+        if not self.connect_keithley:          # then map moves to start
+            moves = (kind == MOVE) & is_new
+            ax.add_collection(LineCollection(segments[moves], linestyles = ":", colors = "lightgray"), autolim = False)
+
+        for arc, color in zip(trajectory.segments[kind == ARC], colors[kind == ARC]):
+            ax.add_patch(Arc((arc["center_x"], arc["center_y"]), 2*arc["radius"], 2*arc["radius"], angle=0,
+                             theta1=arc["start_deg"], theta2=arc["end_deg"], fill=None, alpha=1, color=color, linewidth=1.5))
+
+        # at the start of each command's first line or arc (or first move,
+        #   for move_to)
+        xy = trajectory.starts
+        labelled = kind != Z
+        writes = labelled & (kind != MOVE)
+        commands, first = np.unique(trajectory.command[labelled], return_index = True)
+        first = np.flatnonzero(labelled)[first]
+        write_commands, first_write = np.unique(trajectory.command[writes], return_index = True)
+        first[np.isin(commands, write_commands)] = np.flatnonzero(writes)[first_write]
+        for command, i in zip(commands, first):
+            ax.annotate(command, xy=(xy[i, 0], xy[i, 1]))
 
     def update_sample_history(self):
         log_file = open(self.path_prefix + self.sample_name + ".txt", "w")
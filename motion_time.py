@@ -0,0 +1,265 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	motion_time.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Estimates how long a compiled trajectory (cf. trajectory.py) takes to
+write, the way execute_commands.py writes it, so that the time shown
+with the mapping (and printed before a sample is run) is one that a
+session can be planned around. Trajectory.durations only divides each
+segment's length by its speed; this adds:
+- acceleration: each axis speeds up and slows down at the linear
+  stages' acceleration, over a trapezoid (or, for a move too short to
+  reach its speed, a triangle), and a move takes as long as its slower
+  axis (cf. move_to);
+- overscan: lines are as long as their lead-ins and lead-outs, and the
+  step at the end of a raster line overlaps the stages slowing down
+  (cf. overscan.py);
+- contouring: chains of lines take as long as their velocity schedule
+  (cf. polyline_schedule.py), rounded up to the tick;
+- arcs: as many ticks of delta_t as circle_schedule sends;
+- changes of height: the rotary stage, at its own speed and
+  acceleration;
+- the bus: a round trip for each command that's waited on (e.g., the
+  speeds before a move), and a move's latency (from the command to the
+  stages starting, and from their stopping to the reply);
+- the shutter: how long the stages wait for it to open.
+
+The accelerations, round trip and move latency can be fitted to a
+session recorded with RECORD_SESSION (cf. MotionTimeModel.calibrate);
+the shutter's time isn't on the bus, so it's whatever it's set to (e.g.,
+SHUTTER_OPEN_LATENCY).
+"""
+
+
+import numpy as np
+
+from trajectory import MOVE, LINE, ARC, Z
+from overscan import turns
+from polyline_schedule import polyline_duration
+
+# (s) from sending a command to its reply, for a command that replies at
+#   once (e.g., set target speed): 6 bytes each way at 9600 baud
+ROUND_TRIP = 0.0125
+
+# command numbers (cf. zaber/serial/binarydevice.py)
+HOME = 1
+MOVE_ABS = 20
+MOVE_REL = 21
+MOVE_VEL = 22
+STOP = 23
+SET_TARGET_SPEED = 42
+GET_POSITION = 60
+ERROR = 255
+
+
+# PROFILE TIME
+# Returns the time (s) an axis takes to go dist (mm, or deg) at up to
+#   speed (mm/s, or deg/s), speeding up and slowing down at accel (mm/s^2,
+#   or deg/s^2; np.inf for no acceleration): a trapezoid, speeding up
+#   for speed/accel and slowing down for as long, or, if dist is too
+#   short to reach speed, a triangle. Works on arrays.
+def profile_time(dist, speed, accel):
+    dist = np.abs(np.asarray(dist, dtype = float))
+    speed = np.asarray(speed, dtype = float)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        trapezoid = dist / speed + speed / accel
+        triangle = 2 * np.sqrt(dist / accel)
+        t = np.where(dist >= speed**2 / accel, trapezoid, triangle)
+    return np.where((dist > 0) & (speed > 0), t, 0.0)
+
+
+class MotionTimeModel(object):
+
+    def __init__(self, lin_accel, delta_t = 24, rot_speed = 15, rot_accel = np.inf, deg_per_mm = 9.2597,
+                 round_trip = ROUND_TRIP, move_latency = ROUND_TRIP, shutter_time = 0,
+                 contour = False, corner_deviation = 0.005):
+        # lin_accel: (mm/s^2) of the x- and y- stages
+        # delta_t: (ms) between the ticks of arcs and contoured chains
+        # rot_speed, rot_accel: (deg/s, deg/s^2) of the rotary stage;
+        #   deg_per_mm converts heights (mm) to its angles
+        # round_trip, move_latency: (s) cf. above
+        # shutter_time: (s) the stages wait for the shutter to open
+        # contour: True if chains of lines are contoured (cf.
+        #   CONTOUR_POLYLINES), cutting corners by up to
+        #   corner_deviation (mm)
+        self.lin_accel = lin_accel
+        self.delta_t = delta_t
+        self.rot_speed = rot_speed
+        self.rot_accel = rot_accel
+        self.deg_per_mm = deg_per_mm
+        self.round_trip = round_trip
+        self.move_latency = move_latency
+        self.shutter_time = shutter_time
+        self.contour = contour
+        self.corner_deviation = corner_deviation
+
+    """   estimates   """
+
+    # Returns the time (s) the x- and y- stages take to move by (dx, dy)
+    #   (mm) at speed (mm/s) along the line between, each axis at its
+    #   share of speed, as move_to sets them. Works on arrays.
+    def move_time(self, dx, dy, speed):
+        dx, dy = np.abs(np.asarray(dx, dtype = float)), np.abs(np.asarray(dy, dtype = float))
+        length = np.hypot(dx, dy)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            x_speed, y_speed = speed * dx / length, speed * dy / length
+        return np.maximum(profile_time(dx, x_speed, self.lin_accel), profile_time(dy, y_speed, self.lin_accel))
+
+    # Returns the time (s) the rotary stage takes to change height by dz
+    #   (mm). Works on arrays.
+    def z_time(self, dz):
+        return profile_time(np.abs(dz) * self.deg_per_mm, self.rot_speed, self.rot_accel)
+
+    # Returns how long (s) each segment of trajectory takes to write (0
+    #   for a move from an unknown position, or a change from an unknown
+    #   height)
+    def segment_times(self, trajectory):
+        s = trajectory.segments
+        kind = s["kind"]
+        times = np.zeros(len(s))
+        move_overhead = self.round_trip + self.move_latency
+
+        # moves and lines (with any overscan)
+        delta = trajectory.run_ends - trajectory.run_starts
+        straight = ((kind == MOVE) | (kind == LINE)) & np.all(np.isfinite(delta), axis = 1) & \
+                   (np.hypot(delta[:, 0], delta[:, 1]) > 0)
+        times[straight] = self.move_time(delta[straight, 0], delta[straight, 1], s["speed"][straight]) + move_overhead
+
+        # (expose holds a line back if the shutter takes longer to open
+        #   than the stages take to reach their speed)
+        lines = straight & (kind == LINE)
+        length = np.hypot(delta[lines, 0], delta[lines, 1])
+        axis_speed = s["speed"][lines] * np.abs(delta[lines]).max(axis = 1) / length
+        times[lines] += np.maximum(self.shutter_time - axis_speed / self.lin_accel, 0)
+
+        # turns start as the line before slows down, with their speed
+        #   sent along with the line's
+        turn = turns(trajectory) & straight
+        i = np.flatnonzero(turn)
+        line_delta = delta[i - 1]
+        line_speed = s["speed"][i - 1] * np.abs(line_delta).max(axis = 1) / np.hypot(line_delta[:, 0], line_delta[:, 1])
+        times[i] = np.maximum(times[i] - move_overhead - line_speed / self.lin_accel, 0)
+
+        # arcs: the ticks circle_schedule sends, then the stop
+        arcs = kind == ARC
+        ticks = np.ceil(1000 * trajectory.lengths()[arcs] / s["speed"][arcs] / self.delta_t) - 1
+        times[arcs] = np.maximum(ticks, 0) * self.delta_t / 1000 + self.round_trip + self.shutter_time
+
+        # changes of height, from the height of the segment before
+        zs = np.flatnonzero(kind == Z)
+        previous = np.where(zs > 0, s["z"][np.maximum(zs - 1, 0)], np.nan)
+        dz = s["z"][zs] - previous
+        times[zs] = np.where(np.isfinite(dz), self.z_time(np.nan_to_num(dz)) + self.move_latency, 0)
+
+        if self.contour:
+            self._contour_times(trajectory, times)
+        return times
+
+    # Replaces the times of the segments of each chain with the chain's
+    #   time, shared out by length (cf. trace_polyline)
+    def _contour_times(self, trajectory, times):
+        s = trajectory.segments
+        lengths = trajectory.lengths()
+        for i, n in zip(*trajectory.chains()):
+            chain = s[i:i + n]
+            points = np.column_stack((np.append(chain["x0"][:1], chain["x1"]), np.append(chain["y0"][:1], chain["y1"])))
+            _, end = polyline_duration(points, chain["speed"], self.delta_t, self.lin_accel, self.corner_deviation)
+            # (the stop, and the move_to that makes up any error at the end)
+            total = end + 2*self.round_trip + self.move_latency
+            if chain["laser"][0]:
+                total += self.shutter_time
+            share = lengths[i:i + n] / lengths[i:i + n].sum() if lengths[i:i + n].sum() > 0 else 1.0 / n
+            times[i:i + n] = total * share
+
+    def total_time(self, trajectory):
+        return float(self.segment_times(trajectory).sum())
+
+    """   calibration   """
+
+    # Fits lin_accel, move_latency, rot_accel and round_trip to the moves
+    #   in a session recorded with RECORD_SESSION (at path; cf. zaber/
+    #   serial/binaryrecorder.py): each move_abs whose start, speed and
+    #   reply are all in the recording gives a time against a distance
+    #   and speed. Data are converted to mm (linear_devices) or degrees
+    #   (rotary_devices) with the given factors (cf. define_operating_
+    #   constants). A value is only changed if there's enough in the
+    #   recording to fit it. Returns {name: value} of what was fitted,
+    #   with the number of moves of each kind.
+    def calibrate(self, path, data_per_mm, data_per_mm_speed, data_per_deg, data_per_deg_speed,
+                  message_id_devices = (), linear_devices = (2, 3), rotary_devices = (1,)):
+        from zaber.serial.binarycodec import FrameDecoder
+        from zaber.serial.binaryrecorder import RECEIVED, SENT, read_recording
+
+        _, records = read_recording(path)
+        decoder = FrameDecoder()
+        speed = {}              # device: target speed (data)
+        position = {}           # device: position (data), when known
+        moving = {}             # device: (sent at, target, start, speed)
+        speed_sent = {}         # device: when its speed was sent
+        round_trips = []
+        linear, rotary = [], []     # (distance, speed, seconds)
+
+        for t, direction, frame in records:
+            for device, command, data, _ in decoder.decode(frame, message_id_devices):
+                if direction == SENT:
+                    if command == SET_TARGET_SPEED:
+                        speed[device] = data
+                        speed_sent[device] = t
+                    elif command == MOVE_ABS and device in position and device in speed and device not in moving:
+                        moving[device] = (t, data, position.pop(device), speed[device])
+                    elif command in (HOME, MOVE_ABS, MOVE_REL, MOVE_VEL):
+                        position.pop(device, None)
+                elif direction == RECEIVED:
+                    if command == SET_TARGET_SPEED and device in speed_sent:
+                        round_trips.append(t - speed_sent.pop(device))
+                    elif command == MOVE_ABS and device in moving:
+                        sent_at, target, start, speed_data = moving.pop(device)
+                        if data == target and target != start and speed_data > 0:
+                            if device in linear_devices:
+                                linear.append((abs(target - start) / data_per_mm, speed_data / data_per_mm_speed, t - sent_at))
+                            elif device in rotary_devices:
+                                rotary.append((abs(target - start) / data_per_deg, speed_data / data_per_deg_speed, t - sent_at))
+                    elif command == ERROR:
+                        moving.pop(device, None)
+                    if command in (HOME, MOVE_ABS, MOVE_REL, STOP, GET_POSITION):
+                        position[device] = data
+
+        fitted = {"linear moves": len(linear), "rotary moves": len(rotary)}
+        if round_trips:
+            self.round_trip = fitted["round_trip"] = float(np.median(round_trips))
+        if linear:
+            self.lin_accel, self.move_latency = _fit_profile(linear, self.lin_accel, self.move_latency)
+            fitted["lin_accel"], fitted["move_latency"] = self.lin_accel, self.move_latency
+        if rotary:
+            self.rot_accel, _ = _fit_profile(rotary, self.rot_accel, self.move_latency)
+            fitted["rot_accel"] = self.rot_accel
+        return fitted
+
+
+# Returns (accel, latency) fitted to samples of (distance, speed,
+#   seconds), starting from accel and latency: a move long enough to
+#   reach its speed takes distance/speed + speed/accel + latency, which
+#   is linear in 1/accel and latency. Moves too short to reach their
+#   speed are left out. With fewer than two speeds among the moves,
+#   only latency is fitted.
+def _fit_profile(samples, accel, latency):
+    d, v, t = np.array(samples, dtype = float).T
+    for _ in range(10):
+        long_enough = d >= v**2 / accel
+        if not long_enough.any():
+            break
+        y = t[long_enough] - d[long_enough] / v[long_enough]
+        speeds = v[long_enough]
+        if len(np.unique(speeds)) < 2:
+            latency = float(np.mean(y - speeds / accel))
+            break
+        (inverse_accel, intercept), _, _, _ = np.linalg.lstsq(np.column_stack((speeds, np.ones_like(speeds))), y, rcond = None)
+        if inverse_accel <= 0:
+            break
+        converged = np.isclose(1 / inverse_accel, accel)
+        accel, latency = float(1 / inverse_accel), float(intercept)
+        if converged:
+            break
+    return accel, latency
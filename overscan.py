@@ -0,0 +1,120 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	overscan.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Extends the lines of a compiled trajectory (cf. trajectory.py) so that
+the stages are already up to speed when each line starts, and don't
+slow down until it ends. Without it, the stages speed up over the first
+part of a line and slow down over the last, and since the shutter has
+to be open for the whole line, its ends get a heavier dose.
+
+Each line is given a lead-in and a lead-out: the distance the stages
+cover while speeding up to (or slowing down from) the line's speed, at
+accel (mm/s^2). The move before the line is shortened or lengthened to
+end where the lead-in starts, and the move after it to start where the
+lead-out ends. move_to in execute_commands.py then runs the stages from
+the start of the lead-in to the end of the lead-out in one move, with
+the shutter open only while they move at constant speed (cf. expose),
+i.e., exactly along the line as compiled.
+
+Only lines on their own are overscanned, i.e., lines with a move (or
+nothing) on either side, such as those of write_parallel_lines_gap and
+wipe_region; chains of lines (e.g., write_polyline) are contoured
+instead (cf. CONTOUR_POLYLINES). A line gets no lead-in if there's no
+move before it to shift (e.g., the first segment of a trajectory), and
+no lead-out if there's no move after it.
+
+The lead-ins and lead-outs are part of the trajectory's lengths (and
+so its durations), and are drawn in the mapping, since the stages go
+that much further (e.g., past the region) either side of each line.
+
+Overscan is applied after the writes are reordered (cf. travel_
+optimizer.py), since it moves the ends of the moves between them.
+"""
+
+
+import numpy as np
+
+from trajectory import Trajectory, MOVE, LINE, ARC, Z
+
+
+# ADD OVERSCAN
+# Returns trajectory with a lead-in and lead-out added to each line on
+#   its own (cf. above), for stages that speed up and slow down at accel
+#   (mm/s^2)
+def add_overscan(trajectory, accel):
+    if len(trajectory) == 0:
+        return trajectory
+
+    segments = trajectory.segments.copy()
+    kind = segments["kind"]
+    n = len(segments)
+
+    # the segment before each (skipping a change of height, as comes
+    #   between the move to a pattern and its first line), and after
+    #   it; -1 if there isn't one
+    before = np.arange(n) - 1
+    before[1:][kind[:-1] == Z] -= 1
+    after = np.arange(n) + 1
+    after[after == n] = -1
+
+    def is_kind(index, kinds):
+        return (index >= 0) & np.isin(kind[np.maximum(index, 0)], kinds)
+
+    delta = np.column_stack((segments["x1"] - segments["x0"], segments["y1"] - segments["y0"]))
+    lengths = np.hypot(delta[:, 0], delta[:, 1])
+    lines = (kind == LINE) & np.isfinite(lengths) & (lengths > 0) & (segments["speed"] > 0)
+    lines &= ~is_kind(before, (LINE, ARC)) & ~is_kind(after, (LINE, ARC))
+
+    i = np.flatnonzero(lines)
+    direction = delta[i] / lengths[i, None]
+    lead = ramp_distance(segments["speed"][i], direction, accel)
+    run_start = np.column_stack((segments["x0"][i], segments["y0"][i])) - direction * lead[:, None]
+    run_end = np.column_stack((segments["x1"][i], segments["y1"][i])) + direction * lead[:, None]
+
+    # the moves either side are made to meet the lead-in and lead-out
+    #   (and a change of height between them is made where the lead-in
+    #   starts)
+    has_in = is_kind(before[i], (MOVE,))
+    segments["lead_in"][i[has_in]] = lead[has_in]
+    segments["x1"][before[i[has_in]]], segments["y1"][before[i[has_in]]] = run_start[has_in].T
+    z = has_in & (kind[i - 1] == Z)
+    for field, column in (("x0", 0), ("x1", 0), ("y0", 1), ("y1", 1)):
+        segments[field][i[z] - 1] = run_start[z, column]
+
+    has_out = is_kind(after[i], (MOVE,))
+    segments["lead_out"][i[has_out]] = lead[has_out]
+    segments["x0"][after[i[has_out]]], segments["y0"][after[i[has_out]]] = run_end[has_out].T
+
+    return Trajectory(segments)
+
+
+# TURNS
+# Returns whether each segment is a turn: a move along x or y only, right
+#   after an overscanned line along the other (e.g., the step between
+#   the lines of a raster), which move_to (in execute_commands.py)
+#   starts as the stages slow down at the end of the line
+def turns(trajectory):
+    s = trajectory.segments
+    is_turn = np.zeros(len(s), dtype = bool)
+    if len(s) < 2:
+        return is_turn
+    line, step = s[:-1], s[1:]
+    along_x = (line["y0"] == line["y1"]) & (step["x0"] == step["x1"]) & (step["y0"] != step["y1"])
+    along_y = (line["x0"] == line["x1"]) & (step["y0"] == step["y1"]) & (step["x0"] != step["x1"])
+    is_turn[1:] = (line["kind"] == LINE) & (line["lead_out"] > 0) & (step["kind"] == MOVE) & (along_x | along_y)
+    return is_turn
+
+
+# RAMP DISTANCE
+# Returns the distance (mm) along a line in direction (unit vectors, N x
+#   2) that the stages cover while speeding up to speed (mm/s; or
+#   slowing down from it), each axis at accel (mm/s^2). The axes reach
+#   their speeds in the time the faster one takes to (cf. expose in
+#   execute_commands.py), at half the speed, on average.
+def ramp_distance(speed, direction, accel):
+    direction = np.asarray(direction, dtype = float).reshape(-1, 2)
+    speed = np.asarray(speed, dtype = float)
+    return speed**2 * np.abs(direction).max(axis = 1) / (2 * accel)
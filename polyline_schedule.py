@@ -0,0 +1,171 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	polyline_schedule.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Precomputes the velocity schedule that trace_polyline (in execute_
+commands.py) follows to go through a chain of straight lines without
+stopping at each corner, as move_to does: the stages are driven with
+move_vel every DELTA_T ms, as for arcs (cf. circle_schedule.py), and
+sent on time by a BinaryDispatcher.
+
+The speed along the path is planned before the stages start:
+- at each corner, the speed is held down so that the path doesn't cut
+  the corner by more than deviation (mm). Two things round a corner off:
+  the velocity is only updated once per tick, so the tick in which the
+  corner falls goes straight across it (by up to v * dt/2 * sin(phi/2),
+  for a turn of phi), and the stages take a moment to change velocity
+  (about dv^2 / 8a, for a change of dv = 2v sin(phi/2));
+- the speed changes between corners no faster than accel (mm/s^2), and
+  is looked ahead to the end, so that the stages can always slow down
+  in time for the next corner (and stop at the end of the path);
+- otherwise, each line is written at its own speed.
+
+The velocity at each tick is the one that takes the stages from where
+the plan has them at that tick to where it has them at the next.
+"""
+
+
+from collections import namedtuple
+
+import numpy as np
+
+from circle_schedule import pack_frames
+
+# times: seconds after the first tick at which to send each tick
+# x_data, y_data: move_vel data for each tick
+# frames: the frames, packed (2 per tick: x, then y)
+# end: seconds after the first tick at which the last velocity stops
+#   applying, i.e., when to stop the stages
+# duration: seconds the plan takes (<= end)
+PolylineSchedule = namedtuple("PolylineSchedule", "times x_data y_data frames end duration")
+
+
+# POLYLINE SCHEDULE
+# Computes the ticks for going through points (N + 1 x 2, mm, in stage
+#   coordinates) along the N lines between them, at speeds (mm/s; one,
+#   or one per line), with a tick every delta_t (ms). Velocities are
+#   converted to data with data_per_speed (data per mm/s). accel (mm/s^2)
+#   and deviation (mm) are cf. above. x_device, y_device and
+#   message_id_devices are as for circle_schedule.
+def polyline_schedule(points, speeds, delta_t, data_per_speed, accel, deviation,
+                      x_device, y_device, message_id_devices = ()):
+
+    dt = delta_t / 1000
+    plan = _plan(points, speeds, dt, accel, deviation)
+    if plan is None:
+        empty = np.zeros(0, dtype = np.int64)
+        return PolylineSchedule(np.zeros(0), empty, empty, b"", 0.0, 0.0)
+    points, lengths, starts, profile = plan
+    duration = float(starts[-1])
+
+    # where the plan has the stages at each tick (the last at or after
+    #   the end, where they stay)
+    ticks = np.arange(int(np.ceil(duration / dt)) + 1) * dt
+    position = _positions(points, lengths, starts, profile, accel, ticks)
+
+    velocity = np.diff(position, axis = 0) / dt
+    # (int)(...) in linspeed2lindata truncates toward zero
+    x_data = np.trunc(velocity[:, 0] * data_per_speed).astype(np.int64)
+    y_data = np.trunc(velocity[:, 1] * data_per_speed).astype(np.int64)
+
+    frames = pack_frames(x_data, y_data, x_device, y_device, message_id_devices)
+    times = ticks[:-1]
+    return PolylineSchedule(times, x_data, y_data, frames, float(ticks[-1]), duration)
+
+
+# POLYLINE DURATION
+# Returns (duration, end) of the schedule polyline_schedule would compute
+#   for the same arguments, without working out its ticks (e.g., for
+#   time estimates; cf. motion_time.py)
+def polyline_duration(points, speeds, delta_t, accel, deviation):
+    dt = delta_t / 1000
+    plan = _plan(points, speeds, dt, accel, deviation)
+    if plan is None:
+        return 0.0, 0.0
+    duration = float(plan[2][-1])
+    return duration, float(np.ceil(duration / dt) * dt)
+
+
+# Returns (points, lengths, starts, profile) of the plan (cf. _profile),
+#   without repeated points, or None if the points don't go anywhere
+def _plan(points, speeds, dt, accel, deviation):
+    points = np.asarray(points, dtype = float).reshape(-1, 2)
+    speeds = np.broadcast_to(np.asarray(speeds, dtype = float), (max(len(points) - 1, 0),))
+
+    # (repeated points don't go anywhere)
+    lengths = np.hypot(*np.diff(points, axis = 0).T)
+    keep = lengths > 0
+    points = np.vstack((points[:1], points[1:][keep]))
+    speeds, lengths = speeds[keep], lengths[keep]
+    if len(lengths) == 0:
+        return None
+
+    vertex_speeds = _vertex_speeds(points, lengths, speeds, dt, accel, deviation)
+    starts, profile = _profile(lengths, speeds, vertex_speeds, accel)
+    return points, lengths, starts, profile
+
+
+# Returns the fastest the stages may go through each point (0 at either
+#   end), given the corners and how far there is to speed up and slow
+#   down between them
+def _vertex_speeds(points, lengths, speeds, dt, accel, deviation):
+    directions = np.diff(points, axis = 0) / lengths[:, None]
+
+    # sin(phi/2), for a turn of phi at each inner point
+    cos_turn = np.clip(np.sum(directions[:-1] * directions[1:], axis = 1), -1, 1)
+    sin_half = np.sqrt((1 - cos_turn) / 2)
+
+    limit = np.minimum(speeds[:-1], speeds[1:])
+    with np.errstate(divide = "ignore"):
+        limit = np.minimum(limit, 2 * deviation / (dt * sin_half))
+        limit = np.minimum(limit, np.sqrt(2 * accel * deviation) / sin_half)
+    v = np.concatenate(([0.0], limit, [0.0]))
+
+    # look ahead (and behind): no faster than can be reached from, or
+    #   slowed down to, the neighbouring points
+    for i in range(len(lengths)):
+        v[i + 1] = min(v[i + 1], np.sqrt(v[i]**2 + 2 * accel * lengths[i]))
+    for i in range(len(lengths) - 1, -1, -1):
+        v[i] = min(v[i], np.sqrt(v[i + 1]**2 + 2 * accel * lengths[i]))
+    return v
+
+
+# Returns (starts, profile): the time at which the stages reach each
+#   point (with the end last), and each line's (entry speed, top speed,
+#   exit speed, time speeding up, time at top speed), speeding up and
+#   slowing down at accel
+def _profile(lengths, speeds, vertex_speeds, accel):
+    v0, v1 = vertex_speeds[:-1], vertex_speeds[1:]
+    top = speeds.copy()
+
+    # lines too short to reach their speed only get as fast as they can
+    too_short = (2 * top**2 - v0**2 - v1**2) / (2 * accel) > lengths
+    top[too_short] = np.sqrt((2 * accel * lengths[too_short] + v0[too_short]**2 + v1[too_short]**2) / 2)
+    top = np.maximum(top, np.maximum(v0, v1))
+
+    t_up = (top - v0) / accel
+    t_down = (top - v1) / accel
+    cruise = lengths - (top**2 - v0**2) / (2 * accel) - (top**2 - v1**2) / (2 * accel)
+    t_top = np.maximum(cruise, 0) / top
+
+    starts = np.concatenate(([0.0], np.cumsum(t_up + t_top + t_down)))
+    return starts, np.column_stack((v0, top, v1, t_up, t_top))
+
+
+# Returns where (N x 2) the plan has the stages at each of times
+def _positions(points, lengths, starts, profile, accel, times):
+    line = np.clip(np.searchsorted(starts, times, side = "right") - 1, 0, len(lengths) - 1)
+    t = np.clip(times - starts[line], 0, starts[line + 1] - starts[line])
+    v0, top, v1, t_up, t_top = profile[line].T
+
+    # distance along the line: speeding up, at top speed, slowing down
+    up = np.minimum(t, t_up)
+    flat = np.clip(t - t_up, 0, t_top)
+    down = np.maximum(t - t_up - t_top, 0)
+    s = v0*up + accel*up**2/2 + top*flat + top*down - accel*down**2/2
+    s = np.minimum(s, lengths[line])
+
+    directions = np.diff(points, axis = 0) / lengths[:, None]
+    return points[line] + directions[line] * s[:, None]
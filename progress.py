@@ -0,0 +1,162 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	progress.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Reports how far through a trajectory (cf. trajectory.py) execute_
+commands.py is, while it writes it: the command being written (its
+number, as in the "# [n]" tags that mapping_handler.py adds to the
+sample file), how much of the planned time is done, how long it has
+taken so far, and how much longer it should take.
+
+The time left is the planned time left (cf. motion_time.py), scaled by
+how the time taken so far compares with the time planned for what's
+done so far, so that it corrects itself if the stages are consistently
+faster or slower than planned.
+
+Progress is printed to the console, and written to a status file (JSON,
+e.g., for a script on the workstation to poll), at most once every
+interval seconds (and when a new command starts, or the writing ends).
+The file is replaced whole each time (written to a temporary file, and
+renamed over it), so it's never read half-written.
+"""
+
+
+import json
+import os
+import time
+
+import numpy as np
+
+# Least planned time (s) done before the time left is corrected by the
+#   time taken so far (before then, it's too noisy to go by)
+MIN_CORRECTION_TIME = 2.0
+
+
+class ProgressReporter(object):
+
+    def __init__(self, segment_times, commands, status_path = None, interval = 2.0, name = ""):
+        # segment_times: planned time (s) of each segment
+        # commands: the command number of each segment
+        # status_path: where to write the status file, or None
+        # interval: (s) least time between reports
+        # name: e.g., the sample's name, for the status file
+        self.planned = np.cumsum(np.asarray(segment_times, dtype = float))
+        self.commands = np.asarray(commands)
+        self.status_path = status_path
+        self.interval = interval
+        self.name = name
+
+        self.done = 0           # segments done
+        self.started = None     # time.perf_counter() when started
+        self.first = 0          # segments done before it started
+        self.state = "waiting"
+        self._reported_at = None
+        self._reported_command = None
+
+    @property
+    def total(self):
+        return float(self.planned[-1]) if len(self.planned) else 0.0
+
+    @property
+    def planned_done(self):
+        return float(self.planned[self.done - 1]) if self.done else 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started if self.started is not None else 0.0
+
+    # The command being written (or, once done, the last one written);
+    #   None if there are none
+    @property
+    def command(self):
+        if not len(self.commands):
+            return None
+        return int(self.commands[min(self.done, len(self.commands) - 1)])
+
+    # How much longer (s) the writing should take than planned, going by
+    #   the segments done since it started
+    @property
+    def ratio(self):
+        planned = self.planned_done - (float(self.planned[self.first - 1]) if self.first else 0.0)
+        if planned < MIN_CORRECTION_TIME:
+            return 1.0
+        return self.elapsed / planned
+
+    @property
+    def remaining(self):
+        return (self.total - self.planned_done) * self.ratio
+
+    # Starts timing, from segment done (e.g., if an interrupted run is
+    #   carried on; cf. RESUME in execute_commands.py)
+    def start(self, done = 0):
+        self.done = self.first = int(done)
+        self.started = time.perf_counter()
+        self.state = "running"
+        self.report()
+
+    # Records that the first done segments are written, and reports if
+    #   it's been interval seconds since the last report, or a new
+    #   command has started
+    def update(self, done):
+        self.done = int(done)
+        now = time.perf_counter()
+        if self.command != self._reported_command or self._reported_at is None or \
+                now - self._reported_at >= self.interval:
+            self.report()
+
+    # Reports that the writing has ended: state is "finished", or, e.g.,
+    #   "stopped" if it was interrupted
+    def finish(self, state = "finished"):
+        self.state = state
+        self.report()
+
+    def status(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "command": self.command,
+            "segment": self.done,
+            "segments": len(self.planned),
+            "percent": round(100 * self.planned_done / self.total, 1) if self.total > 0 else 100.0,
+            "elapsed": round(self.elapsed, 1),
+            "remaining": round(self.remaining, 1) if self.state == "running" else 0.0,
+            "planned": round(self.total, 1),
+            "ratio": round(self.ratio, 3),
+            "updated": time.time(),
+        }
+
+    def report(self):
+        self._reported_at = time.perf_counter()
+        self._reported_command = self.command
+        status = self.status()
+        print(format_status(status))
+        if self.status_path is not None:
+            try:
+                write_status(self.status_path, status)
+            except OSError as e:
+                print("COULDN'T SAVE PROGRESS: {}".format(e))
+                self.status_path = None
+
+
+# Returns status as a line for the console, e.g.,
+#   "[12] 34.0%  0:41 elapsed, ~1:19 left"
+def format_status(status):
+    if status["state"] != "running":
+        return "[{}] {}: {} elapsed".format(status["command"], status["state"], _minutes(status["elapsed"]))
+    return "[{}] {:.1f}%  {} elapsed, ~{} left".format(status["command"], status["percent"],
+                                                       _minutes(status["elapsed"]), _minutes(status["remaining"]))
+
+
+# Writes status (JSON) to path, replacing the file whole
+def write_status(path, status):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(status, f)
+    os.replace(temporary, path)
+
+
+def _minutes(seconds):
+    seconds = int(round(seconds))
+    return "{}:{:02d}".format(seconds // 60, seconds % 60)
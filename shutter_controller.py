@@ -0,0 +1,106 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	shutter_controller.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Opens and closes the Thorlabs SH05 beam shutter through the Keithley
+2400 SourceMeter (cf. keithley_handler.py), remembering which way it was
+last set so that commands which wouldn't change anything (e.g., closing
+the shutter before every move, when it's already closed) aren't sent
+over GPIB at all.
+
+The shutter takes a while to respond: a command has to get across GPIB,
+the SourceMeter has to switch its output, and the diaphragm has to
+move. open_latency and close_latency are how long (s) that takes, from
+the command to the shutter being fully open or closed; calibrate them
+on the setup (e.g., with a photodiode in the beam) and set SHUTTER_OPEN_
+LATENCY and SHUTTER_CLOSE_LATENCY in execute_commands.py. open_at and
+close_at then send each command that much ahead of when the shutter is
+wanted open or closed, e.g., so that the exposure of a line starts and
+ends with the constant-velocity part of the move (cf. move_to in
+execute_commands.py), rather than with the stages standing still at
+either end.
+"""
+
+
+import threading
+import time
+
+
+class ShutterController(object):
+
+    def __init__(self, keithley, open_latency = 0, close_latency = 0):
+        # keithley: a KeithleyHandler, whose output drives the shutter
+        # open_latency, close_latency: cf. above (s)
+        self.keithley = keithley
+        self.open_latency = open_latency
+        self.close_latency = close_latency
+
+        # True if open, False if closed, None if not known (e.g., the
+        #   SourceMeter was set up by hand)
+        self.is_open = None
+
+        # number of commands sent and not sent (already in that state)
+        self.sent = 0
+        self.skipped = 0
+
+        self._lock = threading.Lock()
+        self._timers = []
+
+    """   now   """
+
+    def open(self):
+        self._set(True)
+
+    def close(self):
+        self._set(False)
+
+    # Forgets the shutter's state, so that the next command is sent
+    #   whatever it is (e.g., after the SourceMeter was reset)
+    def invalidate(self):
+        with self._lock:
+            self.is_open = None
+
+    def _set(self, is_open):
+        with self._lock:
+            if self.is_open == is_open:
+                self.skipped += 1
+                return
+            if is_open:
+                self.keithley.set_output_on()
+            else:
+                self.keithley.set_output_off()
+            self.is_open = is_open
+            self.sent += 1
+
+    """   ahead of time   """
+
+    # Sends the command so that the shutter is open (or closed) at when
+    #   (a time.perf_counter() time), i.e., latency seconds before; if
+    #   that's already past, sends it now. Returns at once; the command
+    #   is sent from a timer thread.
+    def open_at(self, when):
+        self._schedule(True, when - self.open_latency)
+
+    def close_at(self, when):
+        self._schedule(False, when - self.close_latency)
+
+    def _schedule(self, is_open, send_at):
+        delay = send_at - time.perf_counter()
+        if delay <= 0:
+            self._set(is_open)
+            return
+        timer = threading.Timer(delay, self._set, (is_open,))
+        timer.daemon = True
+        with self._lock:
+            self._timers.append(timer)
+        timer.start()
+
+    # Cancels the commands not yet sent by open_at and close_at
+    def cancel(self):
+        with self._lock:
+            timers, self._timers = self._timers, []
+        for timer in timers:
+            timer.cancel()
+            timer.join()
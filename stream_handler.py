@@ -0,0 +1,164 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	stream_handler.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Drives the x- and y- linear stages through an ASCII (A-series)
+controller's stream (cf. zaber/serial/asciistream.py) rather than one
+Binary command at a time. Whole paths (lines, arcs and full circles) are
+uploaded to the controller, which interpolates both axes along them
+itself: arcs come out smooth at speeds which re-issuing move_vel every
+DELTA_T ms from the computer (write_part_circle in execute_commands.py)
+can't reach, since the path no longer depends on when each command gets
+across the bus.
+
+Positions are in microsteps (as mm2lindata returns them), speeds in
+microsteps/s and accelerations in microsteps/s^2; they are converted to
+the controller's native units here. Use "zaberasciisim://" as the port
+to run against the simulated controller in zaber/serial/asciisimulator.py.
+"""
+
+
+import math
+
+from zaber.serial import AsciiDevice, AsciiSerial
+
+# Native ASCII units per microstep/s and per microstep/s^2.
+SPEED_PER_MSTEP = 1.6384
+ACCEL_PER_MSTEP = 1.6384 / 10000
+
+
+class StreamRejectedError(Exception):
+    """Raised when the controller rejects a command (e.g., a segment
+    which would leave the stages' range of motion).
+    """
+    def __init__(self, message, reply=None):
+        super(StreamRejectedError, self).__init__(message)
+        self.reply = reply
+
+
+class StreamHandler(object):
+
+    def __init__(self, port, address = 1, x_axis = 1, y_axis = 2, stream_number = 1, timeout = 5):
+        """
+        Args:
+            port: The name or URL of the controller's serial port.
+            address: The controller's device address.
+            x_axis, y_axis: The controller's axis numbers for the x- and
+                y- linear stages.
+            stream_number: The stream to use on the controller.
+            timeout: Seconds to wait for each reply.
+        """
+        self.port = AsciiSerial(port, timeout = timeout)
+        self.device = AsciiDevice(self.port, address)
+        self.x_axis = x_axis
+        self.y_axis = y_axis
+        self.stream = self.device.stream(stream_number)
+        self._speed = None
+        self._accel = None
+        self._setup_stream()
+
+    def _setup_stream(self):
+        # (the stream may be left over from an earlier run)
+        self.stream.disable()
+        self._check(self.stream.setup_live(self.x_axis, self.y_axis))
+        # setting the stream up resets its limits
+        self._speed = None
+        if self._accel is not None:
+            self._check(self.stream.set_max_tangential_acceleration(self._accel))
+            self._check(self.stream.set_max_centripetal_acceleration(self._accel))
+
+    def _check(self, reply):
+        if reply.reply_flag != "OK":
+            raise StreamRejectedError(
+                "controller rejected a command: {}".format(reply.data), reply)
+        return reply
+
+    def _set_speed(self, speed):
+        speed = max(int(speed * SPEED_PER_MSTEP), 1)
+        if speed != self._speed:
+            self._check(self.stream.set_max_speed(speed))
+            self._speed = speed
+
+    """   settings   """
+
+    # Sets the acceleration (microsteps/s^2) both along and across paths,
+    #   and for moves of each axis on its own (e.g., homing)
+    def set_acceleration(self, accel):
+        accel = max(int(accel * ACCEL_PER_MSTEP), 1)
+        for axis in (self.x_axis, self.y_axis):
+            self._check(self.device.axis(axis).send("set accel {:d}".format(accel)))
+        self._check(self.stream.set_max_tangential_acceleration(accel))
+        self._check(self.stream.set_max_centripetal_acceleration(accel))
+        self._accel = accel
+
+    # Sets the speed (microsteps/s) of moves of each axis on its own
+    #   (e.g., homing)
+    def set_home_speed(self, speed):
+        speed = max(int(speed * SPEED_PER_MSTEP), 1)
+        for axis in (self.x_axis, self.y_axis):
+            self._check(self.device.axis(axis).send("set maxspeed {:d}".format(speed)))
+
+    """   moves   """
+
+    def home(self):
+        # axes can't be homed while they belong to a stream
+        self.stream.disable()
+        for axis in (self.x_axis, self.y_axis):
+            self._check(self.device.axis(axis).send("home"))
+        self.device.poll_until_idle()
+        self._setup_stream()
+
+    # Returns the (x, y) position, in microsteps
+    def position(self):
+        positions = self.device.send("get pos").data.split()
+        return (int(positions[self.x_axis - 1]), int(positions[self.y_axis - 1]))
+
+    # Moves in a straight line to point (x, y), at speed
+    def move_to(self, point, speed):
+        self.write_path([("line", point)], speed)
+
+    # Writes an arc of sweep_deg (counterclockwise if positive) about
+    #   center, starting from start (where the stages must already be).
+    #   Whole turns are written as circles, the rest as one arc.
+    def write_part_circle(self, center, start, sweep_deg, speed):
+        direction = "ccw" if sweep_deg > 0 else "cw"
+        turns, rest = divmod(abs(sweep_deg), 360)
+        segments = [("circle", center, direction)] * int(turns)
+        if rest > 0:
+            theta = math.radians(math.copysign(rest, sweep_deg))
+            dx, dy = start[0] - center[0], start[1] - center[1]
+            end = (center[0] + dx * math.cos(theta) - dy * math.sin(theta),
+                   center[1] + dx * math.sin(theta) + dy * math.cos(theta))
+            segments.append(("arc", center, end, direction))
+        self.write_path(segments, speed)
+
+    # Uploads a path to the controller, which moves along it at up to
+    #   speed; segments are ("line", point), ("arc", center, end,
+    #   direction) and ("circle", center, direction), each starting
+    #   where the previous one ends, with direction "cw" or "ccw". Long
+    #   paths are sent as fast as the controller makes room for them.
+    #   If wait, returns once the stages have stopped.
+    def write_path(self, segments, speed, wait = True):
+        self._set_speed(speed)
+        for segment in segments:
+            if segment[0] == "line":
+                self._check(self.stream.line_abs(*segment[1]))
+            elif segment[0] == "arc":
+                _, center, end, direction = segment
+                self._check(self.stream.arc_abs(direction, center[0], center[1], end[0], end[1]))
+            elif segment[0] == "circle":
+                _, center, direction = segment
+                self._check(self.stream.circle_abs(direction, center[0], center[1]))
+            else:
+                raise ValueError("unknown segment: {!r}".format(segment[0]))
+        if wait:
+            self.wait_until_idle()
+
+    def wait_until_idle(self):
+        self.device.poll_until_idle()
+
+    def close(self):
+        self.stream.disable()
+        self.port.close()
@@ -0,0 +1,459 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	trajectory.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Compiles write commands (write_line, write_parallel_lines_gap, wipe_
+region, etc.) into a trajectory: one NumPy array of segments, each a
+move (shutter closed), a line (shutter open), an arc or a change of
+height (z), with the speed it is made at. A command's geometry is worked
+out here and only here; execute_commands.py (run_trajectory) sends the
+segments to the stages, and mapping_handler.py draws them and adds up
+how long they will take, so the preview can't drift from what is
+actually written.
+
+Positions are in mm, in the frame of the sample region (origin at the
+bottom left corner, as the region is seen under the microscope), i.e.,
+with LOCAL_O already added; cf. region2globalmm in execute_commands.py.
+Arguments to the write commands are the same as in execute_commands.py
+and the sample .txt files, and are relative to local_o.
+
+Patterns of many lines are built with whole-array operations rather
+than one segment at a time, so that jobs with hundreds of thousands of
+segments stay cheap to compile, time, and draw.
+"""
+
+
+import math
+
+import numpy as np
+
+# segment kinds
+MOVE = 0        # straight, shutter closed
+LINE = 1        # straight, shutter open
+ARC = 2         # counterclockwise, from start_deg to end_deg, shutter open
+Z = 3           # change of height (to z); x and y don't change
+
+# One segment. (x0, y0) -> (x1, y1) is where it starts and ends; speed
+#   is mm/s (unused for Z); command is the number of the command it was
+#   compiled from (cf. TrajectoryBuilder.command); z is the height it is
+#   made at (or, for Z, moved to), NaN if not yet known. center_x,
+#   center_y, radius, start_deg and end_deg describe arcs; NaN otherwise.
+#   lead_in and lead_out (mm) are how far before (x0, y0) and past (x1,
+#   y1) the stages run along a line, with the shutter closed, so that
+#   the line itself is written at constant speed (cf. overscan.py); 0
+#   otherwise.
+SEGMENT_DTYPE = np.dtype([
+    ("kind", "u1"),
+    ("laser", "?"),
+    ("command", "<i4"),
+    ("x0", "<f8"), ("y0", "<f8"),
+    ("x1", "<f8"), ("y1", "<f8"),
+    ("speed", "<f8"),
+    ("z", "<f8"),
+    ("center_x", "<f8"), ("center_y", "<f8"),
+    ("radius", "<f8"), ("start_deg", "<f8"), ("end_deg", "<f8"),
+    ("lead_in", "<f8"), ("lead_out", "<f8"),
+])
+
+
+# Returns a move (an array of one segment) from start to end at speed,
+#   tagged (command, z) like segment, e.g., to join up segments that are
+#   put in a new order (cf. travel_optimizer.py, height_batching.py)
+def move_segment(start, end, speed, segment):
+    move = np.zeros(1, dtype = SEGMENT_DTYPE)
+    for field in ("center_x", "center_y", "radius", "start_deg", "end_deg"):
+        move[field] = np.nan
+    move["kind"] = MOVE
+    move["command"] = segment["command"]
+    move["z"] = segment["z"]
+    move["x0"], move["y0"] = start
+    move["x1"], move["y1"] = end
+    move["speed"] = speed
+    return move
+
+
+# Returns (x, y) of a V2 or a tuple
+def _xy(point):
+    if hasattr(point, "x"):
+        return (float(point.x), float(point.y))
+    return (float(point[0]), float(point[1]))
+
+
+class Trajectory(object):
+
+    def __init__(self, segments = None):
+        self.segments = np.zeros(0, dtype = SEGMENT_DTYPE) if segments is None else segments
+
+    def __len__(self):
+        return len(self.segments)
+
+    # Slicing or indexing with a mask returns a Trajectory of those
+    #   segments; indexing with an int returns that segment
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.segments[key]
+        return Trajectory(self.segments[key])
+
+    def __iter__(self):
+        return iter(self.segments)
+
+    @property
+    def kind(self):
+        return self.segments["kind"]
+
+    @property
+    def laser(self):
+        return self.segments["laser"]
+
+    @property
+    def command(self):
+        return self.segments["command"]
+
+    @property
+    def starts(self):
+        return np.column_stack((self.segments["x0"], self.segments["y0"]))
+
+    @property
+    def ends(self):
+        return np.column_stack((self.segments["x1"], self.segments["y1"]))
+
+    # Where the stages start and stop moving for each segment: starts and
+    #   ends, but for the lead-in and lead-out of overscanned lines
+    @property
+    def run_starts(self):
+        return self.starts - self._directions() * self.segments["lead_in"][:, None]
+
+    @property
+    def run_ends(self):
+        return self.ends + self._directions() * self.segments["lead_out"][:, None]
+
+    # Unit vectors (x, y) along each straight segment (0 where it has no
+    #   length, or is an arc or a change of height)
+    def _directions(self):
+        delta = self.ends - self.starts
+        lengths = np.hypot(delta[:, 0], delta[:, 1])
+        straight = (self.kind == MOVE) | (self.kind == LINE)
+        directions = np.zeros_like(delta)
+        np.divide(delta, lengths[:, None], out = directions, where = (straight & (lengths > 0))[:, None])
+        return np.nan_to_num(directions)
+
+    # Returns the segments compiled from any of the given commands
+    def select_commands(self, commands):
+        return self[np.isin(self.command, list(commands))]
+
+    # Returns (first, count): where each chain of two or more straight
+    #   segments starts, and how many it has. A chain is lines (or
+    #   moves) each starting where the one before ends, which can be
+    #   written without stopping in between (cf. CONTOUR_POLYLINES in
+    #   execute_commands.py).
+    def chains(self):
+        s = self.segments
+        kind = s["kind"]
+        straight = (kind == MOVE) | (kind == LINE)
+        # joined[k]: segment k + 1 carries on from segment k
+        joined = straight[:-1] & straight[1:] & (kind[:-1] == kind[1:]) & (s["laser"][:-1] == s["laser"][1:]) & \
+                 np.isfinite(s["x0"][:-1]) & (s["x0"][1:] == s["x1"][:-1]) & (s["y0"][1:] == s["y1"][:-1])
+        edges = np.diff(np.concatenate(([0], joined.astype(np.int8), [0])))
+        first = np.flatnonzero(edges == 1)
+        count = np.flatnonzero(edges == -1) - first + 1
+        return first, count
+
+    # Returns the distance (mm) the x- and y- stages cover along each
+    #   segment, including any overscan (0 for Z, and for a move from an
+    #   unknown position)
+    def lengths(self):
+        s = self.segments
+        lengths = np.hypot(s["x1"] - s["x0"], s["y1"] - s["y0"]) + s["lead_in"] + s["lead_out"]
+        arcs = s["kind"] == ARC
+        lengths[arcs] = s["radius"][arcs] * np.radians(np.maximum(s["end_deg"][arcs] - s["start_deg"][arcs], 0))
+        lengths[s["kind"] == Z] = 0
+        return np.nan_to_num(lengths)
+
+    # Returns how long (s) each segment takes at its speed, not counting
+    #   acceleration or the time it takes to change z
+    def durations(self):
+        speeds = self.segments["speed"]
+        durations = np.zeros(len(self))
+        np.divide(self.lengths(), speeds, out = durations, where = speeds > 0)
+        return durations
+
+    def total_time(self):
+        return float(self.durations().sum())
+
+    # Returns {command: seconds} for every command in the trajectory
+    def command_durations(self):
+        commands, index = np.unique(self.command, return_inverse = True)
+        totals = np.bincount(index, weights = self.durations(), minlength = len(commands))
+        return dict(zip(commands.tolist(), totals.tolist()))
+
+
+class TrajectoryBuilder(object):
+
+    def __init__(self, region_size = (0, 0), local_o = (0, 0), default_speed = 5, position = None, z = None):
+        # region_size: size (mm) of the sample region (REGION_SIZE)
+        # local_o: origin (mm) of the arguments of write commands
+        # default_speed: speed (mm/s) of moves with no speed given
+        # position, z: where the stages start from, if known (moves
+        #   from an unknown position have NaN starts, and a Z is always
+        #   added when the height isn't known)
+        self.region_size = _xy(region_size)
+        self.local_o = _xy(local_o)
+        self.default_speed = default_speed
+        self.position = None if position is None else _xy(position)
+        self.z = z
+
+        # tagged onto every segment added, e.g., the number of the line
+        #   in the sample file that the segments were compiled from
+        self.command = 0
+
+        self._chunks = []
+
+    def build(self):
+        if not self._chunks:
+            return Trajectory()
+        return Trajectory(np.concatenate(self._chunks))
+
+    def _local(self, point):
+        x, y = _xy(point)
+        return (self.local_o[0] + x, self.local_o[1] + y)
+
+    def _new_segments(self, n):
+        segments = np.zeros(n, dtype = SEGMENT_DTYPE)
+        for field in ("z", "center_x", "center_y", "radius", "start_deg", "end_deg"):
+            segments[field] = np.nan
+        segments["command"] = self.command
+        if self.z is not None:
+            segments["z"] = self.z
+        return segments
+
+    """   primitives (region coordinates)   """
+
+    # Goes straight to point at speed, with the shutter open if laser;
+    #   nothing is added if the stages are already there
+    def _go_to(self, point, speed = None, laser = False):
+        if self.position == point:
+            return
+        segment = self._new_segments(1)
+        segment["kind"] = LINE if laser else MOVE
+        segment["laser"] = laser
+        segment["x0"], segment["y0"] = self.position if self.position is not None else (np.nan, np.nan)
+        segment["x1"], segment["y1"] = point
+        segment["speed"] = self.default_speed if speed is None else speed
+        self._chunks.append(segment)
+        self.position = point
+
+    # Changes height; nothing is added if the stage is already at z
+    def _set_z(self, z):
+        if self.z == z:
+            return
+        self.z = z
+        segment = self._new_segments(1)
+        segment["kind"] = Z
+        segment["x0"], segment["y0"] = segment["x1"], segment["y1"] = \
+            self.position if self.position is not None else (np.nan, np.nan)
+        self._chunks.append(segment)
+
+    # Goes through each of points (N x 2) in turn, at speed
+    def _path(self, points, speed, laser):
+        points = np.asarray(points, dtype = float).reshape(-1, 2)
+        if len(points) == 0:
+            return
+        previous = np.vstack(([self.position if self.position is not None else (np.nan, np.nan)], points[:-1]))
+        segments = self._new_segments(len(points))
+        segments["kind"] = LINE if laser else MOVE
+        segments["laser"] = laser
+        segments["x0"], segments["y0"] = previous.T
+        segments["x1"], segments["y1"] = points.T
+        segments["speed"] = speed
+        # (consecutive repeated points don't move the stages)
+        keep = ~((segments["x0"] == segments["x1"]) & (segments["y0"] == segments["y1"]))
+        self._chunks.append(segments[keep])
+        self.position = tuple(points[-1])
+
+    # Writes lines starts[i] -> ends[i] (N x 2) at speeds (one, or one
+    #   per line), one after the other. The first line is reached with a
+    #   move at the default speed; the others from the end of the line
+    #   before at link_speed (default speed if None), with the shutter
+    #   open if link_laser
+    def _lines(self, starts, ends, speeds, link_speed = None, link_laser = False):
+        starts = np.asarray(starts, dtype = float).reshape(-1, 2)
+        ends = np.asarray(ends, dtype = float).reshape(-1, 2)
+        n = len(starts)
+        if n == 0:
+            return
+        self._go_to(tuple(starts[0]))
+
+        segments = self._new_segments(2*n)
+        links, lines = segments[0::2], segments[1::2]
+
+        links["kind"] = LINE if link_laser else MOVE
+        links["laser"] = link_laser
+        links["speed"] = self.default_speed if link_speed is None else link_speed
+        links["x0"][1:], links["y0"][1:] = ends[:-1].T
+        links["x1"], links["y1"] = starts.T
+
+        lines["kind"] = LINE
+        lines["laser"] = True
+        lines["speed"] = speeds
+        lines["x0"], lines["y0"] = starts.T
+        lines["x1"], lines["y1"] = ends.T
+
+        # the first link is the move just added, and links between lines
+        #   which meet aren't needed
+        keep = np.ones(2*n, dtype = bool)
+        keep[0] = False
+        keep[2::2] = (links["x0"][1:] != links["x1"][1:]) | (links["y0"][1:] != links["y1"][1:])
+        self._chunks.append(segments[keep])
+        self.position = tuple(ends[-1])
+
+    # Writes an arc about center (counterclockwise from start_deg to
+    #   end_deg), starting with a move to its start
+    def _arc(self, center, radius, start_deg, end_deg, speed):
+        cx, cy = center
+        start = (cx + radius * math.cos(math.radians(start_deg)), cy + radius * math.sin(math.radians(start_deg)))
+        end = (cx + radius * math.cos(math.radians(end_deg)), cy + radius * math.sin(math.radians(end_deg)))
+        self._go_to(start)
+
+        segment = self._new_segments(1)
+        segment["kind"] = ARC
+        segment["laser"] = True
+        segment["x0"], segment["y0"] = start
+        segment["x1"], segment["y1"] = end
+        segment["speed"] = speed
+        segment["center_x"], segment["center_y"] = center
+        segment["radius"] = radius
+        segment["start_deg"] = start_deg
+        segment["end_deg"] = end_deg
+        self._chunks.append(segment)
+        self.position = end
+
+    """   commands (cf. execute_commands.py for details of each)   """
+
+    # Egyptian pattern |-|_|-|_|: every piece, including the short ones
+    #   joining the lines, is written at speed
+    def write_parallel_lines_vertical_continuous(self, z, start, end, gap, speed):
+        start, end = self._local(start), self._local(end)
+        num_lines = int(abs(end[0] - start[0]) / float(gap))
+        self._continuous(z, start, (start[0], end[1]), (gap, 0), num_lines, speed)
+
+    def write_parallel_lines_horizontal_continuous(self, z, start, end, gap, speed):
+        start, end = self._local(start), self._local(end)
+        num_lines = int(abs(end[1] - start[1]) / float(gap))
+        self._continuous(z, start, (end[0], start[1]), (0, gap), num_lines, speed)
+
+    def _continuous(self, z, first, far, shift, num_lines, speed):
+        self._go_to(first)
+        self._set_z(z)
+        i = np.arange(0, num_lines, 2, dtype = float)[:, None]
+        shift = np.asarray(shift, dtype = float)
+        first, far = np.asarray(first), np.asarray(far)
+        points = np.stack((first + shift*i, far + shift*i, far + shift*(i + 1), first + shift*(i + 1)), axis = 1)
+        self._path(points, speed, True)
+
+    # Two lines (there and back, gap apart) at each of speeds, spanning
+    #   the region plus 1 mm either side
+    def write_parallel_lines_vertical_region_tall(self, z, speeds, gap, inter_speed_gap_factor = 0.2):
+        x = self.local_o[0] + np.arange(len(speeds)) * (2 + inter_speed_gap_factor) * gap
+        bottom, top = self.local_o[1] - 1, self.local_o[1] + self.region_size[1] + 1
+        self._speed_pairs(z, speeds, np.column_stack((x, np.full_like(x, bottom))),
+                          np.column_stack((x, np.full_like(x, top))), (gap, 0))
+
+    def write_parallel_lines_horizontal_region_wide(self, z, speeds, gap, inter_speed_gap_factor = 0.2):
+        y = self.local_o[1] + np.arange(len(speeds)) * (2 + inter_speed_gap_factor) * gap
+        left, right = self.local_o[0] - 1, self.local_o[0] + self.region_size[0] + 1
+        self._speed_pairs(z, speeds, np.column_stack((np.full_like(y, left), y)),
+                          np.column_stack((np.full_like(y, right), y)), (0, gap))
+
+    def write_parallel_lines_horizontal_const_height(self, z, x_width, speeds, gap, inter_speed_gap_factor = 0.2):
+        y = self.local_o[1] + np.arange(len(speeds)) * (2 + inter_speed_gap_factor) * gap
+        left, right = self.local_o[0], self.local_o[0] + x_width
+        self._speed_pairs(z, speeds, np.column_stack((np.full_like(y, left), y)),
+                          np.column_stack((np.full_like(y, right), y)), (0, gap))
+
+    def _speed_pairs(self, z, speeds, starts, ends, shift):
+        if len(speeds) == 0:
+            return
+        self._go_to(tuple(starts[0]))
+        self._set_z(z)
+        shift = np.asarray(shift, dtype = float)
+        line_starts = np.stack((starts, ends + shift), axis = 1).reshape(-1, 2)
+        line_ends = np.stack((ends, starts + shift), axis = 1).reshape(-1, 2)
+        self._lines(line_starts, line_ends, np.repeat(np.asarray(speeds, dtype = float), 2))
+
+    # num_lines lines parallel to start -> end, each gap clockwise-
+    #   perpendicular from the one before
+    def write_parallel_lines_gap(self, z, start, end, gap, speed, num_lines):
+        start, end = np.asarray(self._local(start)), np.asarray(self._local(end))
+        self._parallel_lines(z, start, end, gap, speed, num_lines)
+
+    def _parallel_lines(self, z, start, end, gap, speed, num_lines):
+        if num_lines <= 0:
+            return
+        self._go_to(tuple(start))
+        self._set_z(z)
+        shift = _perpendicular_clk(end - start) * gap
+        i = np.arange(num_lines, dtype = float)[:, None]
+        self._lines(start + shift*i, end + shift*i, speed)
+
+    def write_parallel_lines_delta_s(self, z, start, end, gap_dist, speed, delta_speed, num_lines_per_speed, num_speeds):
+        start, end = np.asarray(self._local(start)), np.asarray(self._local(end))
+        shift = _perpendicular_clk(end - start) * gap_dist
+        spacer = shift * (num_lines_per_speed + (0.7 if num_lines_per_speed > 1 else 0))
+        for i in range(num_speeds):
+            self._parallel_lines(z, start + spacer*i, end + spacer*i, gap_dist, speed + i*delta_speed, num_lines_per_speed)
+
+    def write_line(self, start, end, speed):
+        self._lines([self._local(start)], [self._local(end)], speed)
+
+    # Lines through each of points in turn, at speed
+    def write_polyline(self, points, speed):
+        points = [self._local(point) for point in points]
+        if not points:
+            return
+        self._go_to(points[0])
+        self._path(points[1:], speed, True)
+
+    def write_circle(self, center, radius, speed):
+        self.write_part_circle(center, radius, 0, 360, speed)
+
+    def write_part_circle(self, center, radius, start_deg, end_deg, speed):
+        self._arc(self._local(center), radius, start_deg, end_deg, speed)
+
+    # NOTE: outline_region and wipe_region ignore local_o
+    def outline_region(self, z, speed = None):
+        w, h = self.region_size
+        corners = [(-0.1, -0.1), (-0.1, h + 0.1), (w + 0.1, h + 0.1), (w + 0.1, -0.1), (-0.1, -0.1)]
+        self._go_to(corners[0])
+        self._set_z(z)
+        self._path(corners[1:], self.default_speed if speed is None else speed, True)
+
+    # Lines across the region (plus 1 mm either side), back and forth,
+    #   gap apart; the stages go between them, outside the region, at
+    #   speed with the shutter closed
+    def wipe_region(self, z, gap = 0.08, speed = None):
+        w, h = self.region_size
+        speed = self.default_speed if speed is None else speed
+        self._go_to((-1, 0))
+        self._set_z(z)
+        y = gap * np.arange(2 * (int(h / (2*gap)) + 1), dtype = float)
+        # left to right, then right to left, ...
+        x_start, x_end = np.full_like(y, -1), np.full_like(y, w + 1)
+        x_start[1::2], x_end[1::2] = w + 1, -1
+        self._lines(np.column_stack((x_start, y)), np.column_stack((x_end, y)), speed, link_speed = speed)
+
+    def move_to(self, point, ground_speed = None, laser_on = False):
+        self._go_to(self._local(point), ground_speed, laser_on)
+
+    def set_z(self, z):
+        self._set_z(z)
+
+
+# Returns vector (x, y) rotated 90 degrees clockwise and scaled to length 1
+#   (V2.unit.perpendicular_clk)
+def _perpendicular_clk(vector):
+    length = np.hypot(vector[0], vector[1])
+    if length == 0:
+        return np.zeros(2)
+    return np.array((vector[1], -vector[0])) / length
@@ -0,0 +1,292 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git
+PROGRAM:	travel_optimizer.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Reorders the writes in a compiled trajectory (cf. trajectory.py) so that
+the stages spend less time moving between them with the shutter closed.
+Jobs made of many separate lines (e.g., write_parallel_lines_gap,
+wipe_region) otherwise spend much of their time going back to where
+each line starts, at DEFAULT_HOME_SPEED.
+
+A trajectory is cut into strokes: runs of lines and arcs written one
+after the other with the shutter open. Moves between strokes are thrown
+away and worked out again once the strokes are in their new order. Each
+stroke is written exactly as compiled, except that a stroke made only of
+straight lines may be written backward (end to start) if that's closer.
+Arcs are always written counterclockwise, as trace_arc does, so a
+stroke with an arc is never reversed. The order is chosen nearest
+stroke first, then improved by 2-opt (reversing runs of strokes where
+that shortens the moves), all of it in NumPy.
+
+What stays put:
+- changes of height (z): strokes are only reordered among the strokes
+  between one change of height and the next, so each is still written
+  at the height it was compiled at;
+- fences: the commands numbered from a fence on are written after
+  every command numbered below it (cf. "## ORDER" in the sample files,
+  read by mapping_handler.py);
+- move_to commands: these are taken as deliberate (e.g., to come at an
+  arc from a particular side), so they stay with the stroke after them,
+  which isn't reversed; a move_to with no stroke after it ends the
+  strokes that can be reordered.
+
+Reordering only makes sense if the shutter closes for moves (i.e.,
+CONNECT_KEITHLEY); otherwise the moves are written too. The shutter
+mustn't be left in the beam for more than about ten seconds at a time
+(cf. EXTREMELY IMPORTANT NOTE #2 in README.md): if the new order would
+keep it closed longer than that, and longer than the original order
+does, the original order is kept.
+"""
+
+
+import numpy as np
+
+from trajectory import Trajectory, SEGMENT_DTYPE, MOVE, LINE, Z, move_segment
+
+# Longest time (s) the shutter may stay closed at once
+SHUTTER_LIMIT = 10
+
+# Longest blocks (in strokes) to reorder at all, and to improve by 2-opt
+#   (both take time proportional to the square of the number of
+#   strokes); longer blocks are left in their original order, or in
+#   nearest-stroke-first order
+MAX_STROKES = 20000
+MAX_TWO_OPT_STROKES = 1000
+
+# Most passes of 2-opt over a block
+MAX_TWO_OPT_PASSES = 50
+
+
+class _Stroke(object):
+
+    def __init__(self, segments, entry, reversible):
+        self.segments = segments        # as compiled, starting at entry
+        self.entry = entry              # (x, y) where it starts
+        self.exit = (float(segments["x1"][-1]), float(segments["y1"][-1]))
+        self.reversible = reversible
+
+
+# OPTIMIZE TRAVEL
+# Returns trajectory with its strokes reordered (and maybe reversed) to
+#   shorten the moves between them, made at speed (mm/s). fences are
+#   command numbers (cf. above).
+def optimize_travel(trajectory, speed, fences = (), shutter_limit = SHUTTER_LIMIT):
+    if len(trajectory) == 0:
+        return trajectory
+
+    segments = trajectory.segments
+    position = (float(segments["x0"][0]), float(segments["y0"][0]))
+    chunks = []
+    for block, fixed in _blocks(segments, sorted(fences)):
+        order = _order(block, position)
+        position = _emit(chunks, order, fixed, position, speed)
+    optimized = Trajectory(np.concatenate(chunks) if chunks else np.zeros(0, dtype = SEGMENT_DTYPE))
+
+    longest = max_shutter_closed(optimized)
+    if longest > shutter_limit and longest > max_shutter_closed(trajectory):
+        print("REORDERED WRITES WOULD KEEP THE SHUTTER CLOSED FOR {:.1f} s; KEEPING THE ORIGINAL ORDER.".format(longest))
+        return trajectory
+    return optimized
+
+
+# Returns the time (s) spent moving with the shutter closed
+def travel_time(trajectory):
+    return float(trajectory.durations()[trajectory.kind == MOVE].sum())
+
+
+# Returns the longest time (s) that the shutter stays closed at once
+#   (i.e., along consecutive moves)
+def max_shutter_closed(trajectory):
+    closed = trajectory.kind == MOVE
+    if not closed.any():
+        return 0.0
+    # total closed time so far, at the end of each run of moves
+    totals = np.cumsum(np.where(closed, trajectory.durations(), 0))
+    run_ends = closed & ~np.append(closed[1:], False)
+    run_starts = closed & ~np.insert(closed[:-1], 0, False)
+    before = totals[run_starts] - trajectory.durations()[run_starts]
+    return float((totals[run_ends] - before).max())
+
+
+# Yields (strokes, fixed): the strokes that may be reordered among
+#   themselves, then the segments (e.g., a change of height, or a
+#   move_to with no stroke after it) that follow them in place
+def _blocks(segments, fences):
+    kind, command = segments["kind"], segments["command"]
+
+    # commands made only of moves are move_to's
+    commands, index = np.unique(command, return_inverse = True)
+    moves_only = np.bincount(index, weights = kind != MOVE, minlength = len(commands)) == 0
+    is_move_to = moves_only[index]
+
+    strokes = []
+    stroke = []         # indices of the stroke being collected
+    approach = []       # indices of move_to moves before it
+    fences = list(fences)
+
+    def close_stroke():
+        if stroke:
+            strokes.append(_make_stroke(segments, approach, stroke))
+            del approach[:]
+            del stroke[:]
+
+    for i in range(len(segments)):
+        if fences and command[i] >= fences[0]:
+            while fences and command[i] >= fences[0]:
+                fences.pop(0)
+            close_stroke()
+            yield strokes, segments[approach]
+            strokes, approach = [], []
+
+        if kind[i] == Z:
+            close_stroke()
+            yield strokes, segments[approach + [i]]
+            strokes, approach = [], []
+        elif kind[i] == MOVE:
+            close_stroke()
+            # (once there's a move_to, the moves after it are kept too)
+            if is_move_to[i] or approach:
+                approach.append(i)
+        else:
+            if stroke and (command[i] != command[stroke[-1]] or
+                           segments["x0"][i] != segments["x1"][stroke[-1]] or
+                           segments["y0"][i] != segments["y1"][stroke[-1]]):
+                close_stroke()
+            stroke.append(i)
+    close_stroke()
+    yield strokes, segments[approach]
+
+
+# A stroke of segments[indices], after the moves segments[approach] (the
+#   first of which is how the stages get to it, and is worked out again)
+def _make_stroke(segments, approach, indices):
+    if approach:
+        first = segments[approach[0]]
+        entry = (float(first["x1"]), float(first["y1"]))
+        return _Stroke(segments[approach[1:] + indices], entry, False)
+    first = segments[indices[0]]
+    entry = (float(first["x0"]), float(first["y0"]))
+    reversible = bool(np.all(segments["kind"][indices] == LINE))
+    return _Stroke(segments[indices], entry, reversible)
+
+
+# Returns [(stroke, reversed)] in the order to write them, starting from
+#   position
+def _order(strokes, position):
+    n = len(strokes)
+    if n == 0 or n > MAX_STROKES:
+        return [(stroke, False) for stroke in strokes]
+
+    entries = np.array([stroke.entry for stroke in strokes])
+    exits = np.array([stroke.exit for stroke in strokes])
+    reversible = np.array([stroke.reversible for stroke in strokes])
+
+    order, flipped = _nearest_first(entries, exits, reversible, position)
+    if n <= MAX_TWO_OPT_STROKES and np.all(np.isfinite(position)):
+        order, flipped = _two_opt(entries, exits, reversible, position, order, flipped)
+    return [(strokes[i], bool(f)) for i, f in zip(order, flipped)]
+
+
+# Nearest stroke (either way round, if it's reversible) first
+def _nearest_first(entries, exits, reversible, position):
+    n = len(entries)
+    remaining = np.ones(n, dtype = bool)
+    order = np.empty(n, dtype = int)
+    flipped = np.zeros(n, dtype = bool)
+    here = np.asarray(position, dtype = float)
+    for k in range(n):
+        if not np.all(np.isfinite(here)):
+            # (from an unknown position, start with the first stroke)
+            i, flip = 0, False
+        else:
+            forward = np.where(remaining, np.hypot(*(entries - here).T), np.inf)
+            backward = np.where(remaining & reversible, np.hypot(*(exits - here).T), np.inf)
+            i, j = int(np.argmin(forward)), int(np.argmin(backward))
+            flip = backward[j] < forward[i]
+            if flip:
+                i = j
+        remaining[i] = False
+        order[k], flipped[k] = i, flip
+        here = entries[i] if flip else exits[i]
+    return order, flipped
+
+
+# Improves the order by reversing runs of strokes (each of which must be
+#   reversible) wherever that shortens the moves
+def _two_opt(entries, exits, reversible, position, order, flipped):
+    order, flipped = order.copy(), flipped.copy()
+    n = len(order)
+    start = np.asarray(position, dtype = float)
+
+    def oriented():
+        a = np.where(flipped[:, None], exits[order], entries[order])
+        b = np.where(flipped[:, None], entries[order], exits[order])
+        return a, b
+
+    for _ in range(MAX_TWO_OPT_PASSES):
+        improved = False
+        a, b = oriented()
+        # last index of the run of reversible strokes from each index
+        rev = reversible[order]
+        run_end = np.empty(n, dtype = int)
+        end = n - 1
+        for i in range(n - 1, -1, -1):
+            if not rev[i]:
+                end = i - 1
+            run_end[i] = end
+
+        for i in range(n):
+            if run_end[i] < i:
+                continue
+            previous = start if i == 0 else b[i - 1]
+            j = np.arange(i, run_end[i] + 1)
+            following = j + 1 < n
+            nxt = a[np.minimum(j + 1, n - 1)]
+            old = np.hypot(*(a[i] - previous)) + np.where(following, np.hypot(*(nxt - b[j]).T), 0)
+            new = np.hypot(*(b[j] - previous).T) + np.where(following, np.hypot(*(nxt - a[i]).T), 0)
+            gain = old - new
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                k = j[best]
+                order[i:k + 1] = order[i:k + 1][::-1]
+                flipped[i:k + 1] = ~flipped[i:k + 1][::-1]
+                a, b = oriented()
+                improved = True
+        if not improved:
+            break
+    return order, flipped
+
+
+# Adds the moves and strokes, in order, and then fixed, to chunks;
+#   returns where the stages end up
+def _emit(chunks, order, fixed, position, speed):
+    for stroke, flip in order:
+        segments = _reversed(stroke.segments) if flip else stroke.segments
+        entry = stroke.exit if flip else stroke.entry
+        if entry != position:
+            chunks.append(move_segment(position, entry, speed, segments[0]))
+        chunks.append(segments)
+        position = stroke.entry if flip else stroke.exit
+
+    for segment in fixed:
+        segment = segment.copy()
+        if segment["kind"] == Z:
+            segment["x0"], segment["y0"] = segment["x1"], segment["y1"] = position
+            chunks.append(np.array([segment], dtype = SEGMENT_DTYPE))
+            continue
+        end = (float(segment["x1"]), float(segment["y1"]))
+        if end != position:
+            segment["x0"], segment["y0"] = position
+            chunks.append(np.array([segment], dtype = SEGMENT_DTYPE))
+            position = end
+    return position
+
+
+# Straight segments, written the other way
+def _reversed(segments):
+    segments = segments[::-1].copy()
+    segments["x0"], segments["x1"] = segments["x1"].copy(), segments["x0"].copy()
+    segments["y0"], segments["y1"] = segments["y1"].copy(), segments["y0"].copy()
+    return segments
@@ -5,10 +5,23 @@ from .asciireply import AsciiReply
 from .asciiserial import AsciiSerial
 from .asciilockstep import AsciiLockstep
 from .asciilockstepinfo import AsciiLockstepInfo
+from .asciisimulator import AsciiSimulator, SimulatedAsciiDevice
+from .asciistream import AsciiStream
+from .asyncbinarydevice import AsyncBinaryDevice
+from .asyncbinaryserial import AsyncBinarySerial
+from .binarycodec import FrameDecoder, FrameEncoder
 from .binarycommand import BinaryCommand
+from .binarycoordinated import CoordinatedMove
+from .binarymetrics import BinaryMetrics
 #from .binarycommand import CommandType
 from .binarydevice import BinaryDevice
+from .binarydispatcher import BinaryDispatcher
+from .binarypositions import PositionTracker
+from .binaryrecorder import BinaryRecorder
 from .binaryreply import BinaryReply
+from .binaryreplay import BinaryReplay
+from .binaryreplyrouter import BinaryReplyRouter
 from .binaryserial import BinarySerial
+from .binarysimulator import BinarySimulator, SimulatedBinaryDevice
 from .timeouterror import TimeoutError
 from .unexpectedreplyerror import UnexpectedReplyError
@@ -6,6 +6,7 @@ from .asciicommand import AsciiCommand
 from .unexpectedreplyerror import UnexpectedReplyError
 from .asciimovementmixin import AsciiMovementMixin
 from .asciilockstep import AsciiLockstep
+from .asciistream import AsciiStream
 
 # See https://docs.python.org/2/howto/logging.html#configuring-logging-
 # for-a-library for info on why we have these two lines here.
@@ -76,6 +77,24 @@ class AsciiDevice(AsciiMovementMixin):
         """
         return AsciiLockstep(self, lockstep_group=lockstep_group)
 
+    def stream(self, stream_number=1):
+        """Returns an AsciiStream using this device, for queueing lines
+        and arcs which the device interpolates on its own.
+
+        Args:
+            stream_number: The number of the stream. Defaults to the
+                first stream of the device.
+
+        Notes:
+            This function will always return a *new* AsciiStream
+            instance. Streams are set up (cf. AsciiStream.setup_live)
+            on the device, not on the instance.
+
+        Returns:
+            A new AsciiStream instance to represent the stream specified.
+        """
+        return AsciiStream(self, stream_number=stream_number)
+
     def send(self, message):
         r"""Sends a message to the device, then waits for a reply.
 
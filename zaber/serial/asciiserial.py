@@ -11,6 +11,11 @@ from .portlock import PortLock
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+# Lets serial_for_url open "zaberasciisim://" URLs with the simulator in
+# protocol_zaberasciisim.py.
+if __package__ not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append(__package__)
+
 
 class AsciiSerial(object):
     """A class for interacting with Zaber devices using the ASCII protocol. It
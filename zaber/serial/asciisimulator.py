@@ -0,0 +1,773 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	asciisimulator.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Simulated ASCII controller (e.g., an A-series controller driving our two
+linear stages as axes 1 and 2), so that AsciiSerial, AsciiDevice and
+AsciiStream (and stream_handler.py on top of them) can be exercised
+without the hardware; it is the ASCII counterpart of binarysimulator.py.
+
+Each axis keeps a kinematic model of its position (maxspeed, accel,
+limit.min/limit.max, home, move abs/rel/vel, stop). Streams queue line,
+arc and circle segments, waits, speed/acceleration limits and digital
+output changes, and interpolate every axis of the stream along each
+segment in turn, the speed around arcs limited by the centripetal
+acceleration. Each segment starts and ends at rest: the simulator
+doesn't blend the speed through corners as a controller can, so it is
+pessimistic about the time a path with corners takes, but not about
+where it goes. Digital output changes are logged (digital_outputs) with
+the simulated time they happen, so that, e.g., shutter timing can be
+checked against the path.
+
+The chain as a whole models the time it takes each line of text to cross
+the wire at the configured baud rate. Open it directly as a file-like
+object, or through AsciiSerial("zaberasciisim://"), using the URL handler
+in protocol_zaberasciisim.py (add "?speedup=10" to run 10x faster than
+real time).
+"""
+
+
+import math
+import threading
+import time
+from collections import deque
+import logging
+
+from .asciicommand import AsciiCommand
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Bits on the wire per byte: start bit, 8 data bits, stop bit.
+BITS_PER_BYTE = 10
+
+# Native units: microsteps/s per unit of speed, and microsteps/s^2 per
+#   unit of acceleration.
+SPEED_UNIT = 1 / 1.6384
+ACCEL_UNIT = 10000 / 1.6384
+
+# Our linear stages (T-LSM050A), in native units.
+LINEAR_AXIS = {
+    "maxspeed": 34406,              # ~1 mm/s
+    "accel": 205,
+    "limit.max": 1049869,           # 50 mm of travel
+}
+
+# Segments which may be waiting in a stream's queue at once.
+STREAM_QUEUE_SIZE = 32
+
+# Settings which can be read ("get") and written ("set") on each axis.
+AXIS_SETTINGS = ("maxspeed", "accel", "limit.min", "limit.max")
+
+
+class CommandRejected(Exception):
+    """Raised while executing a command to reject it with a reason
+    (e.g., "BADDATA").
+    """
+    pass
+
+
+def _profile(length, speed, accel):
+    """Plans a move along a path of the given length which starts and
+    ends at rest, at up to speed, accelerating at accel.
+
+    Returns:
+        A (duration, along) tuple, where along(dt) returns the distance
+        travelled and the speed dt seconds after the start.
+    """
+    if length <= 0 or speed <= 0:
+        return 0.0, lambda dt: (max(length, 0.0), 0.0)
+    if accel == math.inf:
+        t_ramp, v_peak = 0.0, speed
+    else:
+        v_peak = min(speed, math.sqrt(length * accel))
+        t_ramp = v_peak / accel
+    d_ramp = 0.5 * v_peak * t_ramp
+    t_cruise = (length - 2 * d_ramp) / v_peak
+    duration = 2 * t_ramp + t_cruise
+
+    def along(dt):
+        dt = min(max(dt, 0.0), duration)
+        if dt < t_ramp:
+            return 0.5 * accel * dt * dt, accel * dt
+        if dt < t_ramp + t_cruise or t_ramp == 0:
+            return d_ramp + v_peak * (dt - t_ramp), v_peak
+        remaining = duration - dt
+        return length - 0.5 * accel * remaining * remaining, accel * remaining
+    return duration, along
+
+
+class SimulatedAsciiAxis(object):
+    """A kinematic model of one axis. Positions are in microsteps; all
+    times are in seconds of simulated time.
+
+    Attributes:
+        number: The number of this axis. 1-9.
+        settings: A dict from setting name to value, in native units.
+    """
+
+    def __init__(self, number, maxspeed=34406, accel=205, limit_min=0,
+                 limit_max=1049869, position=0):
+        self.number = number
+        self.settings = {
+            "maxspeed": maxspeed,
+            "accel": accel,
+            "limit.min": limit_min,
+            "limit.max": limit_max,
+        }
+        # Motion plan: list of (t0, t1, state) pieces in time order, where
+        #   state(t) returns (position, velocity) for t0 <= t <= t1; the
+        #   axis holds the position at the end of the last piece.
+        self._plan = [(0.0, 0.0, lambda t, x=float(position): (x, 0.0))]
+
+    @property
+    def speed(self):
+        return self.settings["maxspeed"] * SPEED_UNIT
+
+    @property
+    def acceleration(self):
+        accel = self.settings["accel"] * ACCEL_UNIT
+        return accel if accel > 0 else math.inf
+
+    @property
+    def busy_until(self):
+        return self._plan[-1][1]
+
+    def state_at(self, t):
+        """Returns (position, velocity) at simulated time t."""
+        for t0, t1, state in reversed(self._plan):
+            if t0 <= t:
+                if t >= t1:
+                    return state(t1)[0], 0.0
+                return state(t)
+        t0, t1, state = self._plan[0]
+        return state(t0)
+
+    def position_at(self, t):
+        return int(round(self.state_at(t)[0]))
+
+    def is_busy(self, t):
+        return t < self.busy_until
+
+    def in_range(self, position):
+        return self.settings["limit.min"] <= position <= self.settings["limit.max"]
+
+    def append(self, t0, t1, state):
+        """Adds a piece to the plan, after anything already planned."""
+        self._plan.append((t0, t1, state))
+
+    def replan(self, t, pieces):
+        """Discards everything planned after t, then adds pieces."""
+        plan = [piece for piece in self._plan if piece[0] < t] or self._plan[:1]
+        t0, t1, state = plan[-1]
+        if t1 > t:
+            plan[-1] = (t0, t, state)
+        self._plan = plan + list(pieces)
+
+    def stop(self, t):
+        """Decelerates to rest; returns the time at which the axis stops."""
+        x, v = self.state_at(t)
+        accel = self.acceleration
+        if v == 0 or accel == math.inf:
+            self.replan(t, [(t, t, lambda _, x=x: (x, 0.0))])
+            return t
+        a = -math.copysign(accel, v)
+        duration = abs(v) / accel
+        self.replan(t, [(t, t + duration,
+                         lambda t_, x=x, v=v, a=a, t0=t: (
+                             x + v * (t_ - t0) + 0.5 * a * (t_ - t0) ** 2,
+                             v + a * (t_ - t0)))])
+        return t + duration
+
+    def move_to(self, t, target):
+        """Brakes to rest, then moves to target at maxspeed."""
+        t = self.stop(t)
+        x = self.state_at(t)[0]
+        duration, along = _profile(abs(target - x), self.speed, self.acceleration)
+        direction = 1 if target >= x else -1
+        self.append(t, t + duration,
+                    lambda t_, x=x, t0=t: _offset(x, direction, along(t_ - t0)))
+        return t + duration
+
+    def move_velocity(self, t, v):
+        """Ramps to velocity v (microsteps/s), then holds it until the
+        axis reaches limit.min or limit.max.
+        """
+        x, v0 = self.state_at(t)
+        accel = self.acceleration
+        ramp = 0.0 if accel == math.inf else abs(v - v0) / accel
+        a = 0.0 if ramp == 0 else math.copysign(accel, v - v0)
+        x_cruise = x + v0 * ramp + 0.5 * a * ramp * ramp
+        limit = self.settings["limit.max"] if v > 0 else self.settings["limit.min"]
+        cruise = math.inf if v == 0 else max((limit - x_cruise) / v, 0.0)
+        low, high = self.settings["limit.min"], self.settings["limit.max"]
+
+        def state(t_, t0=t):
+            dt = t_ - t0
+            if dt < ramp:
+                position, velocity = x + v0 * dt + 0.5 * a * dt * dt, v0 + a * dt
+            else:
+                position, velocity = x_cruise + v * (dt - ramp), v
+            if position <= low or position >= high:
+                return min(max(position, low), high), 0.0
+            return position, velocity
+        self.replan(t, [(t, t + ramp + cruise, state)])
+
+
+def _offset(x, direction, along):
+    distance, speed = along
+    return x + direction * distance, direction * speed
+
+
+class SimulatedStream(object):
+    """The state of one stream on a simulated device.
+
+    Attributes:
+        mode: None (disabled), "live" or "store".
+        axes: The SimulatedAsciiAxis objects the stream moves.
+        buffer: The number of the stream buffer segments are stored in
+            ("store" mode).
+        position: Where the stream's axes will be at the end of the last
+            queued segment.
+        end: The simulated time at which the last queued segment ends.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.axes = []
+        self.axis_count = 0
+        self.buffer = None
+        self.position = []
+        self.end = 0.0
+        self.starts = deque()           # start times of queued segments
+        self.maxspeed = 0.0             # microsteps/s
+        self.tanaccel = math.inf        # microsteps/s^2
+        self.centripaccel = math.inf    # microsteps/s^2
+
+    def queued(self, t):
+        """The number of queued segments which haven't started by t."""
+        while self.starts and self.starts[0] <= t:
+            self.starts.popleft()
+        return len(self.starts)
+
+
+class SimulatedAsciiDevice(object):
+    """A simulated ASCII device with one or more axes and streams.
+
+    Attributes:
+        address: The address of this device. 1-99.
+        axes: A list of SimulatedAsciiAxis, axis 1 first.
+        streams: A dict from stream number to SimulatedStream.
+        buffers: A dict from stream buffer number to the list of stored
+            stream commands (as lists of words).
+        digital_outputs: A list of (simulated time, channel, value) for
+            each change of a digital output.
+        queue_size: Segments which may be waiting in a stream's queue.
+    """
+
+    def __init__(self, address, axes=None, stream_count=2,
+                 queue_size=STREAM_QUEUE_SIZE):
+        """
+        Args:
+            address: An integer between 1 and 99.
+            axes: A list of SimulatedAsciiAxis. Defaults to two of our
+                linear stages.
+            stream_count: The number of streams the device has.
+            queue_size: Segments which may be waiting in a stream's
+                queue.
+
+        Raises:
+            ValueError: The address was not between 1 and 99.
+        """
+        if address < 1 or address > 99:
+            raise ValueError("Address must be between 1 and 99.")
+        self.address = address
+        if axes is None:
+            axes = [SimulatedAsciiAxis(1, **_axis_kwargs(LINEAR_AXIS)),
+                    SimulatedAsciiAxis(2, **_axis_kwargs(LINEAR_AXIS))]
+        self.axes = axes
+        self.streams = dict((number, SimulatedStream())
+                            for number in range(1, stream_count + 1))
+        self.buffers = {}
+        self.digital_outputs = []
+        self.queue_size = queue_size
+
+    def status_at(self, t, axis_number=0):
+        axes = self.axes if axis_number == 0 else [self.axes[axis_number - 1]]
+        return "BUSY" if any(axis.is_busy(t) for axis in axes) else "IDLE"
+
+    def execute(self, axis_number, words, t):
+        """Executes a command which finished arriving at time t.
+
+        Returns:
+            A (reply flag, data) tuple, e.g., ("OK", "0").
+        """
+        if axis_number > len(self.axes):
+            return "RJ", "BADAXIS"
+        axes = self.axes if axis_number == 0 else [self.axes[axis_number - 1]]
+        try:
+            data = self._execute(axis_number, axes, words, t)
+        except CommandRejected as e:
+            return "RJ", str(e)
+        except (IndexError, ValueError):
+            return "RJ", "BADDATA"
+        return "OK", "0" if data is None else data
+
+    def _execute(self, axis_number, axes, words, t):
+        if not words:
+            return None
+
+        command = words[0]
+        if command == "home":
+            for axis in axes:
+                axis.move_to(t, 0)
+
+        elif command == "move":
+            how, value = words[1], int(words[2])
+            for axis in axes:
+                if how == "vel":
+                    axis.move_velocity(t, value * SPEED_UNIT)
+                    continue
+                target = value if how == "abs" else axis.position_at(t) + value
+                if how not in ("abs", "rel") or not axis.in_range(target):
+                    raise CommandRejected("BADDATA")
+                axis.move_to(t, target)
+
+        elif command == "stop":
+            if axis_number == 0:
+                for stream in self.streams.values():
+                    stream.starts.clear()
+                    stream.end = t
+            for axis in axes:
+                axis.stop(t)
+
+        elif command == "get":
+            if words[1] == "pos":
+                return " ".join(str(axis.position_at(t)) for axis in axes)
+            if words[1] not in AXIS_SETTINGS:
+                raise CommandRejected("BADCOMMAND")
+            return " ".join(str(axis.settings[words[1]]) for axis in axes)
+
+        elif command == "set":
+            value = int(words[2])
+            for axis in axes:
+                if words[1] == "pos":
+                    axis.replan(t, [(t, t, lambda _, x=float(value): (x, 0.0))])
+                elif words[1] in AXIS_SETTINGS:
+                    axis.settings[words[1]] = value
+                else:
+                    raise CommandRejected("BADCOMMAND")
+
+        elif command == "io" and words[1:3] == ["set", "do"]:
+            self.digital_outputs.append((t, int(words[3]), int(words[4])))
+
+        elif command == "stream":
+            if axis_number != 0:
+                raise CommandRejected("DEVICEONLY")
+            if words[1] == "buffer":
+                if words[3] != "erase":
+                    raise CommandRejected("BADCOMMAND")
+                self.buffers.pop(int(words[2]), None)
+                return None
+            stream = self.streams.get(int(words[1]))
+            if stream is None:
+                raise CommandRejected("BADDATA")
+            self._stream(stream, words[2:], t)
+
+        else:
+            raise CommandRejected("BADCOMMAND")
+
+    def _stream(self, stream, words, t):
+        if words[0] == "setup":
+            self._setup(stream, words[1:], t)
+            return
+        if stream.mode is None:
+            raise CommandRejected("INACTIVE")
+        if words[0] not in ("line", "arc", "circle", "wait", "io", "set", "call"):
+            raise CommandRejected("BADCOMMAND")
+        if stream.mode == "store":
+            if words[0] == "call":
+                raise CommandRejected("BADCOMMAND")
+            # Check the syntax now, as the device would.
+            _parse_segment(words, [0.0] * stream.axis_count)
+            self.buffers.setdefault(stream.buffer, []).append(words)
+            return
+        if stream.queued(t) >= self.queue_size:
+            raise CommandRejected("FULL")
+        if words[0] == "call":
+            stored = self.buffers.get(int(words[1]))
+            if stored is None:
+                raise CommandRejected("BADDATA")
+            for segment in stored:
+                self._queue(stream, segment, t)
+        else:
+            self._queue(stream, words, t)
+
+    def _setup(self, stream, words, t):
+        if words[0] == "disable":
+            stream.mode = None
+            return
+        if words[0] == "live":
+            numbers = [int(word) for word in words[1:]]
+            if not numbers or any(n < 1 or n > len(self.axes) for n in numbers):
+                raise CommandRejected("BADDATA")
+            stream.mode = "live"
+            stream.axes = [self.axes[n - 1] for n in numbers]
+            stream.axis_count = len(numbers)
+            stream.end = max([t] + [axis.busy_until for axis in stream.axes])
+            stream.position = [axis.state_at(stream.end)[0] for axis in stream.axes]
+            stream.maxspeed = min(axis.speed for axis in stream.axes)
+            stream.tanaccel = min(axis.acceleration for axis in stream.axes)
+            stream.centripaccel = stream.tanaccel
+            stream.starts.clear()
+            return
+        if words[0] == "store":
+            stream.mode = "store"
+            stream.buffer = int(words[1])
+            stream.axis_count = int(words[2])
+            self.buffers[stream.buffer] = []
+            return
+        raise CommandRejected("BADCOMMAND")
+
+    def _queue(self, stream, words, t):
+        """Plans a segment to start when the stream's previous one ends."""
+        start = max(t, stream.end)
+        kind, values = _parse_segment(words, stream.position)
+
+        if kind == "set":
+            setting, value = values
+            if setting == "maxspeed":
+                stream.maxspeed = value * SPEED_UNIT
+            else:
+                accel = value * ACCEL_UNIT
+                setattr(stream, setting, accel if accel > 0 else math.inf)
+            return
+
+        if kind == "io":
+            self.digital_outputs.append((start, values[0], values[1]))
+            return
+
+        if kind == "wait":
+            end = start + values / 1000.0
+            for axis, x in zip(stream.axes, stream.position):
+                axis.append(start, end, lambda _, x=x: (x, 0.0))
+            stream.starts.append(start)
+            stream.end = end
+            return
+
+        if kind == "line":
+            begin, target = stream.position, values
+            delta = [b - a for a, b in zip(begin, target)]
+            length = math.sqrt(sum(d * d for d in delta))
+            speed = stream.maxspeed
+            unit = [d / length for d in delta] if length else [0.0] * len(delta)
+
+            def point(s, v):
+                return [(a + u * s, u * v) for a, u in zip(begin, unit)]
+        else:
+            if len(stream.axes) < 2:
+                raise CommandRejected("BADDATA")
+            center, sweep = values
+            begin = stream.position
+            radius = math.hypot(begin[0] - center[0], begin[1] - center[1])
+            theta0 = math.atan2(begin[1] - center[1], begin[0] - center[0])
+            length = abs(sweep) * radius
+            speed = stream.maxspeed
+            if radius > 0 and stream.centripaccel != math.inf:
+                speed = min(speed, math.sqrt(stream.centripaccel * radius))
+            sign = 1 if sweep >= 0 else -1
+
+            def point(s, v):
+                theta = theta0 + (sign * s / radius if radius else 0.0)
+                c, si = math.cos(theta), math.sin(theta)
+                coords = [(center[0] + radius * c, -sign * v * si),
+                          (center[1] + radius * si, sign * v * c)]
+                return coords + [(x, 0.0) for x in begin[2:]]
+
+        # Check the whole path against each axis's limits.
+        samples = max(2, int(length / 1000) + 2) if kind != "line" else 2
+        for i in range(samples):
+            coords = point(length * i / (samples - 1), 0.0)
+            for axis, (x, _) in zip(stream.axes, coords):
+                if not axis.in_range(round(x)):
+                    raise CommandRejected("BADDATA")
+
+        duration, along = _profile(length, speed, stream.tanaccel)
+        end = start + duration
+        for i, axis in enumerate(stream.axes):
+            axis.append(start, end,
+                        lambda t_, i=i, t0=start: point(*along(t_ - t0))[i])
+        stream.position = [x for x, _ in point(length, 0.0)]
+        stream.starts.append(start)
+        stream.end = end
+
+
+def _parse_segment(words, position):
+    """Parses a stream command which adds to the queue.
+
+    Args:
+        words: The command, e.g., ["line", "abs", "100", "200"].
+        position: Where the stream will be when the segment starts.
+
+    Returns:
+        A (kind, values) tuple: ("line", target position), ("arc",
+        (center, sweep in radians, positive counterclockwise)),
+        ("wait", milliseconds), ("io", (channel, value)), ("set",
+        (setting, value)), or ("call", buffer).
+
+    Raises:
+        CommandRejected: The command was invalid.
+        ValueError, IndexError: A number was missing or malformed.
+    """
+    kind = words[0]
+    if kind == "wait":
+        return "wait", int(words[1])
+    if kind == "call":
+        return "call", int(words[1])
+    if kind == "io":
+        if words[1:3] != ["set", "do"]:
+            raise CommandRejected("BADCOMMAND")
+        return "io", (int(words[3]), int(words[4]))
+    if kind == "set":
+        setting = words[1]
+        if setting not in ("maxspeed", "tanaccel", "centripaccel"):
+            raise CommandRejected("BADCOMMAND")
+        return "set", (setting, int(words[2]))
+    how = words[1]
+    if how not in ("abs", "rel"):
+        raise CommandRejected("BADCOMMAND")
+    origin = position if how == "rel" else [0.0] * len(position)
+
+    if kind == "line":
+        values = [int(word) for word in words[2:]]
+        if len(values) != len(position):
+            raise CommandRejected("BADDATA")
+        return "line", [o + v for o, v in zip(origin, values)]
+
+    if kind not in ("arc", "circle"):
+        raise CommandRejected("BADCOMMAND")
+    if len(position) < 2:
+        raise CommandRejected("BADDATA")
+    direction = words[2]
+    if direction not in ("cw", "ccw"):
+        raise CommandRejected("BADDATA")
+    sign = 1 if direction == "ccw" else -1
+    values = [int(word) for word in words[3:]]
+    center = (origin[0] + values[0], origin[1] + values[1])
+    if kind == "circle":
+        if len(values) != 2:
+            raise CommandRejected("BADDATA")
+        return "arc", (center, sign * 2 * math.pi)
+
+    if len(values) != 4:
+        raise CommandRejected("BADDATA")
+    end = (origin[0] + values[2], origin[1] + values[3])
+    radius = math.hypot(position[0] - center[0], position[1] - center[1])
+    end_radius = math.hypot(end[0] - center[0], end[1] - center[1])
+    if abs(end_radius - radius) > 2 + 0.001 * radius:
+        raise CommandRejected("BADDATA")
+    theta0 = math.atan2(position[1] - center[1], position[0] - center[0])
+    theta1 = math.atan2(end[1] - center[1], end[0] - center[0])
+    sweep = (sign * (theta1 - theta0)) % (2 * math.pi)
+    return "arc", (center, sign * sweep)
+
+
+def _axis_kwargs(settings):
+    return {"maxspeed": settings["maxspeed"], "accel": settings["accel"],
+            "limit_max": settings["limit.max"]}
+
+
+class AsciiSimulator(object):
+    """A simulated chain of ASCII devices, with the read/write interface
+    of a serial port. It is safe to use in multi-threaded environments.
+
+    Attributes:
+        devices: A dict from address to SimulatedAsciiDevice.
+        baudrate: The simulated baud rate, which sets how long each
+            line of text takes to cross the wire.
+        speedup: How many times faster than real time the simulation
+            runs. 1 runs in real time.
+        timeout: Default number of (real) seconds that read() waits for
+            data; None waits forever.
+    """
+
+    def __init__(self, devices=None, baudrate=115200, speedup=1.0, timeout=None):
+        """
+        Args:
+            devices: A list of SimulatedAsciiDevices. Defaults to one
+                controller (address 1) driving our two linear stages as
+                axes 1 and 2.
+            baudrate: An integer representing the simulated baud rate.
+            speedup: A number greater than 0; the simulation runs this
+                many times faster than real time.
+            timeout: Default read timeout, in seconds.
+
+        Raises:
+            ValueError: speedup was not positive.
+        """
+        if speedup <= 0:
+            raise ValueError("speedup must be greater than 0.")
+        if devices is None:
+            devices = [SimulatedAsciiDevice(1)]
+        self.devices = dict((device.address, device) for device in devices)
+        self.baudrate = baudrate
+        self.speedup = float(speedup)
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._epoch = time.perf_counter()
+        self._rx_buffer = bytearray()
+        self._rx_free = 0.0             # when the host->device wire is next free
+        self._tx_free = 0.0             # when the device->host wire is next free
+        self._output = deque()          # [delivery_time, bytes] on the wire
+        self.is_open = True
+
+    def byte_time(self):
+        """Seconds of simulated time it takes one byte to cross the wire."""
+        return BITS_PER_BYTE / float(self.baudrate)
+
+    def now(self):
+        """The current simulated time, in seconds."""
+        return (time.perf_counter() - self._epoch) * self.speedup
+
+    def write(self, data):
+        """Sends bytes from the host to the chain.
+
+        Returns:
+            The number of bytes written.
+        """
+        data = bytes(data)
+        with self._cond:
+            now = self.now()
+            self._rx_buffer.extend(data)
+            while b"\n" in self._rx_buffer:
+                end = self._rx_buffer.index(b"\n") + 1
+                line = bytes(self._rx_buffer[:end])
+                del self._rx_buffer[:end]
+                self._rx_free = max(now, self._rx_free) + len(line) * self.byte_time()
+                self._receive(line.decode(errors="replace"), self._rx_free)
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size=1, timeout=-1):
+        """Reads up to size bytes of replies, waiting for them to arrive.
+
+        Args:
+            size: The number of bytes to read.
+            timeout: Seconds (real time) to wait for size bytes; None
+                waits forever and 0 returns immediately. Defaults to
+                this simulator's timeout.
+
+        Returns:
+            A bytes object of at most size bytes; fewer if the timeout
+            elapsed first.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = self.now()
+                if self._available(now) >= size or not self.is_open:
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                wait = self._next_change(now)
+                if wait is not None:
+                    wait /= self.speedup
+                    remaining = wait if remaining is None else min(wait, remaining)
+                self._cond.wait(remaining)
+            return self._take(size, now)
+
+    @property
+    def in_waiting(self):
+        """The number of reply bytes which have finished arriving."""
+        with self._cond:
+            return self._available(self.now())
+
+    def reset_input_buffer(self):
+        """Discards replies which have already arrived."""
+        with self._cond:
+            now = self.now()
+            while self._output and self._output[0][0] <= now:
+                self._output.popleft()
+
+    def reset_output_buffer(self):
+        """Discards a partially-written command."""
+        with self._cond:
+            del self._rx_buffer[:]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Wakes blocked readers."""
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+
+    def _receive(self, line, t):
+        line = line.strip("\r\n")
+        if not line.startswith("/"):
+            logger.debug("~ not a command: %r", line)
+            return
+        # A checksum is accepted but not checked.
+        if len(line) > 3 and line[-3] == ":":
+            line = line[:-3]
+        try:
+            command = AsciiCommand(line)
+        except (TypeError, ValueError):
+            return
+        if command.device_address == 0:
+            targets = [self.devices[address] for address in sorted(self.devices)]
+        elif command.device_address in self.devices:
+            targets = [self.devices[command.device_address]]
+        else:
+            logger.debug("~ no device %d for %r", command.device_address, line)
+            return
+        for device in targets:
+            flag, data = device.execute(command.axis_number, command.data.split(), t)
+            status = device.status_at(t, min(command.axis_number, len(device.axes)))
+            message_id = ("" if command.message_id is None else
+                          "{:02d} ".format(command.message_id))
+            reply = "@{:02d} {:d} {}{} {} -- {}\r\n".format(
+                device.address, command.axis_number, message_id, flag, status,
+                data).encode()
+            self._tx_free = max(t, self._tx_free) + len(reply) * self.byte_time()
+            self._output.append([self._tx_free, reply])
+
+    def _available(self, now):
+        count = 0
+        for delivery, data in self._output:
+            if delivery > now:
+                break
+            count += len(data)
+        return count
+
+    def _next_change(self, now):
+        """Seconds of simulated time until more data may arrive, or None
+        if nothing is pending.
+        """
+        for delivery, data in self._output:
+            if delivery > now:
+                return delivery - now
+        return None
+
+    def _take(self, size, now):
+        taken = bytearray()
+        while self._output and len(taken) < size and self._output[0][0] <= now:
+            delivery, data = self._output[0]
+            needed = size - len(taken)
+            taken.extend(data[:needed])
+            if needed >= len(data):
+                self._output.popleft()
+            else:
+                self._output[0][1] = data[needed:]
+        return bytes(taken)
@@ -0,0 +1,294 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	asciistream.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Streams on ASCII (e.g., A-series) controllers: a queue of line and arc
+segments, waits, and I/O actions, which the controller works through on
+its own, interpolating every axis of the stream along each segment.
+Unlike a path approximated by re-issuing move_vel from the computer
+(cf. write_part_circle in execute_commands.py), the smoothness of a
+streamed path doesn't depend on how promptly the computer sends
+anything, only on the segments being queued before they are due.
+"""
+
+
+import logging
+import time
+
+from .utils import isstring
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Directions of arcs and circles, as seen with the stream's first axis
+#   pointing right and its second axis pointing up.
+DIRECTIONS = ("cw", "ccw")
+
+
+class AsciiStream(object):
+    """Represents a stream of a particular device (AsciiDevice).
+
+    Segments (line_abs, arc_abs, ...) are queued on the device, which
+    replies as soon as each is queued. If the queue is full, the device
+    rejects the segment with "FULL"; these methods then wait for room
+    and send it again, so a path of any length can be sent one segment
+    after another, and the device is kept busy for as long as the
+    computer keeps up.
+
+    Attributes:
+        device: The AsciiDevice of this stream.
+        stream_number: The number of the stream on the device.
+        poll_interval: Seconds to wait before re-sending a segment
+            rejected because the queue was full.
+
+    .. stream section: http://www.zaber.com/wiki/Manuals/ASCII_
+        Protocol_Manual#stream
+    """
+
+    def __init__(self, device, stream_number=1, poll_interval=0.01):
+        """
+        Args:
+            device: An AsciiDevice instance which has the stream.
+            stream_number: An integer representing the stream number.
+                Defaults to stream 1.
+            poll_interval: Seconds to wait before re-sending a segment
+                rejected because the queue was full.
+
+        Raises:
+            ValueError: The stream_number was less than 1.
+        """
+        if stream_number < 1:
+            raise ValueError("stream_number must be at least 1.")
+
+        self.device = device
+        self.stream_number = stream_number
+        self.poll_interval = poll_interval
+
+    def setup_live(self, *axes):
+        """Sets the stream up to move the given axes, executing each
+        segment as it is queued.
+
+        Args:
+            *axes: The numbers of the axes of the device, in the order
+                in which positions are given to line_abs etc. Arcs and
+                circles move the first two. Defaults to axes 1 and 2.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        axes = axes or (1, 2)
+        return self.send("setup live {}".format(" ".join(str(axis) for axis in axes)))
+
+    def setup_store(self, buffer, axis_count=2):
+        """Sets the stream up to store segments in a stream buffer on
+        the device rather than executing them, so that they can be
+        executed later with call().
+
+        Args:
+            buffer: The number of the stream buffer.
+            axis_count: The number of axes the stored segments move.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.send("setup store {:d} {:d}".format(buffer, axis_count))
+
+    def disable(self):
+        """Disables the stream, so that its axes can move independently
+        again.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.send("setup disable")
+
+    def erase_buffer(self, buffer):
+        """Erases a stream buffer.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.device.send("stream buffer {:d} erase".format(buffer))
+
+    def call(self, buffer):
+        """Queues the segments stored in a stream buffer.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("call {:d}".format(buffer))
+
+    def line_abs(self, *positions):
+        """Queues a straight line to the given positions, one per axis
+        of the stream.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("line abs {}".format(_join(positions)))
+
+    def line_rel(self, *distances):
+        """Queues a straight line by the given distances, one per axis
+        of the stream.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("line rel {}".format(_join(distances)))
+
+    def arc_abs(self, direction, center_x, center_y, end_x, end_y):
+        """Queues an arc about (center_x, center_y), from the end of the
+        previous segment to (end_x, end_y).
+
+        Args:
+            direction: "cw" or "ccw".
+
+        Raises:
+            ValueError: The direction was not "cw" or "ccw".
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("arc abs {} {}".format(
+            _direction(direction), _join((center_x, center_y, end_x, end_y))))
+
+    def arc_rel(self, direction, center_x, center_y, end_x, end_y):
+        """As arc_abs, with the center and end relative to the end of the
+        previous segment.
+        """
+        return self.queue("arc rel {} {}".format(
+            _direction(direction), _join((center_x, center_y, end_x, end_y))))
+
+    def circle_abs(self, direction, center_x, center_y):
+        """Queues a full circle about (center_x, center_y), through the
+        end of the previous segment.
+
+        Args:
+            direction: "cw" or "ccw".
+
+        Raises:
+            ValueError: The direction was not "cw" or "ccw".
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("circle abs {} {}".format(
+            _direction(direction), _join((center_x, center_y))))
+
+    def circle_rel(self, direction, center_x, center_y):
+        """As circle_abs, with the center relative to the end of the
+        previous segment.
+        """
+        return self.queue("circle rel {} {}".format(
+            _direction(direction), _join((center_x, center_y))))
+
+    def wait(self, milliseconds):
+        """Queues a pause.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("wait {:d}".format(int(milliseconds)))
+
+    def set_digital_output(self, channel, value):
+        """Queues setting a digital output of the device, e.g., to open
+        or close a shutter exactly where a segment starts or ends.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("io set do {:d} {:d}".format(channel, int(value)))
+
+    def set_max_speed(self, speed):
+        """Queues a new speed limit along the path, in the device's
+        native speed units, for the segments which follow.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("set maxspeed {:d}".format(int(speed)))
+
+    def set_max_tangential_acceleration(self, acceleration):
+        """Queues a new limit on the acceleration along the path, in the
+        device's native acceleration units.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("set tanaccel {:d}".format(int(acceleration)))
+
+    def set_max_centripetal_acceleration(self, acceleration):
+        """Queues a new limit on the acceleration across the path, in
+        the device's native acceleration units, which limits the speed
+        around tight arcs.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        return self.queue("set centripaccel {:d}".format(int(acceleration)))
+
+    def poll_until_idle(self):
+        """Polls the device's status, blocking until the stream (and
+        anything else on the device) has finished moving.
+
+        Returns:
+            An AsciiReply containing the last reply received.
+        """
+        return self.device.poll_until_idle()
+
+    def get_status(self):
+        """Queries the device for its status and returns the result.
+
+        Returns:
+            A string containing either "BUSY" or "IDLE", depending on
+            the response received from the device.
+        """
+        return self.device.get_status()
+
+    def queue(self, message):
+        """Sends a message which adds to the stream's queue, sending it
+        again for as long as the device replies that the queue is full.
+
+        Returns:
+            An AsciiReply containing the last reply received.
+        """
+        while True:
+            reply = self.send(message)
+            if reply.reply_flag != "RJ" or reply.data != "FULL":
+                return reply
+            logger.debug("stream %d full; waiting", self.stream_number)
+            time.sleep(self.poll_interval)
+
+    def send(self, message):
+        """Sends a raw message to this stream, then waits for a reply.
+
+        Args:
+            message: A string representing the message to be sent to
+                the stream, without the "stream <n>" prefix.
+
+        Raises:
+            UnexpectedReplyError: The reply received was not sent by
+                the expected device.
+            TypeError: The message is not a string.
+
+        Returns:
+            An AsciiReply containing the reply received.
+        """
+        if not isstring(message):
+            raise TypeError("message must be a string.")
+
+        return self.device.send("stream {} {}".format(self.stream_number, message))
+
+
+def _join(values):
+    return " ".join("{:d}".format(int(round(value))) for value in values)
+
+
+def _direction(direction):
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be \"cw\" or \"ccw\".")
+    return direction
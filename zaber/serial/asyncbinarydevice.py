@@ -0,0 +1,152 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	asyncbinarydevice.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+asyncio counterpart of BinaryDevice, for use with AsyncBinarySerial.
+Every command waits for its reply, but by awaiting rather than blocking,
+so there is no await_reply flag: to move several stages at once, start
+their moves together (e.g., with asyncio.gather) instead of leaving all
+but the slowest un-awaited. Each command takes its own timeout.
+"""
+
+
+import logging
+
+from .binarycommand import BinaryCommand
+from .binarydevice import BinaryDevice
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Commands which reply only once the device has stopped moving.
+MOTION_COMMANDS = (1, 20, 21)
+
+# Commands which interrupt a move in progress; the interrupted command
+# never gets a reply of its own.
+INTERRUPTING_COMMANDS = (1, 20, 21, 22, 23)
+
+
+class AsyncBinaryDevice(object):
+    """A Zaber device in the Binary protocol whose commands are awaitable.
+
+    Attributes:
+        port: The AsyncBinarySerial to which this device is connected.
+        number: The integer number of this device. 1-254.
+        device: The BinaryDevice used to write commands, e.g., for
+            enable_message_ids().
+    """
+
+    def __init__(self, port, number):
+        """
+        Args:
+            port: An AsyncBinarySerial to use as a parent port.
+            number: An integer between 1 and 254 which is the number of
+                this device.
+
+        Raises:
+            ValueError: The device number was invalid.
+        """
+        self.device = BinaryDevice(port, number)
+        self.port = port
+        self.number = number
+        self._motion = None
+
+    async def send(self, *args, timeout=-1):
+        """Sends a command to this device and awaits its reply.
+
+        Args:
+            *args: Either a single BinaryCommand, or 1-2 integers
+                specifying, in order, the command number and data value
+                of the command to be sent.
+            timeout: Seconds to wait for the reply, or None to wait
+                indefinitely. Defaults to the port's timeout.
+
+        Notes:
+            A move which is interrupted (by stop() or another move)
+            completes with the reply to the command which interrupted
+            it, rather than waiting for a reply that will never come.
+
+            Without message IDs (cf. BinaryDevice.enable_message_ids),
+            replies are matched to commands only by order, so don't send
+            anything else (e.g., get_position) to a device while one of
+            its moves is being awaited, except to interrupt the move.
+
+        Raises:
+            zaber.serial.TimeoutError: No reply arrived in time.
+
+        Returns:
+            A BinaryReply containing the reply received.
+        """
+        if len(args) == 1 and isinstance(args[0], BinaryCommand):
+            command = args[0]
+        else:
+            command = BinaryCommand(self.number, *args)  # pylint: disable=E1120
+
+        interrupted = self._motion
+        if (command.command_number not in INTERRUPTING_COMMANDS or
+                interrupted is None or interrupted.done()):
+            interrupted = None
+
+        if interrupted is not None and not self.device.message_ids:
+            # Without message IDs, this device's next reply goes to the
+            #   interrupted move's waiter, so share it. (Auto-reply is
+            #   already on for the move, and setting the device mode
+            #   while moving would only get a busy error.)
+            command.device_number = self.number
+            self.port.write(command)
+            future = interrupted
+        else:
+            future = self.device.submit(command)
+
+        if command.command_number in MOTION_COMMANDS:
+            self._motion = future
+        elif interrupted is not None:
+            self._motion = None
+
+        reply = await self.port.wait_for_reply_async(future, timeout)
+        if interrupted is not None and not interrupted.done():
+            try:
+                interrupted.set_result(reply)
+            except Exception:  # pylint: disable=broad-except
+                pass  # finished (or was cancelled) in the meantime
+        return reply
+
+    async def home(self, timeout=-1):
+        return await self.send(1, timeout=timeout)
+
+    async def move_abs(self, position, timeout=-1):
+        return await self.send(20, position, timeout=timeout)
+
+    async def move_rel(self, distance, timeout=-1):
+        return await self.send(21, distance, timeout=timeout)
+
+    async def move_vel(self, speed, timeout=-1):
+        """
+        Notes:
+            As with BinaryDevice.move_vel, the device replies
+            immediately, so the device is likely still moving once this
+            has been awaited.
+        """
+        return await self.send(22, speed, timeout=timeout)
+
+    async def stop(self, timeout=-1):
+        return await self.send(23, timeout=timeout)
+
+    async def set_target_speed(self, speed, timeout=-1):
+        return await self.send(42, speed, timeout=timeout)
+
+    async def set_acceleration(self, accel, timeout=-1):
+        return await self.send(43, accel, timeout=timeout)
+
+    async def get_setting(self, setting_number, timeout=-1):
+        return (await self.send(53, setting_number, timeout=timeout)).data
+
+    async def get_status(self, timeout=-1):
+        return (await self.send(54, timeout=timeout)).data
+
+    async def get_position(self, timeout=-1):
+        return (await self.send(60, timeout=timeout)).data
@@ -0,0 +1,84 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	asyncbinaryserial.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+asyncio counterpart of BinarySerial. The port always runs the reader
+thread (cf. binaryreplyrouter.py), and replies are awaited rather than
+blocked on, so that moves on several stages, the shutter, logging, etc.
+can all run as tasks in one event loop, e.g.,
+
+    async with AsyncBinarySerial("COM3") as port:
+        x, y = AsyncBinaryDevice(port, 2), AsyncBinaryDevice(port, 3)
+        await asyncio.gather(x.move_abs(1000), y.move_abs(2000, timeout=10))
+
+Commands are still written synchronously (a write is six bytes), so the
+blocking BinaryDevice can share the port, e.g., for setup.
+"""
+
+
+import asyncio
+import logging
+
+from .binaryserial import BinarySerial
+from .timeouterror import TimeoutError
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class AsyncBinarySerial(BinarySerial):
+    """A BinarySerial whose replies can be awaited from asyncio code.
+
+    Attributes:
+        poll_interval: Seconds the reader thread blocks in each read.
+    """
+
+    def __init__(self, port, baud=9600, timeout=5, inter_char_timeout=0.5,
+                 poll_interval=0.05):
+        """Opens the port and starts the reader thread.
+
+        Args:
+            port, baud, timeout, inter_char_timeout: As for BinarySerial.
+                timeout is the default time to wait for each reply.
+            poll_interval: As for BinarySerial.start_reader.
+        """
+        BinarySerial.__init__(self, port, baud, timeout, inter_char_timeout)
+        self.poll_interval = poll_interval
+        self.start_reader(poll_interval)
+
+    def open(self):
+        """Opens the serial port and restarts the reader thread."""
+        BinarySerial.open(self)
+        self.start_reader(self.poll_interval)
+
+    async def wait_for_reply_async(self, future, timeout=-1):
+        """Awaits a Future returned by expect_reply (or BinaryDevice.
+        submit) and returns its reply.
+
+        Args:
+            future: The concurrent.futures.Future to wait for.
+            timeout: Seconds to wait, or None to wait indefinitely.
+                Defaults to this port's timeout.
+
+        Raises:
+            zaber.serial.TimeoutError: No reply arrived before the
+                timeout elapsed. The Future is cancelled.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        try:
+            reply = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            logger.debug("< Receive timeout!")
+            raise TimeoutError("read timed out.")
+        return self._check_error(reply)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,151 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binarycodec.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Bulk encoding and decoding of Binary protocol frames, for the places
+where commands and replies go by many at a time (e.g., the velocity
+updates in write_part_circle, or polling positions quickly). Frames are
+plain (device number, command number, data[, message ID]) tuples rather
+than BinaryCommand/BinaryReply objects; they are packed with precompiled
+structs straight into a reusable buffer, and replies are decoded in one
+pass over everything read so far.
+"""
+
+
+import struct
+
+MESSAGE_LENGTH = 6
+
+# device number, command number, data
+FRAME = struct.Struct("<2Bl")
+
+# device number, command number, data (low 16 bits, then high 8 bits,
+#   signed, which sign-extends the 24-bit data), message ID
+ID_FRAME = struct.Struct("<2BHbB")
+
+# BinaryDevice never uses message ID 0 (cf. BinaryDevice.
+#   _next_message_id), so replies to frames sent with it are dropped.
+UNCLAIMED_MESSAGE_ID = 0
+
+
+def pack_frame_into(buffer, offset, device_number, command_number, data,
+                    message_id=None):
+    """Packs one frame into a writable buffer at the given offset.
+
+    Notes:
+        With a message ID, only the low 24 bits of data are sent (cf.
+        BinaryCommand.encode).
+    """
+    if message_id is None:
+        FRAME.pack_into(buffer, offset, device_number, command_number, data)
+    else:
+        ID_FRAME.pack_into(buffer, offset, device_number, command_number,
+                           data & 0xFFFF, ((data >> 16) + 128) % 256 - 128,
+                           message_id)
+
+
+def split_message_id(data):
+    """Splits the data value of a frame unpacked with FRAME from a
+    device with message IDs turned on into its (24-bit, sign-extended)
+    data and message ID.
+    """
+    message_id = (data >> 24) & 0xFF
+    data &= 0x00FFFFFF
+    if data & 0x00800000:
+        data -= 1 << 24
+    return data, message_id
+
+
+class FrameEncoder(object):
+    """Packs frames into a preallocated buffer, which grows as needed.
+
+    Not thread safe; BinarySerial only uses its encoder while holding
+    the write lock.
+    """
+
+    def __init__(self, capacity=16):
+        """
+        Args:
+            capacity: The number of frames to allocate room for.
+        """
+        self._buffer = bytearray(capacity * MESSAGE_LENGTH)
+
+    def encode(self, frames, message_id_devices=()):
+        """Packs frames into the buffer.
+
+        Args:
+            frames: A sequence of (device number, command number, data)
+                or (device number, command number, data, message ID)
+                tuples.
+            message_id_devices: Numbers of devices with message IDs
+                turned on; frames for these devices without a message
+                ID are sent with UNCLAIMED_MESSAGE_ID, so their replies
+                aren't mistaken for someone else's.
+
+        Returns:
+            A memoryview of the packed frames. It is only valid until
+            the next call to encode.
+        """
+        size = len(frames) * MESSAGE_LENGTH
+        if size > len(self._buffer):
+            self._buffer = bytearray(size)
+        buffer = self._buffer
+        offset = 0
+        for frame in frames:
+            if len(frame) > 3:
+                pack_frame_into(buffer, offset, *frame)
+            elif frame[0] in message_id_devices:
+                pack_frame_into(buffer, offset, frame[0], frame[1], frame[2],
+                                UNCLAIMED_MESSAGE_ID)
+            else:
+                FRAME.pack_into(buffer, offset, *frame)
+            offset += MESSAGE_LENGTH
+        return memoryview(buffer)[:size]
+
+
+class FrameDecoder(object):
+    """Decodes a stream of bytes into frames.
+
+    Bytes are appended to a reusable buffer; every complete frame in it
+    is decoded in one pass, and any partial frame is kept for the next
+    call.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    @property
+    def pending(self):
+        """The number of bytes of a partial frame held in the buffer."""
+        return len(self._buffer)
+
+    def clear(self):
+        """Discards any partial frame."""
+        del self._buffer[:]
+
+    def decode(self, data, message_id_devices=()):
+        """Appends data to the buffer and decodes all complete frames.
+
+        Args:
+            data: Bytes read from the port.
+            message_id_devices: Numbers of devices with message IDs
+                turned on, whose frames carry a message ID.
+
+        Returns:
+            A list of (device number, command number, data, message ID)
+            tuples, with message ID None for devices without them.
+        """
+        buffer = self._buffer
+        buffer += data
+        size = len(buffer) - len(buffer) % MESSAGE_LENGTH
+        if not size:
+            return []
+        with memoryview(buffer) as view, view[:size] as frames:
+            decoded = [(device, command, value, None)
+                       if device not in message_id_devices else
+                       (device, command) + split_message_id(value)
+                       for device, command, value in FRAME.iter_unpack(frames)]
+        del buffer[:size]
+        return decoded
@@ -11,7 +11,8 @@ Object used to pass commands to Zaber stages.
 
 
 import logging
-import struct
+
+from .binarycodec import FRAME, MESSAGE_LENGTH, pack_frame_into
 
 # See https://docs.python.org/2/howto/logging.html#configuring-logging-
 # for-a-library for info on why we have these two lines here.
@@ -71,20 +72,27 @@ class BinaryCommand(object):
     def encode(self):
         """Encodes a 6-byte byte string to be transmitted to a device.
 
+        Notes:
+            A message ID takes the place of the most significant byte of
+            the data value, so only the low 24 bits of data are sent
+            when the command has a message ID.
+
         Returns:
             A byte string of length 6, formatted according to Zaber's
             `Binary Protocol Manual`_.
         """
-        packed = struct.pack("<2Bl",
-                             self.device_number,
-                             self.command_number,
-                             self.data)
-        if self.message_id is not None:
-            packed = packed[:5] + struct.pack("B", self.message_id)
-              
-        return packed
+        if self.message_id is None:
+            return FRAME.pack(self.device_number, self.command_number, self.data)
+        packed = bytearray(MESSAGE_LENGTH)
+        pack_frame_into(packed, 0, self.device_number, self.command_number,
+                        self.data, self.message_id)
+        return bytes(packed)
 
     def __str__(self):
+        if self.message_id is None:
+            return "[{:d}, {:d}, {:d}]".format(self.device_number,
+                                               self.command_number,
+                                               self.data)
         return "[{:d}, {:d}, {:d}, id={:d}]".format(self.device_number,
                                            self.command_number,
                                            self.data,
@@ -0,0 +1,127 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binarycoordinated.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Moves several devices on one BinarySerial together, e.g., the x- and y-
+linear stages along one line. Every command leaves in the same write, so
+the devices start together, and the replies (each device's completion)
+are waited for all at once rather than one after another, so nothing
+goes on until every device has finished, however long each one takes.
+
+The time each device finished (as read off the port by the reader
+thread) is kept, e.g., to compare against how long the move was expected
+to take.
+"""
+
+
+import logging
+import threading
+import time
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class CoordinatedMove(object):
+    """Commands sent to several devices at once, and their completion.
+
+    Attributes:
+        port: The BinarySerial the devices are connected to.
+        commands: A list of (BinaryDevice, command number, data), at
+            most one per device (without message IDs, a device's
+            replies can't be told apart).
+        sent_at: time.perf_counter() when the commands were written, or
+            None if they haven't been.
+        completed_at: time.perf_counter() when each device's reply was
+            read, by device number.
+        replies: The replies, in the order of commands, once wait()
+            has returned.
+    """
+
+    def __init__(self, port, commands):
+        """
+        Args:
+            port: The BinarySerial the devices are connected to (its
+                reader thread must be running; cf. BinarySerial.
+                start_reader).
+            commands: An iterable of (BinaryDevice, command number,
+                data).
+
+        Raises:
+            ValueError: A device appears more than once in commands.
+        """
+        self.port = port
+        self.commands = list(commands)
+        numbers = [device.number for device, _, _ in self.commands]
+        if len(set(numbers)) != len(numbers):
+            raise ValueError("each device may only be moved once per "
+                             "CoordinatedMove.")
+        self.sent_at = None
+        self.completed_at = {}
+        self.replies = None
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Writes every command at once and returns without waiting."""
+        if self._futures:
+            raise RuntimeError("move already started.")
+        with self.port.transaction():
+            for device, command_number, data in self.commands:
+                future = device.submit(command_number, data)
+                future.add_done_callback(self._completer(device.number))
+                self._futures.append(future)
+        self.sent_at = time.perf_counter()
+
+    def _completer(self, device_number):
+        def done(future):
+            if not future.cancelled():
+                with self._lock:
+                    self.completed_at[device_number] = time.perf_counter()
+        return done
+
+    def wait(self):
+        """Waits for every device to reply (i.e., finish).
+
+        Raises:
+            zaber.serial.TimeoutError: Not every device replied within
+                the port's timeout.
+
+        Returns:
+            The replies, in the order of commands.
+        """
+        self.replies = self.port.wait_for_replies(self._futures)
+        logger.debug("coordinated move done: %s", ", ".join(
+            "{:d} after {:.3f} s".format(number, seconds)
+            for number, seconds in sorted(self.completion_times.items())))
+        return self.replies
+
+    def run(self):
+        """start(), then wait()."""
+        self.start()
+        return self.wait()
+
+    @property
+    def completion_times(self):
+        """Seconds after the commands were written at which each device
+        replied, by device number (so far).
+        """
+        if self.sent_at is None:
+            return {}
+        with self._lock:
+            # (a command skipped as unchanged, cf. BinaryDevice.submit,
+            #   is done before the write)
+            return {number: max(at - self.sent_at, 0.0)
+                    for number, at in self.completed_at.items()}
+
+    @property
+    def duration(self):
+        """Seconds from the write until the last device replied (so far),
+        or 0 if none has.
+        """
+        times = self.completion_times
+        return max(times.values()) if times else 0.0
@@ -14,8 +14,10 @@ import time
 import logging
 import uuid
 
+from concurrent.futures import Future
 from random import randint
 from .binarycommand import BinaryCommand
+from .binaryreply import BinaryReply
 from .unexpectedreplyerror import UnexpectedReplyError
 
 # See https://docs.python.org/2/howto/logging.html#configuring-logging-
@@ -23,6 +25,20 @@ from .unexpectedreplyerror import UnexpectedReplyError
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+# Device mode (cmd 40) bits; cf. the table above get_device_mode.
+MODE_DISABLE_AUTO_REPLY = 1
+MODE_MESSAGE_IDS = 64
+
+# Settings whose last value sent is remembered (cf. BinaryDevice.
+#   settings), so that setting the same value again can be skipped:
+#   device mode, home speed, target speed, acceleration, max position,
+#   (rotary) auto-reply, min position.
+SHADOWED_SETTINGS = (40, 41, 42, 43, 44, 101, 106)
+
+# Commands after which the remembered settings can't be trusted: reset,
+#   home, renumber, restore settings.
+INVALIDATING_COMMANDS = (0, 1, 2, 36)
+
 
 class BinaryDevice(object):
     """A class to represent a Zaber device in the Binary protocol. It is safe
@@ -31,24 +47,33 @@ class BinaryDevice(object):
     Attributes:
         port: A BinarySerial object which represents the port to which
             this device is connected.
-        number: The integer number of this device. 1-255.
+        number: The integer number of this device. 1-254.
+        message_ids: True if this device tags each command with a
+            message ID (cf. enable_message_ids).
+        settings: The last value sent for each of SHADOWED_SETTINGS, by
+            command number, as far as is known. Commands which would set
+            a setting to the value it already has aren't sent.
     """
     
     def __init__(self, port, number):
         """
         Args:
             port: A BinarySerial object to use as a parent port.
-            number: An integer between 1 and 255 which is the number of
+            number: An integer between 1 and 254 which is the number of
                 this device.
 
         Raises:
             ValueError: The device number was invalid.
         """
-        if number > 255 or number < 1:
-            raise ValueError("Device number must be 1-255.")
+        if number > 254 or number < 1:
+            raise ValueError("Device number must be 1-254.")
         self.number = number
         self.port = port
-        
+        self.message_ids = False
+        self._message_id = 0
+        self._settings = {}
+        self._settings_epoch = None
+
     def send(self, *args, await_reply = False):
         """Sends a command to this device, then waits for a response.
 
@@ -87,26 +112,41 @@ class BinaryDevice(object):
         Returns: A BinaryReply containing the reply received.
         """
         
-        if len(args) == 1 and isinstance(args[0], BinaryCommand):
-            command = args[0]
-        elif len(args) < 4:
-            command = BinaryCommand(self.number, *args)  # pylint: disable=E1120
+        command = self._command(*args)
+        unchanged = self._unchanged(command)
+        if unchanged is not None:
+            return unchanged if await_reply else None
+
+        if self.port.reader_running:
+            if await_reply:
+                return self.port.wait_for_reply(self.submit(command))
+            # The reader thread routes replies, so only writes need the
+            #   lock and other devices can be sent commands meanwhile.
+            with self.port.lock.write_lock:
+                if self.message_ids:
+                    # nobody claims this ID, so its reply is dropped
+                    command.message_id = self._next_message_id()
+                elif await_reply is not None:
+                    self.disable_auto_reply()
+                self.port.write(command)
+                self._remember(command)
+            return None
 
-        """
-        # I don't think it's necessary to prevent replies being received in the wrong order (e.g., by checking message_id) because a device responds "busy" (cmd 255, data 255) if an additional command is given before the present one is completed.
-        command.message_id = self.command_index
-        self.command_index += 1
-        """
-        
         with self.port.lock:
             if await_reply:
                 self.enable_auto_reply()
+                sent_at = time.perf_counter()
                 self.port.write(command)
-                return self.port.read_device(self.number)
+                self._remember(command)
+                reply = self.port.read_device(self.number)
+                self.port.metrics.latency(command.command_number,
+                                          time.perf_counter() - sent_at)
+                return reply
             else:
                 if await_reply is not None:
                     self.disable_auto_reply()
                 self.port.write(command)
+                self._remember(command)
                 return None
 
         """
@@ -122,6 +162,144 @@ class BinaryDevice(object):
         """
         #return reply
 
+    def submit(self, *args):
+        """Sends a command to this device and returns a Future for its
+        reply, without waiting for it.
+
+        Args:
+            *args: Either a single BinaryCommand, or 1-2 integers
+                specifying, in order, the command number and data value
+                of the command to be sent.
+
+        Notes:
+            Requires the port's reader thread (cf. BinarySerial.
+            start_reader). Pass the Future to the port's wait_for_reply
+            to get the reply.
+
+            With message IDs turned on (cf. enable_message_ids), each
+            command is tagged with a rolling ID and its reply is matched
+            back by ID, so several commands (e.g., settings and position
+            queries) can be in flight to this device at once. Without
+            them, the Future is for the next reply from this device, so
+            only submit one command at a time per device.
+
+        Raises:
+            RuntimeError: The reader thread is not running.
+
+        Returns:
+            A concurrent.futures.Future whose result is a BinaryReply.
+        """
+        command = self._command(*args)
+        unchanged = self._unchanged(command)
+        if unchanged is not None:
+            future = Future()
+            future.set_result(unchanged)
+            return future
+
+        with self.port.lock.write_lock:
+            if self.message_ids:
+                command.message_id = self._next_message_id()
+            else:
+                self.enable_auto_reply()
+            future = self.port.expect_reply(self.number, command.message_id)
+            self.port.metrics.track(future, command)
+            self.port.write(command)
+            self._remember(command)
+        return future
+
+    def enable_message_ids(self):
+        """Turns on message IDs (device mode bit 6), so that commands can
+        be pipelined with submit() and no longer need auto-reply to be
+        toggled around them.
+
+        Notes:
+            Requires the port's reader thread, and should be called
+            while the device is idle. This also re-enables auto-reply,
+            since replies are matched by ID instead.
+
+        Raises:
+            RuntimeError: The reader thread is not running.
+        """
+        if not self.port.reader_running:
+            raise RuntimeError("message IDs require the reader thread "
+                               "(call start_reader first).")
+        with self.port.lock.write_lock:
+            if self.number == 1:  # rotary stage
+                self._write_setting(101, 0)
+            self._write_setting(40, self._mode() | MODE_MESSAGE_IDS)
+            self.port.message_id_devices.add(self.number)
+            self.message_ids = True
+
+    def disable_message_ids(self):
+        """Turns message IDs back off (cf. enable_message_ids)."""
+        with self.port.lock.write_lock:
+            self.message_ids = False
+            self._write_setting(40, self._mode() & ~MODE_MESSAGE_IDS)
+            self.port.message_id_devices.discard(self.number)
+
+    @property
+    def settings(self):
+        self._check_settings_epoch()
+        return dict(self._settings)
+
+    def invalidate_settings(self):
+        """Forgets the remembered settings, so that the next command to
+        set each of them is sent regardless (e.g., after changing them
+        with the knob or another program).
+
+        Notes:
+            This happens automatically after reset/home/renumber/restore
+            commands, after an error reply from this device, and when
+            the port is closed or reopened.
+        """
+        self._settings = {}
+        self._settings_epoch = self.port.settings_epoch(self.number)
+
+    def _check_settings_epoch(self):
+        if self._settings_epoch != self.port.settings_epoch(self.number):
+            self.invalidate_settings()
+
+    def _unchanged(self, command):
+        # A stand-in for the reply to a command which sets a setting to
+        #   the value it already has, or None if the command is needed.
+        if command.command_number not in SHADOWED_SETTINGS:
+            return None
+        self._check_settings_epoch()
+        if self._settings.get(command.command_number) != command.data:
+            return None
+        logger.debug("= %s (unchanged)", command)
+        self.port.metrics.skipped(self.number, command.command_number)
+        # the device would have replied with the value set
+        return BinaryReply([self.number, command.command_number,
+                            command.data])
+
+    def _remember(self, command):
+        if command.command_number in INVALIDATING_COMMANDS:
+            self.invalidate_settings()
+        elif command.command_number in SHADOWED_SETTINGS:
+            self._check_settings_epoch()
+            self._settings[command.command_number] = command.data
+
+    def _write_setting(self, command_number, data):
+        # For the auto-reply/mode toggles, which are written directly
+        #   (their echoes are dropped; cf. binaryreplyrouter.py).
+        command = BinaryCommand(self.number, command_number, data)
+        with self.port.lock.write_lock:
+            if self._unchanged(command) is None:
+                self.port.write(command)
+                self._remember(command)
+
+    def _command(self, *args):
+        if len(args) == 1 and isinstance(args[0], BinaryCommand):
+            command = args[0]
+            command.device_number = self.number
+            return command
+        return BinaryCommand(self.number, *args)  # pylint: disable=E1120
+
+    def _next_message_id(self):
+        # IDs roll over 1-255, so up to 255 commands can be in flight.
+        self._message_id = self._message_id % 255 + 1
+        return self._message_id
 
     def home(self, await_reply = False):
         return self.send(1, await_reply = await_reply)
@@ -188,17 +366,31 @@ class BinaryDevice(object):
     def set_device_mode(self, mode, await_reply = False):
         return self.send(40, mode, await_reply = await_reply)
 
+    # Both keep the other mode bits (e.g., message IDs) as they are, and
+    #   are skipped if auto-reply is already as asked (cf. settings). With
+    #   message IDs on, auto-reply stays on: replies are matched by ID,
+    #   and those nobody waits for are dropped (cf. enable_message_ids)
     def enable_auto_reply(self):
-        if self.number is 1:  # rotary stage
-            self.port.write(BinaryCommand(self.number, 101, 0))
+        if self.number == 1:  # rotary stage
+            self._write_setting(101, 0)
         else:
-            self.port.write(BinaryCommand(self.number, 40, 0))
+            self._write_setting(40, self._mode())
         
     def disable_auto_reply(self):
-        if self.number is 1:  # rotary stage
-            self.port.write(BinaryCommand(self.number, 101, 1))
+        if self.message_ids:
+            return
+        if self.number == 1:  # rotary stage
+            self._write_setting(101, 1)
         else:
-            self.port.write(BinaryCommand(self.number, 40, 1))
+            self._write_setting(40, self._mode() | MODE_DISABLE_AUTO_REPLY)
+
+    def _mode(self):
+        # device mode without the auto-reply bit
+        self._check_settings_epoch()
+        mode = self._settings.get(40)
+        if mode is None:
+            return MODE_MESSAGE_IDS if self.message_ids else 0
+        return mode & ~MODE_DISABLE_AUTO_REPLY
 
     """
     # to make more complete: https://www.zaber.com/wiki/Manuals/Binary_Protocol_Manual#Quick_Command_Reference
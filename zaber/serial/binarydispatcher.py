@@ -0,0 +1,180 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binarydispatcher.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Writes a precomputed schedule of frames to a BinarySerial from its own
+thread, each block of frames at an absolute deadline (cf. circle_
+schedule.py, which packs the velocity updates for write_part_circle).
+The thread does nothing between deadlines but wait, so the time the
+computer takes to work out what to send is out of the critical path.
+
+Timing error doesn't accumulate: every deadline is measured from the
+start of the schedule, not from the previous write. The dispatcher
+keeps track of how late each write finishes (lateness), and starts
+writes that much earlier from then on (lead), so that a write which
+consistently takes, e.g., 2 ms to hand over its frames still finishes
+on time. A block whose successor is already due by the time it could
+be sent is skipped rather than sent late, since only the latest block
+matters (e.g., the latest velocity); the last block is never skipped.
+"""
+
+
+import logging
+import threading
+import time
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_LENGTH = 6
+
+
+class BinaryDispatcher(object):
+    """Sends blocks of pre-encoded frames at scheduled times.
+
+    Attributes:
+        written: The number of blocks written so far.
+        skipped: The number of blocks skipped because the next block
+            was already due.
+        overruns: The number of blocks which finished writing more than
+            tolerance seconds late.
+        max_lateness: The latest (seconds) any write finished.
+        lead: How much earlier (seconds) than its deadline each write
+            is currently started.
+    """
+
+    def __init__(self, port, times, frames, block_size, end=None,
+                 tolerance=0.002, spin=0.002, gain=0.25):
+        """
+        Args:
+            port: The BinarySerial to write to.
+            times: A sequence of the times (seconds after start()) at
+                which to write each block, in increasing order.
+            frames: A bytes-like object of the blocks, one after
+                another (len(times) * block_size frames).
+            block_size: The number of frames in each block.
+            end: Seconds after start() at which the schedule ends (e.g.,
+                when the last velocity stops applying); join() returns
+                no earlier. Defaults to the time of the last block.
+            tolerance: Seconds late a write may finish before it counts
+                as an overrun.
+            spin: Seconds before each deadline to stop sleeping and wait
+                in a busy loop instead (sleep isn't precise).
+            gain: How quickly (0-1) the lead follows the lateness.
+
+        Raises:
+            ValueError: frames is not the size the schedule needs.
+        """
+        self.port = port
+        self.times = [float(t) for t in times]
+        self.frames = memoryview(frames).cast("B")
+        self.block_bytes = block_size * MESSAGE_LENGTH
+        if len(self.frames) != len(self.times) * self.block_bytes:
+            raise ValueError("frames must have {:d} bytes ({:d} blocks of {:d} "
+                             "frames).".format(len(self.times) * self.block_bytes,
+                                                len(self.times), block_size))
+        self.end = self.times[-1] if end is None and self.times else (end or 0.0)
+        self.tolerance = tolerance
+        self.spin = spin
+        self.gain = gain
+
+        # The lead never grows past half the shortest interval, so that
+        #   writes stay in order.
+        gaps = [b - a for a, b in zip(self.times, self.times[1:]) if b > a]
+        self._max_lead = 0.5 * min(gaps) if gaps else 0.0
+
+        self.written = 0
+        self.skipped = 0
+        self.overruns = 0
+        self.max_lateness = 0.0
+        self.lead = 0.0
+        self._total_lateness = 0.0
+        self._start = None
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def mean_lateness(self):
+        return self._total_lateness / self.written if self.written else 0.0
+
+    def start(self):
+        """Starts the schedule now, on a new thread."""
+        if self._thread is not None:
+            raise RuntimeError("dispatcher already started.")
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run,
+                                        name="BinaryDispatcher", daemon=True)
+        self._thread.start()
+
+    def join(self):
+        """Waits for the schedule to end.
+
+        Raises:
+            Whatever exception stopped the dispatcher thread, if any.
+        """
+        # (in short waits, so that KeyboardInterrupt gets through)
+        while self._thread.is_alive():
+            self._thread.join(0.1)
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        """Abandons the rest of the schedule and waits for the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            self._dispatch()
+        except Exception as e:
+            logger.exception("dispatcher stopped")
+            self._error = e
+        logger.debug("dispatched %d blocks (%d skipped, %d overruns); "
+                     "lateness mean %.2f ms max %.2f ms", self.written,
+                     self.skipped, self.overruns, 1000 * self.mean_lateness,
+                     1000 * self.max_lateness)
+
+    def _dispatch(self):
+        start, times, size = self._start, self.times, self.block_bytes
+        last = len(times) - 1
+        for i, t in enumerate(times):
+            deadline = start + t
+            if i < last and time.perf_counter() >= start + times[i + 1] - self.lead:
+                self.skipped += 1
+                self.port.metrics.dispatch_skipped()
+                continue
+            if not self._sleep_until(deadline - self.lead):
+                return
+            self.port.write_encoded(self.frames[i * size:(i + 1) * size])
+            lateness = time.perf_counter() - deadline
+            self._account(lateness)
+        self._sleep_until(start + self.end)
+
+    def _account(self, lateness):
+        self.written += 1
+        self._total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if lateness > self.tolerance:
+            self.overruns += 1
+        self.port.metrics.dispatch(lateness)
+        self.lead = min(max(self.lead + self.gain * lateness, 0.0), self._max_lead)
+
+    def _sleep_until(self, target):
+        """Waits until target (perf_counter time); returns False if the
+        dispatcher was stopped first.
+        """
+        while True:
+            remaining = target - time.perf_counter()
+            if remaining <= 0:
+                return not self._stop.is_set()
+            if remaining > self.spin:
+                if self._stop.wait(remaining - self.spin):
+                    return False
+            elif self._stop.is_set():
+                return False
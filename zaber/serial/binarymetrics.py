@@ -0,0 +1,220 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binarymetrics.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Counters for the traffic on a BinarySerial port, to see where the time
+goes on the bus: frames and bytes each way by device and command, time
+from writing a command to its reply, time spent waiting for the port's
+write lock, timeouts, error (including busy) replies, and how late
+scheduled writes (cf. binarydispatcher.py) went out. Every port
+keeps one (BinarySerial.metrics); each update is a couple of dict
+operations under a lock, so it can be left on.
+
+    print(port.metrics.format_text())
+    port.metrics.write_json("bus metrics.json")
+"""
+
+
+import bisect
+import json
+import threading
+import time
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket
+#   is everything slower.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+              30000, 60000)
+
+# Data value of an error reply meaning the device was busy.
+BUSY_ERROR = 255
+
+
+class Histogram(object):
+    """Counts of durations in BUCKETS_MS buckets, with count/total/max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = 1000 * seconds
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "buckets_ms": {("<=%g" % bound if i < len(BUCKETS_MS) else
+                            ">%g" % BUCKETS_MS[-1]): n
+                           for i, (bound, n) in enumerate(
+                               zip(BUCKETS_MS + (None,), self.counts)) if n},
+        }
+
+
+class BinaryMetrics(object):
+    """Traffic counters for one port. All methods are thread safe.
+
+    Attributes:
+        started: The time.time() at which counting started (or was last
+            reset).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears all counters."""
+        with self._lock:
+            self.started = time.time()
+            self._sent = {}         # (device, command) -> [frames, bytes]
+            self._received = {}     # (device, command) -> [frames, bytes]
+            self._skipped = {}      # (device, command) -> frames not sent
+            self._latency = {}      # command -> Histogram
+            self._lock_wait = Histogram()
+            self._timeouts = {}     # device -> count
+            self._errors = {}       # (device, error code) -> count
+            self._dispatch = Histogram()
+            self._dispatch_skipped = 0
+
+    def sent(self, device_number, command_number, size=6):
+        with self._lock:
+            counts = self._sent.setdefault((device_number, command_number), [0, 0])
+            counts[0] += 1
+            counts[1] += size
+
+    def received(self, reply, size=6):
+        with self._lock:
+            counts = self._received.setdefault(
+                (reply.device_number, reply.command_number), [0, 0])
+            counts[0] += 1
+            counts[1] += size
+            if reply.command_number == 255:
+                key = (reply.device_number, reply.data)
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def skipped(self, device_number, command_number):
+        """Counts a command which wasn't sent because it would have
+        changed nothing (cf. BinaryDevice.settings).
+        """
+        with self._lock:
+            key = (device_number, command_number)
+            self._skipped[key] = self._skipped.get(key, 0) + 1
+
+    def latency(self, command_number, seconds):
+        with self._lock:
+            histogram = self._latency.get(command_number)
+            if histogram is None:
+                histogram = self._latency[command_number] = Histogram()
+            histogram.add(seconds)
+
+    def lock_wait(self, seconds):
+        with self._lock:
+            self._lock_wait.add(seconds)
+
+    def dispatch(self, seconds):
+        """Records how late a scheduled write finished."""
+        with self._lock:
+            self._dispatch.add(seconds)
+
+    def dispatch_skipped(self):
+        """Counts a scheduled write skipped because the next was due."""
+        with self._lock:
+            self._dispatch_skipped += 1
+
+    def timeout(self, device_number):
+        """Counts a timeout waiting for a reply from a device (0 if from
+        any device).
+        """
+        with self._lock:
+            self._timeouts[device_number] = self._timeouts.get(device_number, 0) + 1
+
+    def track(self, future, command, sent_at=None):
+        """Records the latency of command's reply when future (cf.
+        BinarySerial.expect_reply) is done, or a timeout if it is
+        cancelled.
+        """
+        sent_at = time.perf_counter() if sent_at is None else sent_at
+        device_number, command_number = command.device_number, command.command_number
+
+        def done(future):
+            if future.cancelled():
+                self.timeout(device_number)
+            else:
+                self.latency(command_number, time.perf_counter() - sent_at)
+        future.add_done_callback(done)
+
+    def snapshot(self):
+        """Returns the counters as a JSON-serializable dict."""
+        def by_key(counts):
+            return [{"device": device, "command": command,
+                     "frames": n[0], "bytes": n[1]}
+                    for (device, command), n in sorted(counts.items())]
+
+        with self._lock:
+            return {
+                "started": self.started,
+                "seconds": time.time() - self.started,
+                "sent": by_key(self._sent),
+                "received": by_key(self._received),
+                "skipped": [{"device": device, "command": command, "frames": n}
+                            for (device, command), n in sorted(self._skipped.items())],
+                "latency": {str(command): histogram.snapshot()
+                            for command, histogram in sorted(self._latency.items())},
+                "lock_wait": self._lock_wait.snapshot(),
+                "dispatch": dict(self._dispatch.snapshot(),
+                                 skipped=self._dispatch_skipped),
+                "timeouts": {str(device): n
+                             for device, n in sorted(self._timeouts.items())},
+                "errors": [{"device": device, "code": code, "count": n}
+                           for (device, code), n in sorted(self._errors.items())],
+                "busy_errors": sum(n for (_, code), n in self._errors.items()
+                                   if code == BUSY_ERROR),
+            }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json(indent=2))
+
+    def format_text(self):
+        """Returns a short human-readable summary of the counters."""
+        snapshot = self.snapshot()
+        lines = ["bus metrics ({:.1f} s):".format(snapshot["seconds"])]
+        for direction in ("sent", "received"):
+            frames = sum(row["frames"] for row in snapshot[direction])
+            size = sum(row["bytes"] for row in snapshot[direction])
+            lines.append("  {:<9}{:>7d} frames {:>8d} bytes".format(direction, frames, size))
+            for row in snapshot[direction]:
+                lines.append("    dev {device:>3d} cmd {command:>3d}: "
+                             "{frames:>6d} frames".format(**row))
+        skipped = sum(row["frames"] for row in snapshot["skipped"])
+        if skipped:
+            lines.append("  skipped  {:>7d} frames (unchanged settings)".format(skipped))
+        for command, latency in snapshot["latency"].items():
+            lines.append("  cmd {:>3} reply: n={:d} mean={:.1f} ms max={:.1f} ms".format(
+                command, latency["count"], latency["mean_ms"], latency["max_ms"]))
+        wait = snapshot["lock_wait"]
+        lines.append("  lock wait: n={:d} mean={:.2f} ms max={:.2f} ms".format(
+            wait["count"], wait["mean_ms"], wait["max_ms"]))
+        dispatch = snapshot["dispatch"]
+        if dispatch["count"] or dispatch["skipped"]:
+            lines.append("  dispatch lateness: n={:d} mean={:.2f} ms max={:.2f} ms "
+                         "skipped={:d}".format(dispatch["count"], dispatch["mean_ms"],
+                                               dispatch["max_ms"], dispatch["skipped"]))
+        lines.append("  timeouts: {:d}  errors: {:d} (busy: {:d})".format(
+            sum(snapshot["timeouts"].values()),
+            sum(row["count"] for row in snapshot["errors"]),
+            snapshot["busy_errors"]))
+        return "\n".join(lines)
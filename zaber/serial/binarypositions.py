@@ -0,0 +1,195 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binarypositions.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Keeps track of where each device on a BinarySerial is, from the traffic
+on the port, so that it doesn't have to be asked (get_position) before
+every move. The replies to home, move_abs, move_rel and stop carry the
+position the device finished at, and the reply to get_position the
+position it's at; a device whose last such reply came after the last
+command that could have moved it is known to be there.
+
+A device isn't known while a move is in flight, after move_vel (until
+the reply to stop, or to get_position once it has stopped), after an
+error reply, or when a move_abs finishes somewhere other than where it
+was sent (drift, e.g., a target beyond the device's limits); then the
+position has to be asked for again. Moves made with the knobs aren't
+reported while manual move tracking is disabled, so ask the devices
+(invalidate, then get_position) after moving them by hand.
+"""
+
+
+import logging
+import threading
+import time
+
+from .binarycodec import FRAME, split_message_id
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Commands whose reply data is the position the device finished at.
+FINAL_POSITION_COMMANDS = (1, 20, 21, 23)
+
+# Commands which move a device until their reply.
+MOVE_COMMANDS = (1, 20, 21)
+
+MOVE_ABS = 20
+MOVE_VEL = 22
+STOP = 23
+GET_POSITION = 60
+MANUAL_MOVE_TRACKING = 8
+MOVE_TRACKING = 10
+ERROR = 255
+
+# Microsteps/s per unit of move_vel data (T-series devices), used only
+#   for estimate().
+SPEED_RESOLUTION = 9.375
+
+
+class _DeviceState(object):
+
+    def __init__(self):
+        self.position = None        # last position reported, or None
+        self.known = False          # position is where the device is now
+        self.moves = 0              # moves in flight (replies not yet read)
+        self.target = None          # data of the last move_abs in flight
+        self.velocity = None        # data of the last move_vel, while moving
+        self.since = None           # time.perf_counter() of position/velocity
+
+
+class PositionTracker(object):
+    """Positions of the devices on one port, as last reported by them.
+    All methods are thread safe.
+
+    Attributes:
+        drift: The number of moves (move_abs) which finished somewhere
+            other than where they were sent.
+        tolerance: How far (microsteps) a move_abs may finish from its
+            target without counting as drift.
+    """
+
+    def __init__(self, message_id_devices=None, tolerance=0):
+        """
+        Args:
+            message_id_devices: The set of numbers of devices whose
+                frames carry message IDs (BinarySerial.message_id_
+                devices); read as frames are sent.
+            tolerance: cf. tolerance.
+        """
+        self.message_id_devices = (set() if message_id_devices is None
+                                   else message_id_devices)
+        self.tolerance = tolerance
+        self.drift = 0
+        self._lock = threading.Lock()
+        self._devices = {}
+
+    def _device(self, device_number):
+        state = self._devices.get(device_number)
+        if state is None:
+            state = self._devices[device_number] = _DeviceState()
+        return state
+
+    def sent(self, device_number, command_number, data):
+        """Notes a command written to the port."""
+        if command_number not in MOVE_COMMANDS and command_number != MOVE_VEL:
+            return
+        with self._lock:
+            state = self._device(device_number)
+            state.known = False
+            if command_number == MOVE_VEL:
+                state.velocity = data
+                state.since = time.perf_counter()
+            else:
+                state.moves += 1
+                state.target = data if command_number == MOVE_ABS else None
+
+    def sent_encoded(self, data):
+        """Notes frames written to the port already packed (cf.
+        BinarySerial.write_encoded).
+        """
+        for device_number, command_number, value in FRAME.iter_unpack(data):
+            if device_number in self.message_id_devices:
+                value = split_message_id(value)[0]
+            self.sent(device_number, command_number, value)
+
+    def received(self, reply):
+        """Notes a reply read from the port."""
+        command_number = reply.command_number
+        with self._lock:
+            if command_number == ERROR:
+                # can't tell which command failed, so assume the worst
+                state = self._device(reply.device_number)
+                state.known = False
+                state.moves = 0
+                return
+            if command_number in FINAL_POSITION_COMMANDS:
+                state = self._device(reply.device_number)
+                if command_number == STOP:
+                    state.moves = 0
+                    state.velocity = None
+                elif state.moves > 0:
+                    state.moves -= 1
+                drifted = (command_number == MOVE_ABS and state.target is not None
+                           and abs(reply.data - state.target) > self.tolerance)
+                if drifted:
+                    self.drift += 1
+                    logger.warning("device %d finished at %d, not %d",
+                                   reply.device_number, reply.data, state.target)
+                self._report(state, reply.data, not drifted)
+            elif command_number in (GET_POSITION, MANUAL_MOVE_TRACKING):
+                self._report(self._device(reply.device_number), reply.data, True)
+            elif command_number == MOVE_TRACKING:
+                self._report(self._device(reply.device_number), reply.data, False)
+
+    def _report(self, state, position, settled):
+        state.position = position
+        state.since = time.perf_counter()
+        state.known = settled and state.moves == 0 and state.velocity is None
+        if state.moves == 0:
+            state.target = None
+
+    def known(self, device_number):
+        """Returns the device's position (microsteps) if it is known
+        (cf. the description at the top of this file), else None.
+        """
+        with self._lock:
+            state = self._devices.get(device_number)
+            if state is None or not state.known:
+                return None
+            return state.position
+
+    def estimate(self, device_number):
+        """Returns a best guess at the device's position (microsteps):
+        the known position, or where its move in flight is going, or
+        (while it moves at constant speed) the last position reported
+        plus the distance since at the speed sent, ignoring
+        acceleration. None if there's nothing to go on.
+        """
+        with self._lock:
+            state = self._devices.get(device_number)
+            if state is None:
+                return None
+            if state.known:
+                return state.position
+            if state.moves > 0 and state.target is not None:
+                return state.target
+            if state.velocity is not None and state.position is not None:
+                elapsed = time.perf_counter() - state.since
+                return int(state.position + state.velocity * SPEED_RESOLUTION * elapsed)
+            return state.position
+
+    def invalidate(self, device_number=None):
+        """Forgets that a device's position (or every device's, if
+        device_number is None) is known, e.g., after it was moved by
+        hand or the port was reopened.
+        """
+        with self._lock:
+            states = (self._devices.values() if device_number is None
+                      else [self._device(device_number)])
+            for state in states:
+                state.known = False
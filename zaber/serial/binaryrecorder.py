@@ -0,0 +1,134 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binaryrecorder.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Records every frame sent to and received from the stages, with the time
+it was sent or read, to a compact binary log; cf. BinarySerial.
+start_recording. A recording can be played back in place of the stages
+with binaryreplay.py, e.g., to re-run a session offline.
+
+The log is a header (RECORDING_HEADER: magic, version, and the wall
+clock time at which recording started) followed by one RECORD per frame:
+seconds since recording started (monotonic clock), direction (SENT or
+RECEIVED), and the 6 bytes of the frame.
+"""
+
+
+import logging
+import struct
+import threading
+import time
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_LENGTH = 6
+
+MAGIC = b"ZBRL"
+VERSION = 1
+
+# magic, version, wall clock start time
+RECORDING_HEADER = struct.Struct("<4sBd")
+
+# seconds since start, direction, frame
+RECORD = struct.Struct("<dB6s")
+
+# Directions: from the computer to the stages, and back.
+SENT = 0
+RECEIVED = 1
+
+
+class BinaryRecorder(object):
+    """Writes frames to a recording. Thread safe.
+
+    Bytes are framed separately in each direction, so partial frames
+    (e.g., from a read which timed out halfway) are recorded once they
+    are complete.
+    """
+
+    def __init__(self, path):
+        """Creates (or overwrites) the recording at path."""
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._partial = {SENT: bytearray(), RECEIVED: bytearray()}
+        self.frames = 0
+        self._file.write(RECORDING_HEADER.pack(MAGIC, VERSION, time.time()))
+
+    def record(self, direction, data):
+        """Records the frames in data (bytes sent or read)."""
+        if not data:
+            return
+        now = time.perf_counter() - self._start
+        with self._lock:
+            if self._file is None:
+                return
+            partial = self._partial[direction]
+            partial += data
+            size = len(partial) - len(partial) % MESSAGE_LENGTH
+            for offset in range(0, size, MESSAGE_LENGTH):
+                self._file.write(RECORD.pack(
+                    now, direction, bytes(partial[offset:offset + MESSAGE_LENGTH])))
+                self.frames += 1
+            del partial[:size]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        logger.debug("recorded %d frames", self.frames)
+
+
+class RecordingSerial(object):
+    """Wraps a (PySerial-like) serial port, recording everything written
+    to and read from it. Everything else is passed through.
+    """
+
+    def __init__(self, ser, recorder):
+        object.__setattr__(self, "ser", ser)
+        object.__setattr__(self, "recorder", recorder)
+
+    def write(self, data):
+        self.recorder.record(SENT, bytes(data))
+        return self.ser.write(data)
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self.recorder.record(RECEIVED, data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        # e.g., timeout, baudrate
+        setattr(self.ser, name, value)
+
+
+def read_recording(path):
+    """Reads a recording.
+
+    Returns:
+        A (start time, records) tuple: the wall clock time at which
+        recording started, and a list of (seconds since start,
+        direction, frame) tuples.
+
+    Raises:
+        ValueError: The file is not a recording (of a known version).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < RECORDING_HEADER.size:
+        raise ValueError("{!r} is not a recording.".format(path))
+    magic, version, started = RECORDING_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("{!r} is not a recording (or is from an unknown "
+                         "version).".format(path))
+    body = memoryview(data)[RECORDING_HEADER.size:]
+    body = body[:len(body) - len(body) % RECORD.size]
+    return started, list(RECORD.iter_unpack(body))
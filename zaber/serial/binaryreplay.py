@@ -0,0 +1,199 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binaryreplay.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Plays a recording (cf. binaryrecorder.py) back in place of the stages,
+so that a session can be re-run offline, e.g., to measure the time
+spent on the computer's side on its own, or to check that changes to
+the way replies are read still cope with real traffic.
+
+Each frame the computer sends is compared with the next frame sent in
+the recording (differences are logged and kept in mismatches), and the
+replies which were received after that frame in the recording, up to
+the next frame sent, are played back: as long after the write as they
+originally came (scaled by speedup), or immediately if speedup is None.
+
+Open it directly, or through BinarySerial("zaberreplay://<path>"), using
+the URL handler in protocol_zaberreplay.py.
+"""
+
+
+import heapq
+import logging
+import threading
+import time
+
+from .binaryrecorder import RECEIVED, SENT, read_recording
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_LENGTH = 6
+
+
+class BinaryReplay(object):
+    """A file-like object (read/write/in_waiting) which plays back a
+    recorded session.
+
+    Attributes:
+        speedup: How many times faster than recorded the replies are
+            played back, or None to play them back immediately.
+        timeout: Default number of seconds that read() waits for data;
+            None waits forever.
+        mismatches: A list of (index, expected frame, frame written)
+            for each frame written which differed from the recording.
+        sent: The number of frames written so far.
+    """
+
+    def __init__(self, path, speedup=1.0, timeout=None):
+        """
+        Args:
+            path: The path of the recording.
+            speedup: A number greater than 0, or None (cf. above).
+            timeout: Default read timeout, in seconds.
+
+        Raises:
+            ValueError: The file is not a recording, or speedup was not
+                positive.
+        """
+        if speedup is not None and speedup <= 0:
+            raise ValueError("speedup must be greater than 0 (or None).")
+        self.speedup = speedup
+        self.timeout = timeout
+        self.mismatches = []
+        self.sent = 0
+
+        # Each step is a frame sent, its time, and the replies received
+        #   after it as (delay, frame); replies received before anything
+        #   was sent are in a first step with no frame.
+        _, records = read_recording(path)
+        self._steps = [[None, 0.0, []]]
+        for t, direction, frame in records:
+            if direction == SENT:
+                self._steps.append([frame, t, []])
+            elif direction == RECEIVED:
+                step = self._steps[-1]
+                step[2].append((t - step[1], frame))
+        self._next_step = 1
+
+        self._cond = threading.Condition()
+        self._rx_buffer = bytearray()
+        self._output = []               # heap of (ready, seq, frame)
+        self._ready = bytearray()       # replies due, not yet read
+        self._seq = 0
+        self.is_open = True
+        self._play(self._steps[0], time.perf_counter())
+
+    def write(self, data):
+        """Takes frames from the computer, and schedules the replies
+        recorded after each.
+
+        Returns:
+            The number of bytes written.
+        """
+        data = bytes(data)
+        with self._cond:
+            now = time.perf_counter()
+            self._rx_buffer.extend(data)
+            while len(self._rx_buffer) >= MESSAGE_LENGTH:
+                frame = bytes(self._rx_buffer[:MESSAGE_LENGTH])
+                del self._rx_buffer[:MESSAGE_LENGTH]
+                self._receive(frame, now)
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size=1, timeout=-1):
+        """Reads up to size bytes of replies, waiting for them to be due.
+
+        Args:
+            size: The number of bytes to read.
+            timeout: Seconds to wait for size bytes; None waits forever
+                and 0 returns immediately. Defaults to this replay's
+                timeout.
+
+        Returns:
+            A bytes object of at most size bytes; fewer if the timeout
+            elapsed first.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                self._commit(now)
+                if len(self._ready) >= size or not self.is_open:
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        break
+                if self._output:
+                    wait = self._output[0][0] - now
+                    remaining = wait if remaining is None else min(wait, remaining)
+                self._cond.wait(remaining)
+            data = bytes(self._ready[:size])
+            del self._ready[:size]
+            return data
+
+    @property
+    def in_waiting(self):
+        """The number of reply bytes which are due."""
+        with self._cond:
+            self._commit(time.perf_counter())
+            return len(self._ready)
+
+    @property
+    def finished(self):
+        """True once every frame in the recording has been sent."""
+        return self._next_step >= len(self._steps)
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._commit(time.perf_counter())
+            del self._ready[:]
+
+    def reset_output_buffer(self):
+        with self._cond:
+            del self._rx_buffer[:]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Wakes blocked readers, and logs how the replay went."""
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+        logger.info("replayed %d of %d frames sent; %d mismatched",
+                    min(self.sent, len(self._steps) - 1),
+                    len(self._steps) - 1, len(self.mismatches))
+
+    def _receive(self, frame, now):
+        index = self.sent
+        self.sent += 1
+        if self.finished:
+            logger.warning("> %s: past the end of the recording", list(frame))
+            self.mismatches.append((index, None, frame))
+            return
+        step = self._steps[self._next_step]
+        self._next_step += 1
+        if frame != step[0]:
+            logger.warning("> %s: expected %s", list(frame), list(step[0]))
+            self.mismatches.append((index, step[0], frame))
+        self._play(step, now)
+
+    def _play(self, step, now):
+        for delay, frame in step[2]:
+            ready = now if self.speedup is None else now + delay / self.speedup
+            heapq.heappush(self._output, (ready, self._seq, frame))
+            self._seq += 1
+
+    def _commit(self, now):
+        while self._output and self._output[0][0] <= now:
+            self._ready += heapq.heappop(self._output)[2]
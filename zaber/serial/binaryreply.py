@@ -11,7 +11,8 @@ Object used to pass commands to Zaber stages.
 
 
 import logging
-import struct
+
+from .binarycodec import FRAME, MESSAGE_LENGTH, pack_frame_into, split_message_id
 
 # See https://docs.python.org/2/howto/logging.html#configuring-logging-
 # for-a-library for info on why we have these two lines here.
@@ -55,24 +56,11 @@ class BinaryReply(object):
             #self.device_number, self.command_number, self.data = struct.unpack("<2Bl", reply)
 
             """ MODIFICATION BECAUSE IT LOOKS LIKE command_number COMES LAST: """
-            self.device_number, self.command_number, self.data = struct.unpack("<2Bl", reply)
+            self.device_number, self.command_number, self.data = FRAME.unpack(reply)
 
             if message_id and len(reply) == 6:
-                self.message_id = reply[5]
-                """
-                ZABER REPLY INTERPRETATION
-                
-                # Use bitmasks to extract the message ID.
-                self.message_id = (self.data & 0xFF000000) >> 24
-                
-                self.data = self.data & 0x00FFFFFF
-
-                # Sign extend 24 to 32 bits in the message ID case.
-                # If the data is more than 24 bits it will still be wrong,
-                # but now negative smaller values will be right.
-                if 0 != (self.data & 0x00800000):
-                    self.data = (int)((self.data | 0xFF000000) - (1 << 32))
-            """
+                # The message ID replaces the top byte of the data.
+                self.data, self.message_id = split_message_id(self.data)
             else:
                 self.message_id = None
 
@@ -97,10 +85,12 @@ class BinaryReply(object):
             A byte string of length 6 formatted according to the Binary
             Protocol Manual.
         """
-        return struct.pack("<2Bl",
-                           self.device_number,
-                           self.command_number,
-                           self.data)
+        if self.message_id is None:
+            return FRAME.pack(self.device_number, self.command_number, self.data)
+        packed = bytearray(MESSAGE_LENGTH)
+        pack_frame_into(packed, 0, self.device_number, self.command_number,
+                        self.data, self.message_id)
+        return bytes(packed)
 
     def __str__(self):
         return "[{:d}, {:d}, {:d}]".format(self.device_number,
@@ -0,0 +1,232 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binaryreplyrouter.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Background reader for BinarySerial. Without it, replies are only read
+while some caller is blocked waiting for a particular device, and
+replies from other devices have to be stashed until someone asks for
+them. The router instead reads the port continuously on its own thread,
+frames the incoming bytes into replies, and hands each reply to whoever
+is waiting for that device (or keeps it until someone asks), so that
+threads waiting on different devices don't hold each other up.
+
+Devices which have message IDs turned on (cf. BinaryDevice.
+enable_message_ids) can have several commands in flight at once; their
+replies are matched back to the command with the same ID, and replies
+which nobody is waiting for (i.e., to commands sent without awaiting a
+reply) are dropped.
+
+Start it with BinarySerial.start_reader(); BinarySerial.read_device and
+BinaryDevice.send use it automatically once it is running.
+"""
+
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from .binarycodec import FrameDecoder
+from .binaryreply import BinaryReply
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_LENGTH = 6
+
+# Replies to commands 40 and 101 are echoes of our own auto-reply
+# toggles (cf. BinaryDevice.enable_auto_reply), not replies anyone is
+# waiting for.
+ECHO_COMMANDS = (40, 101)
+
+
+class BinaryReplyRouter(object):
+    """Reads replies from a serial port on a background thread and routes
+    them to per-device queues of replies and futures.
+
+    Attributes:
+        ser: The serial port being read.
+        poll_interval: How often (seconds) the reader thread checks
+            whether it has been asked to stop.
+    """
+
+    def __init__(self, ser, poll_interval=0.05, message_id_devices=None,
+                 on_error=None, metrics=None, positions=None):
+        """
+        Args:
+            ser: The underlying (PySerial-like) serial port. The router
+                becomes its only reader.
+            poll_interval: Seconds to block in each read on the reader
+                thread.
+            message_id_devices: A set of the numbers of devices whose
+                replies carry message IDs. The router reads it as
+                replies arrive, so it can be updated while running.
+            on_error: If given, called (on the reader thread) with each
+                error reply, whether or not anyone is waiting for it.
+            metrics: If given, a BinaryMetrics to count each reply in.
+            positions: If given, a PositionTracker to note each reply
+                in.
+        """
+        self.ser = ser
+        self.poll_interval = poll_interval
+        self.message_id_devices = (set() if message_id_devices is None
+                                   else message_id_devices)
+        self.on_error = on_error
+        self.metrics = metrics
+        self.positions = positions
+        self._lock = threading.Lock()
+        self._replies = {}          # device number -> deque of replies
+        self._waiters = {}          # device number (or None) -> deque of Futures
+        self._id_waiters = {}       # (device number, message ID) -> Future
+        self._arrivals = 0
+        self._thread = None
+        self._running = False
+        self._decoder = FrameDecoder()
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        """Starts the reader thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name="BinaryReplyRouter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the reader thread and waits for it to finish. Replies
+        which have already been routed are kept.
+        """
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def expect(self, device_number=None, message_id=None):
+        """Returns a Future for the next reply from a device.
+
+        Args:
+            device_number: The number of the device whose reply to wait
+                for, or None for the next reply from any device.
+            message_id: If given, wait for the reply with this message
+                ID instead (the device must have message IDs turned on).
+
+        Notes:
+            A reply which arrived before anyone asked for it is handed
+            to the first caller to ask, so the Future may already be
+            done when it is returned. Call this with a message ID before
+            sending the command, since replies with IDs that nobody is
+            waiting for are dropped.
+
+        Returns:
+            A concurrent.futures.Future whose result is a BinaryReply.
+        """
+        future = Future()
+        if message_id is not None:
+            with self._lock:
+                self._id_waiters[(device_number, message_id)] = future
+            return future
+        with self._lock:
+            reply = self._claim(device_number)
+            if reply is None:
+                self._waiters.setdefault(device_number, deque()).append(future)
+        if reply is not None:
+            future.set_result(reply)
+        return future
+
+    def route(self, reply):
+        """Hands a reply to the first caller waiting for it, or keeps it
+        until one asks.
+        """
+        if self.metrics is not None:
+            self.metrics.received(reply)
+        if self.positions is not None:
+            self.positions.received(reply)
+        if reply.command_number == 255 and self.on_error is not None:
+            self.on_error(reply)
+        if reply.message_id is not None:
+            with self._lock:
+                future = self._id_waiters.pop(
+                    (reply.device_number, reply.message_id), None)
+            if future is not None:
+                logger.debug("< %s id=%d", reply, reply.message_id)
+                if not future.cancelled():
+                    future.set_result(reply)
+                return
+            if reply.command_number == 255:
+                logger.warning("< unclaimed error reply %s id=%d",
+                               reply, reply.message_id)
+            else:
+                logger.debug("< (dropped) %s id=%d", reply, reply.message_id)
+            return
+
+        if reply.command_number in ECHO_COMMANDS:
+            logger.debug("< (echo) %s", reply)
+            return
+        logger.debug("< %s", reply)
+        future = None
+        with self._lock:
+            for key in (reply.device_number, None):
+                waiters = self._waiters.get(key)
+                if waiters:
+                    future = waiters.popleft()
+                    break
+            if future is not None and future.cancelled():
+                # whoever was waiting for this reply gave up (timed out);
+                #   it's still theirs, so don't hand it to the next caller
+                logger.debug("< (abandoned) %s", reply)
+                return
+            if future is None:
+                self._arrivals += 1
+                self._replies.setdefault(reply.device_number, deque()).append(
+                    (self._arrivals, reply))
+        if future is not None:
+            future.set_result(reply)
+
+    def _claim(self, device_number):
+        if device_number is not None:
+            replies = self._replies.get(device_number)
+            return replies.popleft()[1] if replies else None
+        oldest = None
+        for replies in self._replies.values():
+            if replies and (oldest is None or replies[0][0] < oldest[0][0]):
+                oldest = replies
+        return oldest.popleft()[1] if oldest else None
+
+    def _run(self):
+        try:
+            while self._running:
+                self._read_frames()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.debug("reader stopped: %s", e)
+            self._running = False
+            self._fail(e)
+
+    def _read_frames(self):
+        # Block (up to the poll interval) for the rest of a frame, but
+        #   take everything that has already arrived, and decode all of
+        #   it at once.
+        size = MESSAGE_LENGTH - self._decoder.pending
+        waiting = self.ser.in_waiting
+        data = self.ser.read(max(size, waiting))
+        if not data:
+            return
+        for frame in self._decoder.decode(data, self.message_id_devices):
+            self.route(BinaryReply(list(frame)))
+
+    def _fail(self, exception):
+        with self._lock:
+            waiters = [future for queue in self._waiters.values() for future in queue]
+            waiters.extend(self._id_waiters.values())
+            self._waiters = {}
+            self._id_waiters = {}
+        for future in waiters:
+            if not future.cancelled():
+                future.set_exception(exception)
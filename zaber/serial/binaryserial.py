@@ -24,10 +24,21 @@ e.g., x_axis.move_abs({20mm}, await_reply = False).
 
 import logging
 import sys
+import threading
+import time
 import serial
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait as wait_for_futures
 
+from .binarycodec import FrameEncoder
 from .binarycommand import BinaryCommand
+from .binarymetrics import BinaryMetrics
+from .binarypositions import PositionTracker
+from .binaryrecorder import BinaryRecorder, RecordingSerial
 from .binaryreply import BinaryReply
+from .binaryreplyrouter import BinaryReplyRouter
 from .timeouterror import TimeoutError
 from .portlock import PortLock
 
@@ -38,6 +49,12 @@ logger.addHandler(logging.NullHandler())
 
 MESSAGE_LENGTH = 6
 
+# Lets serial_for_url open "zabersim://" URLs with the simulator in
+# protocol_zabersim.py (and "zaberreplay://" URLs with protocol_
+# zaberreplay.py).
+if __package__ not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append(__package__)
+
 
 class BinarySerial(object):
     """A class for interacting with Zaber devices using the Binary protocol.
@@ -55,6 +72,11 @@ class BinarySerial(object):
             specify an infinite timeout. A value of 0 specifies that all reads
             and writes should be non-blocking (return immediately without
             waiting). Defaults to 5.
+        metrics: A BinaryMetrics counting the traffic on this port (cf.
+            binarymetrics.py).
+        positions: A PositionTracker which knows where the devices on
+            this port are, from the traffic on it (cf. binarypositions.
+            py), so that they needn't be asked before every move.
         lock: The threading.RLock guarding the port. Each method takes the lock
             and is therefore thread safe. However, to ensure no other threads
             access the port across multiple method calls, the caller should
@@ -65,8 +87,11 @@ class BinarySerial(object):
         """Creates a new instance of the BinarySerial class.
 
         Args:
-            port: A string containing the name of the serial port to
-                which to connect.
+            port: A string containing the name or URL of the serial
+                port to which to connect, e.g., "COM3", or "zabersim://"
+                for a simulated chain of devices (cf. binarysimulator.py),
+                or "zaberreplay://<path>" to play back a recording (cf.
+                start_recording and binaryreplay.py).
             baud: An integer representing the baud rate at which to
                 communicate over the serial port.
             timeout: A number representing the number of seconds to wait
@@ -100,8 +125,32 @@ class BinarySerial(object):
                                       interCharTimeout=inter_char_timeout)
 
         self._lock = PortLock()
-        
-        self.outstanding_replies = [None] * 3
+        self._router = None
+        self._reply_timeout = timeout
+
+        # Replies read while waiting for a different device, by device
+        #   number; they are returned by later calls to read_device.
+        self.outstanding_replies = {}
+
+        # Numbers of devices whose replies carry message IDs.
+        self.message_id_devices = set()
+
+        # Bytes written during a transaction (cf. transaction), and the
+        #   thread which opened it.
+        self._batch = None
+        self._batch_owner = None
+
+        self._encoder = FrameEncoder()
+
+        # Bumped when the port is closed/reopened, and per device on an
+        #   error reply; cf. settings_epoch.
+        self._generation = 0
+        self._errors = {}
+
+        self.metrics = BinaryMetrics()
+        self.positions = PositionTracker(self.message_id_devices)
+
+        self._recorder = None
 
     def write(self, *args):
         r"""Writes a command to the port.
@@ -137,6 +186,106 @@ class BinarySerial(object):
                 to the specification of ``*args`` above.
             ValueError: A string of length other than 6 was passed.
         """
+        self._write_bytes(self._encode(*args))
+
+    def write_many(self, commands):
+        """Writes several commands to the port in a single write.
+
+        Args:
+            commands: An iterable of BinaryCommands (or of anything else
+                write() accepts as a single argument).
+
+        Notes:
+            The commands are encoded into one buffer and handed to the
+            serial port at once, so that, e.g., commands to the x and y
+            stages leave the computer together rather than in separate
+            USB transfers.
+        """
+        self._write_bytes(b"".join(self._encode(command) for command in commands))
+
+    def write_frames(self, frames):
+        """Writes several frames to the port in a single write, without
+        creating a BinaryCommand for each.
+
+        Args:
+            frames: A sequence of (device number, command number, data)
+                tuples, or (..., message ID) to give a frame an ID.
+
+        Notes:
+            The frames are packed into a buffer kept by the port (cf.
+            binarycodec.py). Frames to devices with message IDs turned
+            on, given without an ID, are sent with an ID nobody waits
+            for, so their replies are dropped; i.e., these are fire-and-
+            forget, like BinaryDevice.send with await_reply = None.
+        """
+        with self._locked_for_write():
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for frame in frames:
+                if debug:
+                    logger.debug("> %s", list(frame))
+                self.metrics.sent(frame[0], frame[1])
+                self.positions.sent(frame[0], frame[1], frame[2])
+            self._write_bytes(self._encoder.encode(frames,
+                                                   self.message_id_devices))
+
+    def write_encoded(self, data):
+        """Writes frames which are already packed as they go on the wire
+        (e.g., precomputed for BinaryDispatcher), in a single write.
+
+        Args:
+            data: A bytes-like object whose length is a multiple of 6.
+
+        Notes:
+            As for write_frames, frames to devices with message IDs
+            turned on should carry an ID nobody waits for (cf.
+            binarycodec.UNCLAIMED_MESSAGE_ID).
+        """
+        data = memoryview(data).cast("B")
+        if len(data) % MESSAGE_LENGTH:
+            raise ValueError("write_encoded expects whole 6-byte frames.")
+        with self._locked_for_write():
+            debug = logger.isEnabledFor(logging.DEBUG)
+            for offset in range(0, len(data), MESSAGE_LENGTH):
+                if debug:
+                    logger.debug("> %s", list(data[offset:offset + MESSAGE_LENGTH]))
+                self.metrics.sent(data[offset], data[offset + 1])
+            self.positions.sent_encoded(data)
+            self._write_bytes(data)
+
+    @contextmanager
+    def transaction(self):
+        """Context manager which collects everything written to the port
+        (e.g., by BinaryDevice.send) and writes it all at once on exit,
+        as write_many does.
+
+        Notes:
+            Other threads can't write to the port until the transaction
+            ends. Nothing has been sent until then, so don't wait for a
+            reply inside one: use BinaryDevice.submit, and wait for the
+            replies after the with block, e.g.,
+
+                with port.transaction():
+                    x.move_abs(1000)
+                    reply = y.submit(20, 2000)
+                port.wait_for_reply(reply)
+
+            Transactions can be nested; the outermost one does the write.
+        """
+        with self._locked_for_write():
+            if self._batch is not None:
+                yield
+                return
+            self._batch = bytearray()
+            self._batch_owner = threading.current_thread()
+            try:
+                yield
+            finally:
+                data, self._batch = self._batch, None
+                self._batch_owner = None
+                if data:
+                    self._ser.write(bytes(data))
+
+    def _encode(self, *args):
         if len(args) == 1:
             message = args[0]
             if isinstance(message, list):
@@ -157,17 +306,39 @@ class BinarySerial(object):
                 data = bytes(message, "UTF-8")
             else:
                 data = bytes(message)
+            self.metrics.sent(data[0], data[1])
+            self.positions.sent_encoded(data)
+            return data
 
-        elif isinstance(message, BinaryCommand):
-            data = message.encode()
+        if isinstance(message, BinaryCommand):
             logger.debug("> %s", message)
+            self.metrics.sent(message.device_number, message.command_number)
+            self.positions.sent(message.device_number, message.command_number,
+                                message.data)
+            return message.encode()
+
+        raise TypeError("write must be passed several integers, or a "
+                        "string, list, or BinaryCommand.")
+
+    def _write_bytes(self, data):
+        with self._locked_for_write():
+            if self._batch is not None:
+                self._batch += data
+            else:
+                self._ser.write(data)
 
-        else:
-            raise TypeError("write must be passed several integers, or a "
-                            "string, list, or BinaryCommand.")
-
+    @contextmanager
+    def _locked_for_write(self):
+        # the write lock, timing how long it takes to get
+        start = time.perf_counter()
         with self._lock.write_lock:
-            self._ser.write(data)
+            self.metrics.lock_wait(time.perf_counter() - start)
+            yield
+
+    def _check_not_batching(self):
+        if self._batch_owner is threading.current_thread():
+            raise RuntimeError("can't wait for a reply inside a transaction "
+                               "(nothing has been sent yet).")
 
     def read(self, message_id=False):
         """Reads six bytes from the port and returns a BinaryReply.
@@ -184,14 +355,26 @@ class BinarySerial(object):
             zaber.serial.TimeoutError: No data was read before the
                 specified timeout elapsed.
         """
+        self._check_not_batching()
+        if self._router is not None:
+            try:
+                return self._router.expect().result(self._reply_timeout)
+            except FutureTimeoutError:
+                logger.debug("< Receive timeout!")
+                self.metrics.timeout(0)
+                raise TimeoutError("read timed out.")
+
         with self._lock.read_lock:
             reply = self._ser.read(MESSAGE_LENGTH)
 
         if len(reply) != MESSAGE_LENGTH:
             logger.debug("< Receive timeout!")
+            self.metrics.timeout(0)
             raise TimeoutError("read timed out.")
         parsed_reply = BinaryReply(reply, message_id)
         logger.debug("< %s", parsed_reply)
+        self.metrics.received(parsed_reply)
+        self.positions.received(parsed_reply)
         return parsed_reply
 
 
@@ -201,6 +384,13 @@ class BinarySerial(object):
         Args:
             device_number: The number of the device we're reading from.
 
+        Notes:
+            Replies from other devices which are read in the meantime
+            are kept (in order) and returned by later calls for those
+            devices. If the reader thread is running (cf. start_reader),
+            this waits for it to route a reply from this device instead
+            of reading the port itself.
+
         Returns:
             A BinaryReply containing all of the information read from
             the serial port.
@@ -209,43 +399,216 @@ class BinarySerial(object):
             zaber.serial.TimeoutError: No data was read before the
                 specified timeout elapsed.
         """
-        
-        device_reply_outstanding = self.outstanding_replies[device_number - 1]
-        if device_reply_outstanding is not None:
-            self.outstanding_replies[device_number - 1] = None
-            return device_reply_outstanding
+        self._check_not_batching()
+        if self._router is not None:
+            return self.wait_for_reply(self._router.expect(device_number))
+
+        outstanding = self.outstanding_replies.get(device_number)
+        if outstanding:
+            return self._check_error(outstanding.popleft())
 
         with self._lock.read_lock:
             reply = self._ser.read(MESSAGE_LENGTH)
 
         if len(reply) != MESSAGE_LENGTH:
             logger.debug("< Receive timeout!")
+            self.metrics.timeout(device_number)
             raise TimeoutError("read timed out.")
         parsed_reply = BinaryReply(reply, message_id)
         logger.debug("< %s", parsed_reply)
+        self.metrics.received(parsed_reply)
+        self.positions.received(parsed_reply)
         
 
         # cmd-s 40 and 101 respond after setting device auto_reply...  it's important not to interpret replies for cmd-s 40 or 101 as substance
         while (parsed_reply.command_number == 40) or (parsed_reply.command_number == 101) or (parsed_reply.device_number != device_number):
 
-            if parsed_reply.device_number != device_number:
-                self.outstanding_replies[parsed_reply.device_number - 1] = parsed_reply
+            if (parsed_reply.device_number != device_number and
+                    parsed_reply.command_number not in (40, 101)):
+                self.outstanding_replies.setdefault(
+                    parsed_reply.device_number, deque()).append(parsed_reply)
             
             with self._lock.read_lock:
                 reply = self._ser.read(MESSAGE_LENGTH)
 
             if len(reply) != MESSAGE_LENGTH:
                 logger.debug("< Receive timeout!")
+                self.metrics.timeout(device_number)
                 raise TimeoutError("read timed out.")
             parsed_reply = BinaryReply(reply)
             logger.debug("< %s", parsed_reply)
+            self.metrics.received(parsed_reply)
+            self.positions.received(parsed_reply)
+
+        return self._check_error(parsed_reply)
+
+    def expect_reply(self, device_number=None, message_id=None):
+        """Returns a Future for the next reply from a device, as routed
+        by the reader thread.
+
+        Args:
+            device_number: The number of the device whose reply to wait
+                for, or None for the next reply from any device.
+            message_id: If given, the Future is for the reply with this
+                message ID (cf. BinaryDevice.enable_message_ids).
 
-        if parsed_reply.command_number is 255:
+        Notes:
+            To be sure that a reply is not mistaken for someone else's,
+            call this before writing the command it answers.
+
+        Raises:
+            RuntimeError: The reader thread is not running.
+
+        Returns:
+            A concurrent.futures.Future whose result is a BinaryReply;
+            pass it to wait_for_reply.
+        """
+        if self._router is None:
+            raise RuntimeError("expect_reply requires the reader thread "
+                               "(call start_reader first).")
+        return self._router.expect(device_number, message_id)
+
+    def wait_for_reply(self, future):
+        """Waits (up to this port's timeout) for a Future returned by
+        expect_reply and returns its reply.
+
+        Raises:
+            zaber.serial.TimeoutError: No reply arrived before the
+                specified timeout elapsed.
+            RuntimeError: Called inside a transaction (cf. transaction).
+        """
+        self._check_not_batching()
+        try:
+            reply = future.result(self._reply_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.debug("< Receive timeout!")
+            raise TimeoutError("read timed out.")
+        return self._check_error(reply)
+
+    def wait_for_replies(self, futures):
+        """Waits for several Futures returned by expect_reply at once
+        (up to this port's timeout in all, not each) and returns their
+        replies, in the same order.
+
+        Notes:
+            Every reply is waited for before any error reply is raised,
+            so that none is left for the next caller.
+
+        Raises:
+            zaber.serial.TimeoutError: Not every reply arrived before
+                the specified timeout elapsed.
+            RuntimeError: Called inside a transaction (cf. transaction).
+        """
+        self._check_not_batching()
+        futures = list(futures)
+        _, not_done = wait_for_futures(futures, self._reply_timeout)
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            logger.debug("< Receive timeout (%d of %d replies)!",
+                         len(not_done), len(futures))
+            raise TimeoutError("read timed out.")
+        return [self._check_error(future.result()) for future in futures]
+
+    def start_reader(self, poll_interval=0.05):
+        """Starts a background thread which reads every reply from the
+        port and routes it to whoever is waiting for that device
+        (cf. binaryreplyrouter.py).
+
+        Args:
+            poll_interval: Seconds the reader thread blocks in each
+                read; it only affects how quickly stop_reader returns.
+
+        Notes:
+            While the reader is running it is the only thing reading
+            the port: read() returns the next reply from any device,
+            and read_device() and BinaryDevice.send() wait on the
+            reader rather than reading the port themselves.
+        """
+        with self._lock:
+            if self._router is not None:
+                return
+            self._reply_timeout = self._ser.timeout
+            self._ser.timeout = poll_interval
+            self._router = BinaryReplyRouter(self._ser, poll_interval,
+                                             self.message_id_devices,
+                                             self._note_error, self.metrics,
+                                             self.positions)
+            for replies in self.outstanding_replies.values():
+                for reply in replies:
+                    self._router.route(reply)
+            self.outstanding_replies = {}
+            self._router.start()
+
+    def stop_reader(self):
+        """Stops the background reader thread, if it is running."""
+        with self._lock:
+            router, self._router = self._router, None
+            if router is None:
+                return
+            router.stop()
+            self._ser.timeout = self._reply_timeout
+
+    def start_recording(self, path):
+        """Starts recording every frame written to and read from the
+        port, with timestamps, to a file (cf. binaryrecorder.py). The
+        recording can be played back with "zaberreplay://<path>".
+
+        Args:
+            path: The file to record to; it is overwritten.
+        """
+        with self._lock:
+            self.stop_recording()
+            self._recorder = BinaryRecorder(path)
+            self._set_ser(RecordingSerial(self._ser, self._recorder))
+
+    def stop_recording(self):
+        """Stops recording (cf. start_recording), if recording."""
+        with self._lock:
+            if self._recorder is None:
+                return
+            self._set_ser(self._ser.ser)
+            self._recorder.close()
+            self._recorder = None
+
+    def _set_ser(self, ser):
+        # (a read already underway on the reader thread finishes on the
+        #   old one, so start/stop recording while the port is quiet)
+        self._ser = ser
+        if self._router is not None:
+            self._router.ser = ser
+
+    @property
+    def recording(self):
+        """True if the port is being recorded (cf. start_recording)."""
+        return self._recorder is not None
+
+    @property
+    def reader_running(self):
+        """True if the background reader thread is running."""
+        return self._router is not None
+
+    def settings_epoch(self, device_number):
+        """Returns a value which changes whenever settings remembered
+        for a device may have become stale (cf. BinaryDevice.settings):
+        when the port is closed or reopened, or the device replies with
+        an error.
+        """
+        return (self._generation, self._errors.get(device_number, 0))
+
+    def _note_error(self, reply):
+        self._errors[reply.device_number] = \
+            self._errors.get(reply.device_number, 0) + 1
+
+    def _check_error(self, reply):
+        if reply.command_number == 255:
+            if self._router is None:
+                self._note_error(reply)
             print("(S): ERROR")
-            print(parsed_reply)
+            print(reply)
             sys.exit(0)
-        
-        return parsed_reply
+        return reply
 
     def flush(self):
         """Flushes the buffers of the underlying serial port."""
@@ -270,11 +633,19 @@ class BinarySerial(object):
     def open(self):
         """Opens the serial port."""
         with self._lock:
+            self._generation += 1
+            self.positions.invalidate()
             self._ser.open()
 
     def close(self):
-        """Closes the serial port."""
+        """Closes the serial port (stopping the reader thread, and any
+        recording, first).
+        """
+        self.stop_reader()
+        self.stop_recording()
         with self._lock:
+            self._generation += 1
+            self.positions.invalidate()
             self._ser.close()
 
     def __enter__(self):
@@ -295,12 +666,16 @@ class BinarySerial(object):
         fractional wait times.
         """
         with self._lock:
+            if self._router is not None:
+                return self._reply_timeout
             return self._ser.timeout
 
     @timeout.setter
     def timeout(self, value):
         with self._lock:
-            self._ser.timeout = value
+            self._reply_timeout = value
+            if self._router is None:
+                self._ser.timeout = value
 
     @property
     def baudrate(self):
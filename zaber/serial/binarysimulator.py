@@ -0,0 +1,655 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	binarysimulator.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+Simulated daisy-chain of Zaber devices that speaks the 6-byte Binary
+protocol, so that BinarySerial (and everything in execute_commands.py
+that sits on top of it) can be exercised without the stages attached.
+
+Each simulated device keeps a kinematic model of its position (target
+speed, acceleration, min/max position, velocity moves and stops), and
+the chain as a whole models the time it takes a frame to cross the wire
+at the configured baud rate. The default chain matches our setup: one
+X-RSW60A rotary stage (device 1) and two T-LSM050A linear stages
+(devices 2 and 3).
+
+The simulator can be opened in three ways:
+    - directly, as a file-like object with read/write/in_waiting (this
+      is what the pyserial URL handler wraps);
+    - through BinarySerial("zabersim://"), using the URL handler in
+      protocol_zabersim.py (add "?speedup=10" to run 10x faster than
+      real time);
+    - through a pseudo-terminal (BinarySimulator().serve_pty() returns
+      a device path that any serial program can open; not on Windows).
+
+Replies follow the behaviour documented in binaryserial.py and
+binarydevice.py: moves reply when they complete, move_vel replies
+immediately, a second move sent while a device is still busy replies
+with an error (cmd 255, data 255), and setting bit 0 of the device mode
+(cmd 40; cmd 101 on the rotary stage) silences every reply except those
+to "return" commands and errors. Setting bit 6 of the device mode (or
+cmd 102) turns on message IDs: the last byte of each command is taken
+as its ID and copied into its reply.
+"""
+
+
+import heapq
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+# See https://docs.python.org/2/howto/logging.html#configuring-logging-
+# for-a-library for info on why we have these two lines here.
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+MESSAGE_LENGTH = 6
+
+# Bits on the wire per byte: start bit, 8 data bits, stop bit.
+BITS_PER_BYTE = 10
+
+# Unit conversions from the Binary Protocol Manual: microsteps/s per
+# unit of speed data, and microsteps/s^2 per unit of acceleration data.
+# These are approximate; override them per device to calibrate.
+T_LSM050A = {
+    "speed_unit": 9.375,
+    "accel_unit": 11250.0,
+    "max_position": 1049869,        # 50 mm of travel
+    "target_speed": 2240,           # ~1 mm/s
+    "home_speed": 2240,
+    "acceleration": 2000,
+}
+X_RSW60A = {
+    "speed_unit": 1 / 1.6384,
+    "accel_unit": 10000 / 1.6384,
+    "max_position": 1536000,        # 360 deg
+    "target_speed": 6990,           # ~1 deg/s
+    "home_speed": 6990,
+    "acceleration": 40,
+}
+
+# Commands which still reply when auto-reply is disabled.
+RETURN_COMMANDS = range(50, 64)
+
+# Commands that start a move which must finish before the next one.
+MOVE_COMMANDS = (1, 20, 21)
+
+# Error codes, sent back as [device, 255, code].
+ERROR_BUSY = 255
+ERROR_COMMAND_INVALID = 64
+ERROR_SETTING_INVALID = 53
+
+# Settings which can be read back with "return setting" (cmd 53).
+SETTING_COMMANDS = (37, 40, 41, 42, 43, 44, 101, 102, 106, 116)
+
+
+class SimulatedBinaryDevice(object):
+    """A kinematic model of a single Zaber device in the Binary protocol.
+
+    Positions are in microsteps ("data"); all times are in seconds of
+    simulated time.
+
+    Attributes:
+        number: The device number of this device. 1-254.
+        settings: A dict from setting (command) number to the value
+            most recently set for it.
+        speed_unit: Microsteps/s per unit of speed data.
+        accel_unit: Microsteps/s^2 per unit of acceleration data.
+    """
+
+    def __init__(self, number, speed_unit=9.375, accel_unit=11250.0,
+                 max_position=1049869, min_position=0, target_speed=2240,
+                 home_speed=2240, acceleration=2000, position=0,
+                 device_id=0):
+        """
+        Args:
+            number: An integer between 1 and 254 which is the number of
+                this device in the chain.
+            speed_unit: Microsteps/s per unit of speed data.
+            accel_unit: Microsteps/s^2 per unit of acceleration data.
+            max_position: Initial maximum position (cmd 44), data.
+            min_position: Initial minimum position (cmd 106), data.
+            target_speed: Initial target speed (cmd 42), data.
+            home_speed: Initial home speed (cmd 41), data.
+            acceleration: Initial acceleration (cmd 43), data.
+            position: Initial position, data.
+            device_id: Value returned by "return device ID" (cmd 50).
+
+        Raises:
+            ValueError: The device number was invalid.
+        """
+        if number > 254 or number < 1:
+            raise ValueError("Device number must be 1-254.")
+        self.number = number
+        self.speed_unit = speed_unit
+        self.accel_unit = accel_unit
+        self.device_id = device_id
+        self.settings = {
+            37: 0,                  # peripheral ID
+            40: 0,                  # device mode
+            41: home_speed,
+            42: target_speed,
+            43: acceleration,
+            44: max_position,
+            101: 0,                 # auto-reply disabled mode
+            102: 0,                 # message ID mode
+            106: min_position,
+            116: 0,                 # manual move tracking
+        }
+
+        # Motion plan: list of (t0, duration, x0, v0, a) segments, in
+        # microsteps and seconds. The last segment may last forever.
+        self._plan = [(0.0, math.inf, float(position), 0.0, 0.0)]
+        self._busy_until = 0.0
+        self._busy_command = 0
+        self.completion_token = 0
+
+    @property
+    def auto_reply_disabled(self):
+        return bool(self.settings[40] & 1) or bool(self.settings[101])
+
+    @property
+    def message_ids_enabled(self):
+        return bool(self.settings[40] & 64) or bool(self.settings[102])
+
+    @property
+    def acceleration(self):
+        """Acceleration in microsteps/s^2 (infinite if the setting is 0)."""
+        accel = self.settings[43] * self.accel_unit
+        return accel if accel > 0 else math.inf
+
+    def state_at(self, t):
+        """Returns (position, velocity) in microsteps and microsteps/s
+        at simulated time t.
+        """
+        for t0, duration, x0, v0, a in self._plan:
+            dt = t - t0
+            if dt <= duration:
+                dt = max(dt, 0.0)
+                return x0 + v0 * dt + 0.5 * a * dt * dt, v0 + a * dt
+        t0, duration, x0, v0, a = self._plan[-1]
+        return (x0 + v0 * duration + 0.5 * a * duration * duration,
+                v0 + a * duration)
+
+    def position_at(self, t):
+        return int(round(self.state_at(t)[0]))
+
+    def is_busy(self, t):
+        return t < self._busy_until
+
+    def status_at(self, t):
+        """Returns the Binary status code (cmd 54) at time t."""
+        if self.is_busy(t):
+            return self._busy_command
+        if self.state_at(t)[1] != 0:
+            return 22
+        return 0
+
+    def execute(self, command_number, data, t):
+        """Applies a command which finished arriving at time t.
+
+        Returns:
+            A list of (ready_time, command_number, data, token) replies,
+            where token is None for replies that are always sent and the
+            device's completion token for replies that a later command
+            may cancel (e.g., a move interrupted by stop).
+        """
+        busy = self.is_busy(t)
+
+        if command_number in MOVE_COMMANDS or command_number == 22:
+            if busy:
+                return self._error(t, ERROR_BUSY)
+
+        if command_number == 1:
+            end = self._plan_move(t, 0, self.settings[41])
+            return self._start(t, end, 1, 0)
+
+        if command_number in (20, 21):
+            target = data
+            if command_number == 21:
+                target = self.position_at(t) + data
+            if not self.settings[106] <= target <= self.settings[44]:
+                return self._error(t, command_number)
+            end = self._plan_move(t, target, self.settings[42])
+            return self._start(t, end, command_number, target)
+
+        if command_number == 22:
+            self._plan_velocity(t, data * self.speed_unit)
+            self._cancel(t)
+            return self._reply(t, 22, data)
+
+        if command_number == 23:
+            end = self._plan_stop(t)
+            self._cancel(t)
+            self._busy_until = end
+            self._busy_command = 23
+            return [(end, 23, None, self.completion_token)]
+
+        if command_number in (40, 101):
+            if busy:
+                return self._error(t, ERROR_BUSY)
+            self.settings[command_number] = data
+            return self._reply(t, command_number, data)
+
+        if command_number == 45:
+            self._plan = [(t, math.inf, float(data), 0.0, 0.0)]
+            return self._reply(t, 45, data)
+
+        if command_number in SETTING_COMMANDS:
+            if command_number == 42 and data < 0:
+                return self._error(t, 42)
+            self.settings[command_number] = data
+            return self._reply(t, command_number, data)
+
+        if command_number == 50:
+            return self._reply(t, 50, self.device_id)
+
+        if command_number == 53:
+            if data == 60:
+                return self._reply(t, 60, self.position_at(t))
+            if data not in self.settings:
+                return self._error(t, ERROR_SETTING_INVALID)
+            return self._reply(t, data, self.settings[data])
+
+        if command_number == 54:
+            return self._reply(t, 54, self.status_at(t))
+
+        if command_number == 55:
+            return self._reply(t, 55, data)
+
+        if command_number == 60:
+            return self._reply(t, 60, self.position_at(t))
+
+        return self._error(t, ERROR_COMMAND_INVALID)
+
+    def _reply(self, t, command_number, data):
+        if self.auto_reply_disabled and command_number not in RETURN_COMMANDS:
+            return []
+        return [(t, command_number, data, None)]
+
+    def _error(self, t, code):
+        return [(t, 255, code, None)]
+
+    def _start(self, t, end, command_number, data):
+        self._cancel(t)
+        self._busy_until = end
+        self._busy_command = command_number
+        return [(end, command_number, data, self.completion_token)]
+
+    def _cancel(self, t):
+        """Cancels the completion reply of any move in progress."""
+        self.completion_token += 1
+        self._busy_until = min(self._busy_until, t)
+
+    def _plan_stop(self, t):
+        """Replaces the plan with a deceleration to rest; returns the
+        time at which the device comes to rest.
+        """
+        x, v = self.state_at(t)
+        plan = [(t, 0.0, x, 0.0, 0.0)]
+        accel = self.acceleration
+        if v != 0 and accel != math.inf:
+            duration = abs(v) / accel
+            plan = [(t, duration, x, v, -math.copysign(accel, v))]
+            x += 0.5 * v * duration
+            t += duration
+        plan.append((t, math.inf, x, 0.0, 0.0))
+        self._plan = plan
+        return t
+
+    def _plan_move(self, t, target, speed_data):
+        """Brakes to rest, then plans a trapezoidal (or triangular) move
+        to target; returns the time at which the move completes.
+        """
+        t = self._plan_stop(t)
+        plan = self._plan[:-1]
+        x = self._plan[-1][2]
+        dist = target - x
+        vmax = abs(speed_data) * self.speed_unit
+        accel = self.acceleration
+        if dist != 0 and vmax > 0:
+            direction = math.copysign(1, dist)
+            dist = abs(dist)
+            if accel == math.inf:
+                t_ramp, v_peak = 0.0, vmax
+            else:
+                v_peak = min(vmax, math.sqrt(dist * accel))
+                t_ramp = v_peak / accel
+            d_ramp = 0.5 * v_peak * t_ramp
+            t_cruise = (dist - 2 * d_ramp) / v_peak
+            a = 0.0 if accel == math.inf else direction * accel
+            v = direction * v_peak
+            plan.append((t, t_ramp, x, 0.0, a))
+            plan.append((t + t_ramp, t_cruise, x + direction * d_ramp, v, 0.0))
+            plan.append((t + t_ramp + t_cruise, t_ramp,
+                         target - direction * d_ramp, v, -a))
+            t += 2 * t_ramp + t_cruise
+        plan.append((t, math.inf, float(target), 0.0, 0.0))
+        self._plan = plan
+        return t
+
+    def _plan_velocity(self, t, v):
+        """Ramps to velocity v (microsteps/s), then holds it until the
+        device reaches its minimum or maximum position.
+        """
+        x, v0 = self.state_at(t)
+        accel = self.acceleration
+        plan = []
+        if v != v0 and accel != math.inf:
+            duration = abs(v - v0) / accel
+            a = math.copysign(accel, v - v0)
+            plan.append((t, duration, x, v0, a))
+            x += v0 * duration + 0.5 * a * duration * duration
+            t += duration
+        plan.append((t, math.inf, x, v, 0.0))
+        self._plan = self._clip(plan)
+
+    def _clip(self, plan):
+        """Truncates a plan where it leaves [min position, max position],
+        holding the device at that limit.
+        """
+        low, high = self.settings[106], self.settings[44]
+        clipped = []
+        for t0, duration, x0, v0, a in plan:
+            crossing = None
+            for limit, outward in ((low, -1), (high, 1)):
+                # Solve x0 + v0*dt + a*dt^2/2 = limit for the first dt
+                #   at which the device is heading out of range.
+                roots = _solve_quadratic(0.5 * a, v0, x0 - limit)
+                for dt in roots:
+                    heading = (v0 + a * dt) or a
+                    if (0 <= dt <= duration and heading * outward > 0 and
+                            (crossing is None or dt < crossing[0])):
+                        crossing = (dt, limit)
+            if crossing is None:
+                clipped.append((t0, duration, x0, v0, a))
+                continue
+            dt, limit = crossing
+            clipped.append((t0, dt, x0, v0, a))
+            clipped.append((t0 + dt, math.inf, float(limit), 0.0, 0.0))
+            return clipped
+        return clipped
+
+
+def _solve_quadratic(a, b, c):
+    """Returns the real roots of a*x^2 + b*x + c = 0, smallest first."""
+    if a == 0:
+        if b == 0:
+            return []
+        return [-c / b]
+    disc = b * b - 4 * a * c
+    if disc < 0:
+        return []
+    root = math.sqrt(disc)
+    return sorted(((-b - root) / (2 * a), (-b + root) / (2 * a)))
+
+
+class BinarySimulator(object):
+    """A simulated daisy-chain of Binary devices, with the read/write
+    interface of a serial port. It is safe to use in multi-threaded
+    environments.
+
+    Attributes:
+        devices: A dict from device number to SimulatedBinaryDevice.
+        baudrate: The simulated baud rate, which sets how long each
+            6-byte frame takes to cross the wire.
+        speedup: How many times faster than real time the simulation
+            runs. 1 runs in real time.
+        timeout: Default number of (real) seconds that read() waits for
+            data; None waits forever.
+    """
+
+    def __init__(self, devices=None, baudrate=9600, speedup=1.0, timeout=None):
+        """
+        Args:
+            devices: A list of SimulatedBinaryDevices. Defaults to our
+                setup: an X-RSW60A rotary stage as device 1 and two
+                T-LSM050A linear stages as devices 2 and 3.
+            baudrate: An integer representing the simulated baud rate.
+            speedup: A number greater than 0; the simulation runs this
+                many times faster than real time.
+            timeout: Default read timeout, in seconds.
+
+        Raises:
+            ValueError: speedup was not positive.
+        """
+        if speedup <= 0:
+            raise ValueError("speedup must be greater than 0.")
+        if devices is None:
+            devices = [SimulatedBinaryDevice(1, **X_RSW60A),
+                       SimulatedBinaryDevice(2, **T_LSM050A),
+                       SimulatedBinaryDevice(3, **T_LSM050A)]
+        self.devices = dict((device.number, device) for device in devices)
+        self.baudrate = baudrate
+        self.speedup = float(speedup)
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._epoch = time.perf_counter()
+        self._rx_buffer = bytearray()
+        self._rx_free = 0.0             # when the host->device wire is next free
+        self._tx_free = 0.0             # when the device->host wire is next free
+        self._events = []               # heap of pending replies
+        self._event_count = 0
+        self._output = deque()          # [delivery_time, bytes] on the wire
+        self._pty_threads = []
+        self._pty_fds = ()
+        self.is_open = True
+
+    @property
+    def frame_time(self):
+        """Seconds of simulated time it takes one frame to cross the wire."""
+        return MESSAGE_LENGTH * BITS_PER_BYTE / float(self.baudrate)
+
+    def now(self):
+        """The current simulated time, in seconds."""
+        return (time.perf_counter() - self._epoch) * self.speedup
+
+    def write(self, data):
+        """Sends bytes from the host to the chain.
+
+        Returns:
+            The number of bytes written.
+        """
+        data = bytes(data)
+        with self._cond:
+            now = self.now()
+            self._rx_buffer.extend(data)
+            while len(self._rx_buffer) >= MESSAGE_LENGTH:
+                frame = bytes(self._rx_buffer[:MESSAGE_LENGTH])
+                del self._rx_buffer[:MESSAGE_LENGTH]
+                self._rx_free = max(now, self._rx_free) + self.frame_time
+                self._receive(frame, self._rx_free)
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size=1, timeout=-1):
+        """Reads up to size bytes of replies, waiting for them to arrive.
+
+        Args:
+            size: The number of bytes to read.
+            timeout: Seconds (real time) to wait for size bytes; None
+                waits forever and 0 returns immediately. Defaults to
+                this simulator's timeout.
+
+        Returns:
+            A bytes object of at most size bytes; fewer if the timeout
+            elapsed first.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self._cond:
+            while True:
+                now = self.now()
+                self._commit(now)
+                if self._available(now) >= size or not self.is_open:
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                wait = self._next_change(now)
+                if wait is not None:
+                    wait /= self.speedup
+                    remaining = wait if remaining is None else min(wait, remaining)
+                self._cond.wait(remaining)
+            return self._take(size, now)
+
+    @property
+    def in_waiting(self):
+        """The number of reply bytes which have finished arriving."""
+        with self._cond:
+            now = self.now()
+            self._commit(now)
+            return self._available(now)
+
+    def reset_input_buffer(self):
+        """Discards replies which have already arrived."""
+        with self._cond:
+            now = self.now()
+            self._commit(now)
+            while self._output and self._output[0][0] <= now:
+                self._output.popleft()
+
+    def reset_output_buffer(self):
+        """Discards a partially-written frame."""
+        with self._cond:
+            del self._rx_buffer[:]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Stops serving any pseudo-terminal and wakes blocked readers."""
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+        for thread in self._pty_threads:
+            thread.join()
+        for fd in self._pty_fds:
+            os.close(fd)
+        self._pty_threads = []
+        self._pty_fds = ()
+
+    def serve_pty(self):
+        """Serves this simulator on a new pseudo-terminal.
+
+        Returns:
+            The path of the pseudo-terminal's slave device, which can be
+            passed to BinarySerial (or opened by any other program).
+
+        Notes:
+            Not available on Windows.
+        """
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self._pty_fds = (master, slave)
+        self._pty_threads = [
+            threading.Thread(target=self._pump_in, args=(master,), daemon=True),
+            threading.Thread(target=self._pump_out, args=(master,), daemon=True),
+        ]
+        for thread in self._pty_threads:
+            thread.start()
+        return os.ttyname(slave)
+
+    def _pump_in(self, fd):
+        import select
+
+        while self.is_open:
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if ready:
+                self.write(os.read(fd, 1024))
+
+    def _pump_out(self, fd):
+        while self.is_open:
+            data = self.read(MESSAGE_LENGTH, timeout=0.05)
+            if data:
+                os.write(fd, data)
+
+    def _receive(self, frame, t):
+        device_number, command_number, data = struct.unpack("<2Bl", frame)
+        message_id = frame[5]
+        if device_number == 0:
+            targets = list(self.devices.values())
+        elif device_number in self.devices:
+            targets = [self.devices[device_number]]
+        else:
+            logger.debug("~ no device %d for %s", device_number, frame)
+            return
+        for device in targets:
+            device_data = data
+            if device.message_ids_enabled:
+                # The ID replaces the top byte of the data.
+                device_data = data & 0x00FFFFFF
+                if device_data & 0x00800000:
+                    device_data -= 1 << 24
+            for ready, reply_command, reply_data, token in \
+                    device.execute(command_number, device_data, t):
+                self._event_count += 1
+                heapq.heappush(self._events, (ready, self._event_count,
+                                              device.number, reply_command,
+                                              reply_data, token, message_id))
+
+    def _commit(self, now):
+        """Puts every reply which is ready by now onto the wire."""
+        while self._events and self._events[0][0] <= now:
+            ready, _, number, command_number, data, token, message_id = \
+                heapq.heappop(self._events)
+            device = self.devices[number]
+            if token is not None:
+                if token != device.completion_token:
+                    continue            # cancelled by a later command
+                if device.auto_reply_disabled:
+                    continue
+                if data is None:
+                    data = device.position_at(ready)
+            reply = struct.pack("<2Bl", number, command_number, data)
+            if device.message_ids_enabled:
+                reply = reply[:5] + struct.pack("B", message_id)
+            self._tx_free = max(ready, self._tx_free) + self.frame_time
+            self._output.append([self._tx_free, reply])
+
+    def _available(self, now):
+        count = 0
+        for delivery, data in self._output:
+            if delivery > now:
+                break
+            count += len(data)
+        return count
+
+    def _next_change(self, now):
+        """Seconds of simulated time until more data may arrive, or None
+        if nothing is pending.
+        """
+        times = []
+        if self._events:
+            times.append(self._events[0][0])
+        for delivery, data in self._output:
+            if delivery > now:
+                times.append(delivery)
+                break
+        if not times:
+            return None
+        return max(min(times) - now, 0.0)
+
+    def _take(self, size, now):
+        taken = bytearray()
+        while self._output and len(taken) < size and self._output[0][0] <= now:
+            delivery, data = self._output[0]
+            needed = size - len(taken)
+            taken.extend(data[:needed])
+            if needed >= len(data):
+                self._output.popleft()
+            else:
+                self._output[0][1] = data[needed:]
+        return bytes(taken)
@@ -0,0 +1,98 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	protocol_zaberasciisim.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+PySerial URL handler for "zaberasciisim://" URLs, which opens a
+simulated ASCII controller (cf. asciisimulator.py) in place of a real
+serial port. asciiserial.py registers this package with PySerial, so the
+handler can be used anywhere a port name is accepted, e.g.,
+
+    AsciiSerial("zaberasciisim://")                 # real time
+    AsciiSerial("zaberasciisim://?speedup=10")      # 10x faster
+
+Options (all optional):
+    speedup: run the simulation this many times faster than real time.
+"""
+
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException
+
+from .asciisimulator import AsciiSimulator
+
+# (PySerial renamed its own instance of this between versions.)
+PORT_NOT_OPEN = "Attempting to use a port that is not open"
+
+
+class Serial(SerialBase):
+    """Serial port implementation backed by an AsciiSimulator."""
+
+    def open(self):
+        """Creates the simulator. The port is immediately ready."""
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        self.simulator = AsciiSimulator(**self.from_url(self.portstr))
+        self._reconfigure_port()
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.simulator.close()
+            self.is_open = False
+
+    def from_url(self, url):
+        """Extracts simulator options from a URL string."""
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "zaberasciisim":
+            raise SerialException("expected a string in the form "
+                                  "\"zaberasciisim://[?speedup=<n>]\": not "
+                                  "starting with zaberasciisim:// ({!r})".format(parts.scheme))
+        options = {}
+        for option, values in urlparse.parse_qs(parts.query, True).items():
+            if option == "speedup":
+                options["speedup"] = float(values[0])
+            else:
+                raise ValueError("unknown option: {!r}".format(option))
+        return options
+
+    def _reconfigure_port(self):
+        if hasattr(self, "simulator"):
+            self.simulator.baudrate = self._baudrate
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.simulator.in_waiting
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.simulator.read(size, self._timeout)
+
+    def write(self, data):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.simulator.write(data)
+
+    def flush(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        self.simulator.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        self.simulator.reset_output_buffer()
@@ -0,0 +1,107 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	protocol_zaberreplay.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+PySerial URL handler for "zaberreplay://" URLs, which plays back a
+recorded session (cf. binaryreplay.py) in place of a real serial port.
+binaryserial.py registers this package with PySerial, so the handler can
+be used anywhere a port name is accepted, e.g.,
+
+    BinarySerial("zaberreplay://session.zbrl")            # as recorded
+    BinarySerial("zaberreplay:///abs/path.zbrl?fast")     # no waiting
+
+Everything between "zaberreplay://" and "?" is the path of the
+recording (spaces and all).
+
+Options (all optional):
+    speedup: play replies back this many times faster than recorded.
+    fast: play replies back as soon as the frame before them is sent.
+"""
+
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException
+
+from .binaryreplay import BinaryReplay
+
+# (PySerial renamed its own instance of this between versions.)
+PORT_NOT_OPEN = "Attempting to use a port that is not open"
+
+
+class Serial(SerialBase):
+    """Serial port implementation backed by a BinaryReplay."""
+
+    def open(self):
+        """Loads the recording. The port is immediately ready."""
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        path, options = self.from_url(self.portstr)
+        self.replay = BinaryReplay(path, **options)
+        self._reconfigure_port()
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.replay.close()
+            self.is_open = False
+
+    def from_url(self, url):
+        """Extracts the recording's path and replay options from a URL
+        string.
+        """
+        scheme, _, rest = url.partition("://")
+        if scheme != "zaberreplay" or not rest:
+            raise SerialException("expected a string in the form "
+                                  "\"zaberreplay://<path>[?speedup=<n>|?fast]\": "
+                                  "not starting with zaberreplay:// ({!r})".format(scheme))
+        path, _, query = rest.partition("?")
+        options = {}
+        for option, values in urlparse.parse_qs(query, True).items():
+            if option == "speedup":
+                options["speedup"] = float(values[0])
+            elif option == "fast":
+                options["speedup"] = None
+            else:
+                raise ValueError("unknown option: {!r}".format(option))
+        return urlparse.unquote(path), options
+
+    def _reconfigure_port(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.replay.in_waiting
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.replay.read(size, self._timeout)
+
+    def write(self, data):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.replay.write(data)
+
+    def flush(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        self.replay.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        self.replay.reset_output_buffer()
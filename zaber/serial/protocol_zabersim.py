@@ -0,0 +1,98 @@
+"""
+DIRECTORY:	https://github.com/howwallace/howw-stage-controls.git/zaber/serial/
+PROGRAM:	protocol_zabersim.py
+DATE:		17 Oct 2026
+
+DESCRIPTION:
+PySerial URL handler for "zabersim://" URLs, which opens a simulated
+chain of Zaber Binary devices (cf. binarysimulator.py) in place of a
+real serial port. binaryserial.py registers this package with PySerial,
+so the handler can be used anywhere a port name is accepted, e.g.,
+
+    BinarySerial("zabersim://")                 # real time
+    BinarySerial("zabersim://?speedup=10")      # 10x faster
+
+Options (all optional):
+    speedup: run the simulation this many times faster than real time.
+"""
+
+
+try:
+    import urlparse
+except ImportError:
+    import urllib.parse as urlparse
+
+from serial.serialutil import SerialBase, SerialException
+
+from .binarysimulator import BinarySimulator
+
+# (PySerial renamed its own instance of this between versions.)
+PORT_NOT_OPEN = "Attempting to use a port that is not open"
+
+
+class Serial(SerialBase):
+    """Serial port implementation backed by a BinarySimulator."""
+
+    def open(self):
+        """Creates the simulator. The port is immediately ready."""
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        self.simulator = BinarySimulator(**self.from_url(self.portstr))
+        self._reconfigure_port()
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.simulator.close()
+            self.is_open = False
+
+    def from_url(self, url):
+        """Extracts simulator options from a URL string."""
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != "zabersim":
+            raise SerialException("expected a string in the form "
+                                  "\"zabersim://[?speedup=<n>]\": not starting "
+                                  "with zabersim:// ({!r})".format(parts.scheme))
+        options = {}
+        for option, values in urlparse.parse_qs(parts.query, True).items():
+            if option == "speedup":
+                options["speedup"] = float(values[0])
+            else:
+                raise ValueError("unknown option: {!r}".format(option))
+        return options
+
+    def _reconfigure_port(self):
+        if hasattr(self, "simulator"):
+            self.simulator.baudrate = self._baudrate
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.simulator.in_waiting
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.simulator.read(size, self._timeout)
+
+    def write(self, data):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        return self.simulator.write(data)
+
+    def flush(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+
+    def reset_input_buffer(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        self.simulator.reset_input_buffer()
+
+    def reset_output_buffer(self):
+        if not self.is_open:
+            raise SerialException(PORT_NOT_OPEN)
+        self.simulator.reset_output_buffer()